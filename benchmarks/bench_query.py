@@ -0,0 +1,168 @@
+"""
+Benchmarks for building queries: F, Q, S chains and _build_query.
+"""
+from harness import benchmark
+
+from elasticutils import F, Q, S
+from elasticutils.serializers import JSONSerializer, RawJSON
+
+
+class FunkyS(S):
+    def process_filter_funkyfilter(self, key, val, action):
+        return {'funkyfilter': {'field': key, 'value': val}}
+
+
+def build_clauses(number):
+    """Returns a list of number (key, value) filter clauses."""
+    templates = [
+        ('field{0}', 'value'),
+        ('field{0}', None),
+        ('field{0}__in', [1, 2, 3]),
+        ('field{0}__prefix', 'val'),
+        ('field{0}__gte', 10),
+        ('field{0}__range', (1, 10)),
+        ('field{0}__funkyfilter', 'bar'),
+    ]
+    clauses = []
+    for i in range(number):
+        key, val = templates[i % len(templates)]
+        clauses.append((key.format(i), val))
+    return clauses
+
+
+CLAUSES = build_clauses(50)
+CLAUSE_FS = [F(**dict([clause])) for clause in CLAUSES]
+
+
+def build_s():
+    """Returns a typical S with a query, filters, facets and sorting."""
+    return (FunkyS().indexes('products')
+                    .doctypes('product')
+                    .query(title__text='red shoes', should=True)
+                    .query(description__text='red shoes', should=True)
+                    .filter(F(category='shoes') | F(category='boots'))
+                    .filter(~F(discontinued=True))
+                    .filter(price__range=(10, 100))
+                    .filter(tags__in=['sale', 'new'])
+                    .facet('category', 'brand', filtered=True)
+                    .highlight('title', 'description')
+                    .order_by('-popularity', 'price')
+                    .boost(title=4.0, description=2.0)
+                    .demote(0.5, discontinued=True)[20:40])
+
+
+@benchmark('f_and_50')
+def f_and():
+    f = F()
+    for clause_f in CLAUSE_FS:
+        f &= clause_f
+    return f
+
+
+@benchmark('f_mixed_50')
+def f_mixed():
+    f = F()
+    for i, clause_f in enumerate(CLAUSE_FS):
+        if i % 3 == 0:
+            f |= clause_f
+        elif i % 3 == 1:
+            f &= ~clause_f
+        else:
+            f &= clause_f
+    return f
+
+
+@benchmark('f_filters_50', prepare=f_mixed)
+def f_filters(f):
+    return f.filters
+
+
+@benchmark('q_add_50')
+def q_add():
+    q = Q()
+    for i, (key, val) in enumerate(CLAUSES):
+        q += Q(should=bool(i % 2), **{'field{0}__text'.format(i): 'red'})
+    return q
+
+
+@benchmark('s_chain')
+def s_chain():
+    return build_s()
+
+
+@benchmark('s_chain_filters_100')
+def s_chain_filters():
+    s = S()
+    for i in range(100):
+        s = s.filter(**{'field{0}'.format(i): i})
+    return s
+
+
+S_LONG = s_chain_filters()
+
+
+@benchmark('s_clone')
+def s_clone():
+    return S_LONG._clone()
+
+
+@benchmark('compile_query', prepare=build_s)
+def compile_query(s):
+    # This skips the compiled query caches.
+    return s._compile_query()
+
+
+S_WARM = build_s()
+S_WARM._build_query()
+
+
+@benchmark('build_query_warm')
+def build_query_warm():
+    return S_WARM._build_query()
+
+
+@benchmark('build_query_equivalent')
+def build_query_equivalent():
+    # A new but equivalent S hits the process-wide query cache.
+    return build_s()._build_query()
+
+
+def build_optimized_s():
+    return build_s().optimize().bool_filters()
+
+
+@benchmark('compile_query_optimized', prepare=build_optimized_s)
+def compile_query_optimized(s):
+    return s._compile_query()
+
+
+FUNKY_S = FunkyS()
+CLAUSE_AND = f_and()
+
+
+@benchmark('process_filters_clauses_50')
+def process_filters_clauses():
+    return FUNKY_S._process_filters(CLAUSES)
+
+
+@benchmark('process_filters_f_50')
+def process_filters_f():
+    return FUNKY_S._process_filters([CLAUSE_AND])
+
+
+SERIALIZER = JSONSerializer()
+IDS = range(10000)
+IDS_QUERY = S().filter(id__in=IDS).query(title__text='red')._build_query()
+RAW_IDS_QUERY = (S().filter(id__in=RawJSON.from_value(IDS))
+                    .query(title__text='red')
+                    ._build_query())
+
+
+@benchmark('serialize_in_10000')
+def serialize_ids():
+    return SERIALIZER.dumps(IDS_QUERY)
+
+
+@benchmark('serialize_raw_in_10000')
+def serialize_raw_ids():
+    return SERIALIZER.dumps(RAW_IDS_QUERY)
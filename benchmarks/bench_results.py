@@ -0,0 +1,110 @@
+"""
+Benchmarks for handling responses: to_python and the SearchResults
+classes.
+"""
+import json
+
+from harness import benchmark
+
+from elasticutils import (
+    DictSearchResults, ListSearchResults, ObjectSearchResults, S)
+
+
+HITS = 100
+
+
+def build_response(hits=HITS, fields=None):
+    """Returns a search response like Elasticsearch's with hits hits.
+
+    :arg fields: if given, hits have these ``fields`` instead of a
+        ``_source`` like a values_list or values_dict search
+
+    """
+    results = []
+    for i in range(hits):
+        source = {
+            'id': i,
+            'title': u'Product number {0}'.format(i),
+            'description': u'A fine product. ' * 10,
+            'price': 10.0 + i,
+            'tags': [u'sale', u'new', u'tag{0}'.format(i % 7)],
+            'created': '2013-10-{0:02d}T12:30:00'.format(i % 28 + 1),
+            'updated': '2013-11-{0:02d}T08:00:00'.format(i % 28 + 1),
+            'seller': {
+                'name': u'Seller {0}'.format(i % 13),
+                'joined': '2012-01-{0:02d}T00:00:00'.format(i % 28 + 1),
+            },
+        }
+        hit = {
+            '_index': 'products',
+            '_type': 'product',
+            '_id': str(i),
+            '_score': 1.0 / (i + 1),
+        }
+        if fields:
+            hit['fields'] = dict((field, source[field]) for field in fields)
+        else:
+            hit['_source'] = source
+        results.append(hit)
+
+    return {
+        'took': 3,
+        'timed_out': False,
+        '_shards': {'total': 5, 'successful': 5, 'failed': 0},
+        'hits': {'total': 1000, 'max_score': 1.0, 'hits': results},
+    }
+
+
+FIELDS = ['id', 'title', 'created']
+RESPONSE_TEXT = json.dumps(build_response())
+FIELDS_RESPONSE_TEXT = json.dumps(build_response(fields=FIELDS))
+
+
+def fresh_response():
+    # to_python converts in place, so every call needs its own.
+    return json.loads(RESPONSE_TEXT)
+
+
+def fresh_fields_response():
+    return json.loads(FIELDS_RESPONSE_TEXT)
+
+
+S_ = S()
+
+
+@benchmark('to_python_100', prepare=fresh_response)
+def to_python(response):
+    return S_.to_python(response['hits']['hits'])
+
+
+# The SearchResults classes don't change the results they're given, so
+# they can share these.
+RESPONSE = fresh_response()
+RESULTS = S_.to_python(RESPONSE['hits']['hits'])
+FIELDS_RESPONSE = fresh_fields_response()
+FIELDS_RESULTS = S_.to_python(FIELDS_RESPONSE['hits']['hits'])
+
+
+@benchmark('object_results_100')
+def object_results():
+    return ObjectSearchResults(None, RESPONSE, RESULTS, None)
+
+
+@benchmark('dict_results_100')
+def dict_results():
+    return DictSearchResults(None, RESPONSE, RESULTS, None)
+
+
+@benchmark('dict_results_fields_100')
+def dict_results_fields():
+    return DictSearchResults(None, FIELDS_RESPONSE, FIELDS_RESULTS, FIELDS)
+
+
+@benchmark('list_results_100')
+def list_results():
+    return ListSearchResults(None, RESPONSE, RESULTS, None)
+
+
+@benchmark('list_results_fields_100')
+def list_results_fields():
+    return ListSearchResults(None, FIELDS_RESPONSE, FIELDS_RESULTS, FIELDS)
@@ -0,0 +1,188 @@
+"""
+Registry, timing and baseline comparison for the benchmarks.
+
+Benchmarks are functions registered with the ``benchmark`` decorator.
+A benchmark function does the work for one operation. If it needs
+fresh input for each operation (for example because it changes its
+input), pass a ``prepare`` function which returns the argument for
+one call; preparing isn't timed.
+
+Two things are measured for each benchmark:
+
+ops_per_sec
+    operations per second for the best of several repeats
+
+objects_per_op
+    net gc-tracked objects (dicts, lists, instances, ...) that each
+    operation leaves behind, mostly in what it returns; this works on
+    every Python version and is deterministic, so it makes a good
+    regression check for memory use. It can be negative when an
+    operation frees things, like ``F.filters`` dropping the F tree.
+
+"""
+import gc
+import json
+import platform
+import time
+
+
+#: Registered benchmarks in the order they were registered.
+BENCHMARKS = []
+
+#: Default allowed slowdown before ``compare`` calls it a regression.
+DEFAULT_TOLERANCE = 0.25
+
+#: Default allowed growth in objects per op before ``compare`` calls
+#: it a regression.
+DEFAULT_OBJECTS_TOLERANCE = 0.10
+
+
+class Benchmark(object):
+    def __init__(self, name, func, prepare=None):
+        self.name = name
+        self.func = func
+        self.prepare = prepare
+
+    def _args(self, number):
+        if self.prepare is None:
+            return [()] * number
+        return [(self.prepare(),) for i in xrange(number)]
+
+    def time(self, number):
+        """Returns the seconds it takes to do number operations."""
+        func = self.func
+        args = self._args(number)
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            start = time.time()
+            for arg in args:
+                func(*arg)
+            return time.time() - start
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    def calibrate(self, min_time=0.05):
+        """Returns a number of operations that takes at least min_time."""
+        number = 1
+        while True:
+            seconds = self.time(number)
+            if seconds >= min_time or number >= 10 ** 7:
+                return number
+            # Aim a bit past min_time, but don't grow by more than 100x
+            # on a single, possibly noisy, measurement.
+            estimate = int(number * min_time * 1.2 / max(seconds, 1e-6))
+            number = max(number + 1, min(estimate, number * 100))
+
+    def count_objects(self, number=100):
+        """Returns gc-tracked objects retained per operation."""
+        func = self.func
+        args = self._args(number)
+        gc.collect()
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            keep = []
+            before = len(gc.get_objects())
+            for arg in args:
+                keep.append(func(*arg))
+            after = len(gc.get_objects())
+        finally:
+            if gc_enabled:
+                gc.enable()
+        # keep itself is one object.
+        return float(after - before - 1) / number
+
+    def run(self, repeat=5):
+        """Runs the benchmark and returns a dict of measurements."""
+        number = self.calibrate()
+        best = min(self.time(number) for i in xrange(repeat))
+        return {
+            'ops_per_sec': number / max(best, 1e-9),
+            'objects_per_op': self.count_objects(),
+        }
+
+
+def benchmark(name, prepare=None):
+    """Decorator that registers a benchmark function.
+
+    :arg name: the name of the benchmark in reports and baselines
+    :arg prepare: function returning the argument for one call of the
+        benchmark function
+
+    """
+    def _benchmark(func):
+        BENCHMARKS.append(Benchmark(name, func, prepare))
+        return func
+    return _benchmark
+
+
+def run_benchmarks(names=None, repeat=5, report=None):
+    """Runs benchmarks and returns a results dict.
+
+    :arg names: run benchmarks with any of these strings in their
+        names; defaults to running all of them
+    :arg repeat: number of timing repeats; the best is used
+    :arg report: function called with (name, measurements) after each
+        benchmark runs
+
+    """
+    results = {}
+    for bench in BENCHMARKS:
+        if names and not [n for n in names if n in bench.name]:
+            continue
+        results[bench.name] = bench.run(repeat=repeat)
+        if report is not None:
+            report(bench.name, results[bench.name])
+    return {
+        'python': platform.python_version(),
+        'benchmarks': results,
+    }
+
+
+def save_baseline(results, path):
+    """Saves results from ``run_benchmarks`` as JSON at path."""
+    with open(path, 'w') as fp:
+        json.dump(results, fp, indent=2, sort_keys=True)
+
+
+def load_baseline(path):
+    """Loads results saved with ``save_baseline``."""
+    with open(path) as fp:
+        return json.load(fp)
+
+
+def compare(baseline, results, tolerance=DEFAULT_TOLERANCE,
+            objects_tolerance=DEFAULT_OBJECTS_TOLERANCE):
+    """Compares results against a baseline.
+
+    :arg baseline: results from ``load_baseline``
+    :arg results: results from ``run_benchmarks``
+    :arg tolerance: fraction ops/sec can drop before it's a regression
+    :arg objects_tolerance: fraction objects per op can grow before
+        it's a regression
+
+    :returns: list of ``(name, ops_change, objects_change, regressed)``
+        tuples where the changes are fractions of the baseline
+
+    Benchmarks that aren't in both are skipped.
+
+    """
+    rows = []
+    for name in sorted(results['benchmarks']):
+        if name not in baseline['benchmarks']:
+            continue
+        old = baseline['benchmarks'][name]
+        new = results['benchmarks'][name]
+
+        ops_change = new['ops_per_sec'] / old['ops_per_sec'] - 1
+        objects_change = ((new['objects_per_op'] - old['objects_per_op'])
+                          / max(old['objects_per_op'], 1.0))
+        # Half an object of slack so tiny counts don't flap.
+        regressed = (
+            ops_change < -tolerance
+            or (objects_change > objects_tolerance
+                and new['objects_per_op'] - old['objects_per_op'] > 0.5))
+        rows.append((name, ops_change, objects_change, regressed))
+    return rows
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""
+Measures the memory used by many cloned S instances.
+
+This builds a typical S and then keeps 100,000 S instances derived
+from it alive, like an application that keeps per-tenant searches
+around, and prints the memory used per S.
+
+Usage::
+
+    python benchmarks/memory.py [--count N]
+
+On Pythons with tracemalloc, that's used to measure memory.
+Otherwise it's estimated by adding up ``sys.getsizeof`` for the
+objects the S instances added, which is close, but a little low
+since it misses some allocator overhead.
+
+"""
+import gc
+import os
+import sys
+from optparse import OptionParser
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+
+from bench_query import build_s  # noqa
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+def estimate_size(before_ids, objs):
+    """Returns the bytes used by objects that aren't in before_ids.
+
+    This walks from objs and adds up ``sys.getsizeof`` for every
+    object reachable from them that wasn't around before.
+
+    """
+    seen = set(before_ids)
+    seen.add(id(objs))
+    total = 0
+    stack = list(objs)
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, type):
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        stack.extend(gc.get_referents(obj))
+    return total
+
+
+def measure(make, count):
+    """Returns bytes per object for count objects built with make."""
+    gc.collect()
+    if tracemalloc is not None:
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        objs = [make(i) for i in xrange(count)]
+        gc.collect()
+        total = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+    else:
+        before_ids = set(id(obj) for obj in gc.get_objects())
+        # Include things gc doesn't track, like the strings and
+        # tuples the objects we're about to make refer to.
+        for obj in gc.get_objects():
+            before_ids.update(id(ref) for ref in gc.get_referents(obj))
+        objs = [make(i) for i in xrange(count)]
+        total = estimate_size(before_ids, objs)
+    return float(total) / len(objs)
+
+
+def main(argv):
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('--count', type='int', default=100000,
+                      help='number of S instances (default %default)')
+    options, args = parser.parse_args(argv)
+
+    base = build_s()
+    base._build_query()
+
+    scenarios = [
+        ('cloned S', lambda i: base._clone()),
+        ('S with one more filter', lambda i: base.filter(tenant=i)),
+    ]
+    print 'Memory for {0:,} S instances ({1}):'.format(
+        options.count, 'tracemalloc' if tracemalloc else 'estimated')
+    for name, make in scenarios:
+        per_s = measure(make, options.count)
+        print '{0:<25} {1:>8,.0f} bytes/S {2:>8.1f} MB total'.format(
+            name, per_s, per_s * options.count / 1024 / 1024)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+"""
+Runs the ElasticUtils micro-benchmarks.
+
+These don't need Elasticsearch. They measure building queries and
+handling responses with synthetic data.
+
+Usage::
+
+    # Run all the benchmarks
+    python benchmarks/run.py
+
+    # Run benchmarks with "build_query" or "results" in their names
+    python benchmarks/run.py build_query results
+
+    # Save a baseline
+    python benchmarks/run.py --save baseline.json
+
+    # Compare against a baseline; exits with 1 if anything regressed
+    python benchmarks/run.py --compare baseline.json
+
+"""
+import os
+import sys
+from optparse import OptionParser
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+
+import harness  # noqa
+
+
+def load_benchmarks():
+    """Imports all the bench_*.py modules which registers them."""
+    for filename in sorted(os.listdir(BENCHMARKS_DIR)):
+        if filename.startswith('bench_') and filename.endswith('.py'):
+            __import__(filename[:-3])
+
+
+def report(name, measurements):
+    print '{0:<30} {1:>14,.0f} ops/sec {2:>10.1f} objects/op'.format(
+        name, measurements['ops_per_sec'], measurements['objects_per_op'])
+    sys.stdout.flush()
+
+
+def main(argv):
+    parser = OptionParser(usage='%prog [options] [NAME ...]')
+    parser.add_option('--repeat', type='int', default=5,
+                      help='timing repeats; the best is used (default 5)')
+    parser.add_option('--save', metavar='PATH',
+                      help='save results as a JSON baseline')
+    parser.add_option('--compare', metavar='PATH',
+                      help='compare results against a JSON baseline')
+    parser.add_option('--tolerance', type='float',
+                      default=harness.DEFAULT_TOLERANCE,
+                      help='allowed ops/sec drop as a fraction '
+                           '(default %default)')
+    parser.add_option('--objects-tolerance', type='float',
+                      default=harness.DEFAULT_OBJECTS_TOLERANCE,
+                      help='allowed objects/op growth as a fraction '
+                           '(default %default)')
+    options, names = parser.parse_args(argv)
+
+    load_benchmarks()
+    results = harness.run_benchmarks(
+        names, repeat=options.repeat, report=report)
+
+    if options.save:
+        harness.save_baseline(results, options.save)
+        print 'Saved baseline to {0}'.format(options.save)
+
+    if options.compare:
+        baseline = harness.load_baseline(options.compare)
+        rows = harness.compare(
+            baseline, results, options.tolerance, options.objects_tolerance)
+
+        print
+        print 'Compared to {0} (Python {1}):'.format(
+            options.compare, baseline.get('python', '?'))
+        regressions = 0
+        for name, ops_change, objects_change, regressed in rows:
+            print '{0:<30} {1:>+8.1%} ops/sec {2:>+8.1%} objects/op{3}'.format(
+                name, ops_change, objects_change,
+                '  REGRESSED' if regressed else '')
+            regressions += regressed
+
+        if regressions:
+            print '{0} benchmark(s) regressed.'.format(regressions)
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
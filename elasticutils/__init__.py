@@ -1,11 +1,27 @@
-import copy
+import base64
+import json
 import logging
+import os
+import time
+from collections import namedtuple
 from datetime import datetime
 from operator import itemgetter
+from Queue import Empty, Full, Queue
+from threading import Event, Lock
 
-from pyelasticsearch import ElasticSearch
+from pyelasticsearch import (
+    ConnectionError, ElasticHttpError, ElasticSearch, Timeout)
 
 from elasticutils._version import __version__  # noqa
+from elasticutils.cache import get_result_cache, make_key
+from elasticutils.futures import (
+    DEFAULT_MAX_WORKERS, ThreadPoolExecutor, TimeoutError,
+    get_default_executor)
+from elasticutils.serializers import get_serializer, to_json_default
+from elasticutils.transport import (
+    DEFAULT_CIRCUIT_THRESHOLD, DEFAULT_CIRCUIT_TIMEOUT, DEFAULT_POOL_MAXSIZE,
+    HostSelector, Transport)
+from elasticutils.utils import LRUCache, SingleFlight, SlotPickleMixin
 
 
 log = logging.getLogger('elasticutils')
@@ -17,6 +33,41 @@ DEFAULT_DOCTYPES = None
 DEFAULT_INDEXES = None
 DEFAULT_TIMEOUT = 5
 
+#: Maximum number of compiled queries kept in the process-wide cache.
+QUERY_CACHE_SIZE = 1000
+
+#: Maximum number of ElasticSearch objects get_es() keeps cached.
+ES_CACHE_SIZE = 32
+
+#: Maximum number of search totals kept in the process-wide cache.
+COUNT_CACHE_SIZE = 1000
+
+#: Maximum number of empty search responses kept in the process-wide
+#: cache.
+EMPTY_CACHE_SIZE = 1000
+
+#: Number of results S.all() asks for when it doesn't know the total.
+ALL_FIRST_SIZE = 500
+
+#: Number of results S.scan() and S.iterate() ask for at a time.
+SCAN_BATCH_SIZE = 100
+
+#: How long Elasticsearch keeps a scroll open between batches.
+SCROLL_TIMEOUT = '1m'
+
+#: Script for the ``slice`` filter field action. The remainder is
+#: negative for negative values, so it takes the absolute value.
+SLICE_SCRIPT = 'Math.abs(doc[field].value % slices) == slice'
+
+#: Query params MLT sends; these are the ones pyelasticsearch's
+#: ``more_like_this()`` takes.
+MLT_QUERY_PARAMS = frozenset([
+    'search_type', 'search_indices', 'search_types', 'search_scroll',
+    'search_size', 'search_from', 'like_text', 'percent_terms_to_match',
+    'min_term_freq', 'max_query_terms', 'stop_words', 'min_doc_freq',
+    'max_doc_freq', 'min_word_len', 'max_word_len', 'boost_terms', 'boost',
+    'analyzer'])
+
 
 #: Maps ElasticUtils field actions to their Elasticsearch query names.
 QUERY_ACTION_MAP = {
@@ -65,6 +116,27 @@ class BadSearch(ElasticUtilsError):
     pass
 
 
+class MissingParamError(ElasticUtilsError):
+    """Raise when a prepared search is bound without all its params."""
+    pass
+
+
+class InvalidCursorError(ElasticUtilsError):
+    """Raise when a keyset pagination cursor can't be used."""
+    pass
+
+
+class MultiSearchError(ElasticUtilsError):
+    """Raise when a search in a multi search fails.
+
+    :property error: the error Elasticsearch returned for the search
+
+    """
+    def __init__(self, error):
+        super(MultiSearchError, self).__init__(error)
+        self.error = error
+
+
 def _build_key(urls, timeout, **settings):
     # Order the settings by key and then turn it into a string with
     # repr. There are a lot of edge cases here, but the worst that
@@ -86,10 +158,57 @@ def _build_key(urls, timeout, **settings):
     return key
 
 
-_cached_elasticsearch = {}
+def _join_names(names):
+    """Returns comma-delimited names for a URL path
+
+    This does the same thing pyelasticsearch does: ``_all`` is
+    dropped and a string is treated as a list of one name.
+
+    """
+    if names is None:
+        return ''
+    if isinstance(names, basestring):
+        names = [names]
+    return ','.join(name for name in names if name != '_all')
+
+
+def _close_es(key, es):
+    # Something might still be using it, but closing the idle
+    # connections is safe: the transport opens new ones if needed.
+    es.session.close()
+
+
+#: Cache of ElasticSearch objects get_es() created in this process.
+_cached_elasticsearch = LRUCache(maxsize=ES_CACHE_SIZE, on_evict=_close_es)
+_cached_elasticsearch_lock = Lock()
+_cached_elasticsearch_pid = os.getpid()
+
 
+def _get_es_cache():
+    """Returns the get_es() cache and its lock for this process
 
-def get_es(urls=None, timeout=DEFAULT_TIMEOUT, force_new=False, **settings):
+    A child process made with ``os.fork()`` gets new ones rather than
+    using the ElasticSearch objects, and so the sockets, of its
+    parent. The lock is replaced, too, since another thread in the
+    parent might have been holding it.
+
+    """
+    global _cached_elasticsearch, _cached_elasticsearch_lock
+    global _cached_elasticsearch_pid
+
+    pid = os.getpid()
+    if pid != _cached_elasticsearch_pid:
+        _cached_elasticsearch = LRUCache(
+            maxsize=ES_CACHE_SIZE, on_evict=_close_es)
+        _cached_elasticsearch_lock = Lock()
+        _cached_elasticsearch_pid = pid
+    return _cached_elasticsearch, _cached_elasticsearch_lock
+
+
+def get_es(urls=None, timeout=DEFAULT_TIMEOUT, force_new=False,
+           pool_maxsize=DEFAULT_POOL_MAXSIZE, pool_block=False,
+           pool_timeout=None, circuit_threshold=DEFAULT_CIRCUIT_THRESHOLD,
+           circuit_timeout=DEFAULT_CIRCUIT_TIMEOUT, **settings):
     """Create a pyelasticsearch `ElasticSearch` object and return it.
 
     This will aggressively re-use `ElasticSearch` objects with the
@@ -103,12 +222,32 @@ def get_es(urls=None, timeout=DEFAULT_TIMEOUT, force_new=False, **settings):
     4. if you pass in `force_new=True`, then you are guaranteed to get
        a fresh `ElasticSearch` object AND that object will not be
        cached
+    5. it keeps the ``ES_CACHE_SIZE`` (32) most recently used
+       `ElasticSearch` objects and closes the idle connections of the
+       ones it drops
+    6. a process forked after `get_es()` was called doesn't get its
+       parent's `ElasticSearch` objects
 
     :arg urls: list of uris; Elasticsearch hosts to connect to,
         defaults to ``['http://localhost:9200']``
     :arg timeout: int; the timeout in seconds, defaults to 5
     :arg force_new: Forces get_es() to generate a new ElasticSearch
         object rather than pulling it from cache.
+    :arg pool_maxsize: int; the maximum number of keep-alive
+        connections to keep open to each host, defaults to 10
+    :arg pool_block: bool; if True, wait for a free connection when
+        ``pool_maxsize`` requests to a host are already in flight
+        rather than opening an extra one, defaults to False
+    :arg pool_timeout: with ``pool_block``, the number of seconds to
+        wait for a free connection before raising
+        :py:class:`elasticutils.transport.PoolTimeoutError`; defaults
+        to waiting forever
+    :arg circuit_threshold: int; the number of failed requests in a
+        row after which a host gets no requests for a while, defaults
+        to 5
+    :arg circuit_timeout: the number of seconds a failing host gets no
+        requests before one is let through to see whether it has
+        recovered, defaults to 30
     :arg settings: other settings to pass into ElasticSearch
         constructor; See
         `<http://pyelasticsearch.readthedocs.org/en/latest/api/>`_ for
@@ -127,6 +266,26 @@ def get_es(urls=None, timeout=DEFAULT_TIMEOUT, force_new=False, **settings):
         es = get_es(urls=['http://localhost:9200'], timeout=10,
                     max_retries=3)
 
+    The `ElasticSearch` sends requests with a
+    :py:class:`elasticutils.transport.Transport` which keeps a pool of
+    keep-alive connections per host. To see how the pools are doing::
+
+        get_es().session.stats()
+
+    Requests go to the hosts picked by a
+    :py:class:`elasticutils.transport.HostSelector` which prefers the
+    fastest ones and ejects failing ones, rather than to a random
+    one. ``revival_delay`` is ignored: `circuit_timeout` takes its
+    place. To see how the hosts are doing::
+
+        get_es().servers.stats()
+
+    This is thread-safe. To see how well the cache is doing and to
+    empty it::
+
+        get_es.cache_info()
+        get_es.cache_clear()
+
     """
     # Cheap way of de-None-ifying things
     urls = urls or DEFAULT_URLS
@@ -135,20 +294,65 @@ def get_es(urls=None, timeout=DEFAULT_TIMEOUT, force_new=False, **settings):
     if 'hosts' in settings:
         raise DeprecationWarning('"hosts" is deprecated in favor of "urls".')
 
-    if not force_new:
-        key = _build_key(urls, timeout, **settings)
-        if key in _cached_elasticsearch:
-            return _cached_elasticsearch[key]
+    if force_new:
+        return _new_es(urls, timeout, pool_maxsize, pool_block,
+                       pool_timeout, circuit_threshold, circuit_timeout,
+                       settings)
+
+    key = _build_key(urls, timeout, pool_maxsize=pool_maxsize,
+                     pool_block=pool_block, pool_timeout=pool_timeout,
+                     circuit_threshold=circuit_threshold,
+                     circuit_timeout=circuit_timeout, **settings)
+    cache, lock = _get_es_cache()
+    # Hold the lock so threads asking for the same settings at the
+    # same time get the same ElasticSearch. Creating one doesn't talk
+    # to Elasticsearch, so this is quick.
+    with lock:
+        es = cache.get(key)
+        if es is None:
+            es = _new_es(urls, timeout, pool_maxsize, pool_block,
+                         pool_timeout, circuit_threshold, circuit_timeout,
+                         settings)
+            cache.set(key, es)
+    return es
 
+
+def _new_es(urls, timeout, pool_maxsize, pool_block, pool_timeout,
+            circuit_threshold, circuit_timeout, settings):
     es = ElasticSearch(urls, timeout=timeout, **settings)
+    es.servers = HostSelector(urls, threshold=circuit_threshold,
+                              timeout=circuit_timeout)
+    es.session = Transport(maxsize=pool_maxsize, block=pool_block,
+                           pool_timeout=pool_timeout, selector=es.servers)
+    return es
 
-    if not force_new:
-        # We don't need to rebuild the key here since we built it in
-        # the previous if block, so it's in the namespace. Having said
-        # that, this is a little ew.
-        _cached_elasticsearch[key] = es
 
-    return es
+def _get_es_cache_info():
+    """Returns hit/miss statistics for the get_es() cache.
+
+    :returns: a ``CacheInfo(hits, misses, maxsize, currsize)`` named
+        tuple
+
+    """
+    return _get_es_cache()[0].info()
+
+
+def _get_es_cache_clear():
+    """Removes all cached ElasticSearch objects and resets the statistics.
+
+    The idle connections of the removed objects are closed.
+
+    """
+    cache, lock = _get_es_cache()
+    with lock:
+        ess = cache.values()
+        cache.clear()
+    for es in ess:
+        _close_es(None, es)
+
+
+get_es.cache_info = _get_es_cache_info
+get_es.cache_clear = _get_es_cache_clear
 
 
 def split_field_action(s):
@@ -182,7 +386,92 @@ def _process_facets(facets, flags):
     return rv
 
 
-class F(object):
+class _FilterNode(SlotPickleMixin):
+    """Base class for the immutable nodes of an F filter tree."""
+    __slots__ = ('fingerprint',)
+
+
+class _Connector(_FilterNode):
+    """An ``and`` or ``or`` of a sequence of filter items.
+
+    The children are stored as a chain: a connector built by adding
+    items to an existing connector with the same `conn` points at it
+    as its `prefix` rather than copying its children. This makes
+    ``f &= F(...)`` in a loop constant time per step.
+
+    """
+    __slots__ = ('conn', 'prefix', 'items')
+
+    def __init__(self, conn, prefix, items):
+        self.conn = conn
+        self.prefix = prefix
+        self.items = items
+        self.fingerprint = None
+
+    def children(self):
+        """Returns the list of child items in order."""
+        chunks = []
+        node = self
+        while node is not None:
+            chunks.append(node.items)
+            node = node.prefix
+        children = []
+        for chunk in reversed(chunks):
+            children.extend(chunk)
+        return children
+
+
+class _Not(_FilterNode):
+    """The negation of a sequence of filter items."""
+    __slots__ = ('items',)
+
+    def __init__(self, items):
+        self.items = items
+        self.fingerprint = None
+
+
+def _lower_filter_items(items):
+    """Converts a sequence of filter tree items into F.filters shape."""
+    rv = []
+    for item in items:
+        if isinstance(item, _Connector):
+            rv.append({item.conn: _lower_filter_items(item.children())})
+        elif isinstance(item, _Not):
+            rv.append({'not': {'filter': _lower_filter_items(item.items)}})
+        else:
+            rv.append(item)
+    return rv
+
+
+def _filter_items_from_filters(filters):
+    """Converts F.filters shaped data into a tuple of tree items."""
+    items = []
+    for item in filters:
+        if isinstance(item, dict) and len(item) == 1:
+            key, val = item.items()[0]
+            if key in ('and', 'or') and isinstance(val, list):
+                item = _Connector(
+                    key, None, _filter_items_from_filters(val))
+            elif (key == 'not' and isinstance(val, dict)
+                  and isinstance(val.get('filter'), list)):
+                item = _Not(_filter_items_from_filters(val['filter']))
+        items.append(item)
+    return tuple(items)
+
+
+def _connector_operands(items, conn):
+    """Returns the items of an F as operands of a `conn` connector
+
+    The items of an F are ANDed together, so for ``or`` more than one
+    item becomes a single ``and``.
+
+    """
+    if conn == 'or' and len(items) > 1:
+        return (_Connector('and', None, items),)
+    return items
+
+
+class F(SlotPickleMixin):
     """
     Filter objects.
 
@@ -197,14 +486,52 @@ class F(object):
 
     creates a filter "price = 'Free' or style = 'Mexican'".
 
+    F instances are immutable. Combining them builds a tree that
+    shares structure with the operands, so nothing is copied; the
+    tree is only converted to Elasticsearch filters when the search
+    is compiled.
+
     """
+    __slots__ = ('_items', '_filters', '__weakref__')
+
     def __init__(self, **filters):
         """Creates an F"""
-        filters = filters.items()
+        filters = tuple(filters.items())
         if len(filters) > 1:
-            self.filters = [{'and': filters}]
+            self._items = (_Connector('and', None, filters),)
         else:
-            self.filters = filters
+            self._items = filters
+        self._filters = None
+
+    @classmethod
+    def _from_items(cls, items):
+        f = cls.__new__(cls)
+        f._items = items
+        f._filters = None
+        return f
+
+    def _get_items(self):
+        """Returns the filter tree items of this F."""
+        if self._filters is not None:
+            # Someone has had their hands on the filters list, so
+            # that's what we go by now.
+            return _filter_items_from_filters(self._filters)
+        return self._items
+
+    def _get_filters(self):
+        if self._filters is None:
+            self._filters = _lower_filter_items(self._items)
+            self._items = None
+        return self._filters
+
+    def _set_filters(self, filters):
+        self._filters = filters
+        self._items = None
+
+    #: The filters as a list of ``(key, value)`` tuples and
+    #: ``{connector: [...]}`` dicts. This is built from the filter
+    #: tree the first time you access it.
+    filters = property(_get_filters, _set_filters)
 
     def __repr__(self):
         return '<F {0}>'.format(self.filters)
@@ -214,25 +541,25 @@ class F(object):
         OR and AND will create a new F, with the filters from both F
         objects combined with the connector `conn`.
         """
-        f = F()
-
-        self_filters = copy.deepcopy(self.filters)
-        other_filters = copy.deepcopy(other.filters)
-
-        if not self.filters:
-            f.filters = other_filters
-        elif not other.filters:
-            f.filters = self_filters
-        elif conn in self.filters[0]:
-            f.filters = self_filters
-            f.filters[0][conn].extend(other_filters)
-        elif conn in other.filters[0]:
-            f.filters = other_filters
-            f.filters[0][conn].extend(self_filters)
+        self_items = _connector_operands(self._get_items(), conn)
+        other_items = _connector_operands(other._get_items(), conn)
+
+        if not self_items:
+            items = other_items
+        elif not other_items:
+            items = self_items
+        elif (isinstance(self_items[0], _Connector)
+              and self_items[0].conn == conn):
+            items = (_Connector(conn, self_items[0],
+                                self_items[1:] + other_items),)
+        elif (isinstance(other_items[0], _Connector)
+              and other_items[0].conn == conn):
+            items = (_Connector(conn, other_items[0],
+                                other_items[1:] + self_items),)
         else:
-            f.filters = [{conn: self_filters + other_filters}]
+            items = (_Connector(conn, None, self_items + other_items),)
 
-        return f
+        return F._from_items(items)
 
     def __or__(self, other):
         return self._combine(other, 'or')
@@ -241,20 +568,17 @@ class F(object):
         return self._combine(other, 'and')
 
     def __invert__(self):
-        f = F()
-        self_filters = copy.deepcopy(self.filters)
-        if len(self_filters) == 0:
-            f.filters = []
-        elif (len(self_filters) == 1
-              and isinstance(self_filters[0], dict)
-              and self_filters[0].get('not', {}).get('filter', {})):
-            f.filters = self_filters[0]['not']['filter']
-        else:
-            f.filters = [{'not': {'filter': self_filters}}]
-        return f
+        items = self._get_items()
+        if len(items) == 0:
+            return F._from_items(())
+        elif (len(items) == 1
+              and isinstance(items[0], _Not)
+              and items[0].items):
+            return F._from_items(items[0].items)
+        return F._from_items((_Not(items),))
 
 
-class Q(object):
+class Q(SlotPickleMixin):
     """
     Query objects.
 
@@ -283,6 +607,8 @@ class Q(object):
     `must` clauses (summary and description).
 
     """
+    __slots__ = ('should_q', 'must_q', 'must_not_q', '__weakref__')
+
     def __init__(self, **queries):
         """Creates a Q"""
         self.should_q = []
@@ -329,6 +655,420 @@ class Q(object):
                 and sorted(self.must_not_q) == sorted(other.must_not_q))
 
 
+class Param(object):
+    """
+    Placeholder for a value in a prepared search.
+
+    Use it anywhere you'd use a value in ``.query()``, ``.filter()``
+    and ``F``, then call :py:meth:`elasticutils.S.prepare` and bind
+    values to the params by name::
+
+        prepared = (S().filter(category=Param('cat'))
+                       .query(title__match=Param('q'))
+                       .prepare())
+
+        results = prepared.bind(cat='books', q='dragons').execute()
+
+    .. Note::
+
+       The shape of the query is fixed when the search is compiled,
+       so a param can't stand in for something that changes the
+       shape. For example, ``foo__range`` needs a tuple of two
+       params rather than one param, and binding None to ``foo=``
+       doesn't turn it into a missing filter.
+
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return '<Param {0}>'.format(self.name)
+
+    def __eq__(self, other):
+        return isinstance(other, Param) and self.name == other.name
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((Param, self.name))
+
+
+def _compile_template(obj):
+    """Compiles obj into a function that fills in Param values
+
+    Returns None if obj has no params in it. Otherwise returns a
+    function that takes a dict of param name -> value and returns a
+    copy of obj with the params replaced. Parts of obj that don't
+    have params in them are shared between all the copies.
+
+    """
+    if isinstance(obj, Param):
+        name = obj.name
+        return lambda values: values[name]
+
+    if isinstance(obj, dict):
+        static = {}
+        dynamic = []
+        for key, val in obj.items():
+            template = _compile_template(val)
+            if template is None:
+                static[key] = val
+            else:
+                dynamic.append((key, template))
+        if not dynamic:
+            return None
+
+        def fill_dict(values):
+            rv = dict(static)
+            for key, template in dynamic:
+                rv[key] = template(values)
+            return rv
+        return fill_dict
+
+    if isinstance(obj, (list, tuple)):
+        templates = [_compile_template(item) for item in obj]
+        if not any(templates):
+            return None
+        parts = zip(obj, templates)
+        cls = obj.__class__
+
+        def fill_seq(values):
+            return cls([template(values) if template else item
+                        for item, template in parts])
+        return fill_seq
+
+    return None
+
+
+def _find_params(obj, found=None):
+    """Returns the set of Param names in obj."""
+    if found is None:
+        found = set()
+    if isinstance(obj, Param):
+        found.add(obj.name)
+    elif isinstance(obj, dict):
+        for val in obj.values():
+            _find_params(val, found)
+    elif isinstance(obj, (list, tuple)):
+        for item in obj:
+            _find_params(item, found)
+    return found
+
+
+#: Process-wide cache of compiled param templates keyed by S fingerprint.
+_template_cache = LRUCache(maxsize=QUERY_CACHE_SIZE)
+
+
+class _Unfingerprintable(Exception):
+    """Raised by _fingerprint for values it can't make a key from."""
+    pass
+
+
+_SCALAR_TYPES = (basestring, type(None))
+
+
+def _fingerprint(obj):
+    """Returns a hashable canonical form of obj
+
+    Two things with the same fingerprint compile to the same
+    Elasticsearch JSON. Dict ordering doesn't matter, but type does
+    (``1``, ``1.0`` and ``True`` serialize differently).
+
+    :raises _Unfingerprintable: if obj contains something that isn't
+        hashable
+
+    """
+    if isinstance(obj, _SCALAR_TYPES):
+        return obj
+    if isinstance(obj, dict):
+        return ('dict', frozenset(
+            (_fingerprint(k), _fingerprint(v)) for k, v in obj.items()))
+    if isinstance(obj, (list, tuple)):
+        return ('seq', tuple([_fingerprint(item) for item in obj]))
+    if isinstance(obj, (set, frozenset)):
+        return ('set', frozenset([_fingerprint(item) for item in obj]))
+    if isinstance(obj, F):
+        return ('F', _fingerprint(obj._get_items()))
+    if isinstance(obj, _FilterNode):
+        # Filter tree nodes are immutable, so their fingerprint can
+        # be memoized.
+        if obj.fingerprint is None:
+            if isinstance(obj, _Connector):
+                obj.fingerprint = (obj.conn, _fingerprint(obj.children()))
+            else:
+                obj.fingerprint = ('not', _fingerprint(obj.items))
+        return obj.fingerprint
+    if isinstance(obj, Q):
+        return ('Q', _fingerprint(obj.should_q), _fingerprint(obj.must_q),
+                _fingerprint(obj.must_not_q))
+    try:
+        hash(obj)
+    except TypeError:
+        raise _Unfingerprintable(repr(obj))
+    return (obj.__class__, obj)
+
+
+#: Filters that are cheap to execute and cache: these go first.
+_CHEAP_FILTERS = frozenset(['term', 'terms', 'in', 'missing', 'exists',
+                            'ids', 'type'])
+#: Filters that are more expensive than term filters, but not by much.
+_RANGE_FILTERS = frozenset(['range', 'prefix', 'numeric_range'])
+#: Scalar types that can be merged from term filters into a terms filter.
+_TERM_VALUE_TYPES = (basestring, int, long, float)
+
+
+def _filter_cost(f):
+    """Returns a rough relative cost of executing filter f."""
+    if not isinstance(f, dict) or len(f) != 1:
+        return 2
+    name = f.keys()[0]
+    if name in _CHEAP_FILTERS:
+        return 0
+    if name in _RANGE_FILTERS:
+        return 1
+    if name == 'script' or name.startswith('geo_'):
+        return 3
+    return 2
+
+
+def _single_field_filter(f, names):
+    """Returns (name, field, value) if f is a names filter on one field."""
+    if isinstance(f, dict) and len(f) == 1:
+        name, val = f.items()[0]
+        if name in names and isinstance(val, dict) and len(val) == 1:
+            field, value = val.items()[0]
+            return name, field, value
+    return None
+
+
+def _dedupe_filters(filters):
+    """Removes duplicate filters keeping the first of each."""
+    seen = set()
+    rv = []
+    for f in filters:
+        try:
+            key = _fingerprint(f)
+        except _Unfingerprintable:
+            rv.append(f)
+            continue
+        if key not in seen:
+            seen.add(key)
+            rv.append(f)
+    return rv
+
+
+def _merge_term_filters(filters):
+    """Merges term and terms filters on the same field of an or.
+
+    ``term`` on a field ORed with other ``term`` or ``terms`` filters
+    on that field is the same as one ``terms`` filter with all the
+    values. The merged filter goes where the first one was.
+
+    """
+    values = {}
+    counts = {}
+    for f in filters:
+        bits = _single_field_filter(f, ('term', 'terms', 'in'))
+        if bits is None:
+            continue
+        name, field, value = bits
+        if name == 'term':
+            if not isinstance(value, _TERM_VALUE_TYPES):
+                continue
+            value = [value]
+        elif not isinstance(value, (list, tuple)):
+            continue
+        values.setdefault(field, []).extend(value)
+        counts[field] = counts.get(field, 0) + 1
+
+    if all(count == 1 for count in counts.values()):
+        return filters
+
+    rv = []
+    for f in filters:
+        bits = _single_field_filter(f, ('term', 'terms', 'in'))
+        field = bits and bits[1]
+        if bits is None or counts.get(field, 0) < 2:
+            rv.append(f)
+        elif field in values:
+            rv.append({'terms': {field: _dedupe_filters(values.pop(field))}})
+    return rv
+
+
+def _optimize_filter(f):
+    """Returns an optimized filter equivalent to filter f
+
+    * nested ``and`` in ``and`` and ``or`` in ``or`` are flattened
+    * duplicate clauses in an ``and`` or ``or`` are removed
+    * ``term`` filters on the same field in an ``or`` are merged into
+      a ``terms`` filter
+    * ``not`` of a ``not`` is removed
+    * ``and`` and ``or`` of a single clause is replaced with the
+      clause
+    * clauses are ordered so cheap term filters come before range and
+      prefix filters which come before everything else
+
+    This doesn't change f---it returns a new filter sharing the bits
+    that didn't change.
+
+    """
+    if not isinstance(f, dict) or len(f) != 1:
+        return f
+
+    name, val = f.items()[0]
+    if name == 'not':
+        if not (isinstance(val, dict) and val.keys() == ['filter']
+                and isinstance(val['filter'], dict)):
+            return f
+        inner = _optimize_filter(val['filter'])
+        if (isinstance(inner, dict) and inner.keys() == ['not']
+                and isinstance(inner['not'], dict)
+                and inner['not'].keys() == ['filter']):
+            return inner['not']['filter']
+        return {'not': {'filter': inner}}
+
+    if name not in ('and', 'or') or not isinstance(val, list):
+        return f
+
+    children = []
+    for child in val:
+        child = _optimize_filter(child)
+        if (isinstance(child, dict) and child.keys() == [name]
+                and isinstance(child[name], list)):
+            children.extend(child[name])
+        else:
+            children.append(child)
+
+    children = _dedupe_filters(children)
+    if name == 'or':
+        children = _merge_term_filters(children)
+    # sorted is stable, so clauses of the same cost stay in order.
+    children = sorted(children, key=_filter_cost)
+
+    if len(children) == 1:
+        return children[0]
+    return {name: children}
+
+
+def _is_bitset_filter(f):
+    """Returns whether filter f can be executed with cached bitsets.
+
+    Scripts and geo filters are evaluated doc by doc and so are
+    ``and``, ``or`` and ``not``. Everything else is bitset-friendly.
+
+    """
+    if not isinstance(f, dict) or len(f) != 1:
+        return False
+    name = f.keys()[0]
+    return not (name in ('and', 'or', 'not', 'script', 'numeric_range')
+                or name.startswith('geo_'))
+
+
+def _bool_filter(f):
+    """Returns filter f with and, or and not lowered to bool filters
+
+    Clauses that can use cached bitsets go into a ``bool`` filter's
+    ``must``, ``should`` and ``must_not``. Clauses that can't, like
+    scripts and geo filters, stay in an ``and`` or ``or`` with the
+    ``bool`` filter first so it narrows things down before they run.
+
+    This doesn't change f---it returns a new filter.
+
+    """
+    if not isinstance(f, dict) or len(f) != 1:
+        return f
+
+    name, val = f.items()[0]
+    if name == 'not':
+        if not (isinstance(val, dict) and val.keys() == ['filter']):
+            return f
+        inner = _bool_filter(val['filter'])
+        if _is_bitset_filter(inner):
+            return {'bool': {'must_not': [inner]}}
+        return {'not': {'filter': inner}}
+
+    if name not in ('and', 'or') or not isinstance(val, list):
+        return f
+
+    bitset = []
+    must_not = []
+    other = []
+    for child in val:
+        child = _bool_filter(child)
+        if not _is_bitset_filter(child):
+            other.append(child)
+        elif (name == 'and' and child.keys() == ['bool']
+                and child['bool'].keys() == ['must_not']):
+            # This is a lowered not; in an and it can go in must_not
+            # directly.
+            must_not.extend(child['bool']['must_not'])
+        else:
+            bitset.append(child)
+
+    if name == 'and':
+        if must_not:
+            bool_ = {'must_not': must_not}
+            if bitset:
+                bool_['must'] = bitset
+            bitset = [{'bool': bool_}]
+        elif len(bitset) > 1:
+            bitset = [{'bool': {'must': bitset}}]
+    elif len(bitset) > 1:
+        bitset = [{'bool': {'should': bitset}}]
+
+    if not other and len(bitset) == 1:
+        return bitset[0]
+    return {name: bitset + other}
+
+
+#: Process-wide cache of compiled queries keyed by S fingerprint.
+_query_cache = LRUCache(maxsize=QUERY_CACHE_SIZE)
+
+#: Process-wide cache of (expires, total) for searches keyed by S
+#: fingerprint. See S.default_count_ttl.
+_count_cache = LRUCache(maxsize=COUNT_CACHE_SIZE)
+
+#: Process-wide cache of (expires, response) for searches that found
+#: nothing keyed by S fingerprint. See S.default_empty_ttl.
+_empty_cache = LRUCache(maxsize=EMPTY_CACHE_SIZE)
+
+#: Process-wide in-flight searches. See S.default_single_flight.
+_single_flight = SingleFlight()
+
+
+def query_cache_info():
+    """Returns hit/miss statistics for the compiled query cache.
+
+    :returns: a ``CacheInfo(hits, misses, maxsize, currsize)`` named
+        tuple
+
+    Identical searches built by separate `S` instances share compiled
+    queries, so a hit means ``_build_query`` was skipped entirely.
+
+    """
+    return _query_cache.info()
+
+
+def clear_query_cache():
+    """Removes all compiled queries and resets the statistics."""
+    _query_cache.clear()
+
+
+def single_flight_info():
+    """Returns statistics for searches that share in-flight requests.
+
+    :returns: a ``SingleFlightInfo(executed, coalesced, in_flight)``
+        named tuple with the number of searches that were sent, the
+        number that waited for an identical search instead, and the
+        number being sent right now
+
+    See ``S.default_single_flight``.
+
+    """
+    return _single_flight.info()
+
+
 def _boosted_value(name, action, key, value, boost):
     """Boost a value if we should in _process_queries"""
     if boost is not None:
@@ -340,8 +1080,186 @@ def _boosted_value(name, action, key, value, boost):
     return {name: value}
 
 
+def _filter_term(key, val, action):
+    if val is None:
+        return {'missing': {'field': key, "null_value": True}}
+    return {'term': {key: val}}
+
+
+def _filter_prefix(key, val, action):
+    return {'prefix': {key: val}}
+
+
+def _filter_in(key, val, action):
+    return {'in': {key: val}}
+
+
+def _filter_range_action(key, val, action):
+    return {'range': {key: {action: val}}}
+
+
+def _filter_range(key, val, action):
+    lower, upper = val
+    return {'range': {key: {'gte': lower, 'lte': upper}}}
+
+
+def _filter_slice(key, val, action):
+    slice_, slices = val
+    return {'script': {'script': SLICE_SCRIPT,
+                       'params': {'field': key, 'slice': slice_,
+                                  'slices': slices}}}
+
+
+#: Maps filter field actions to the functions that build them.
+_FILTER_HANDLERS = {
+    None: _filter_term,
+    'startswith': _filter_prefix,
+    'prefix': _filter_prefix,
+    'in': _filter_in,
+    'range': _filter_range,
+    'slice': _filter_slice,
+}
+_FILTER_HANDLERS.update((action, _filter_range_action)
+                        for action in RANGE_ACTIONS)
+
+
+def _query_mapped(field_name, key, val, action, boost):
+    return {
+        QUERY_ACTION_MAP[action]: _boosted_value(
+            field_name, action, key, val, boost)
+    }
+
+
+def _query_query_string(field_name, key, val, action, boost):
+    # query_string has different syntax, so it's handled differently.
+    #
+    # Note: query_string queries are not boosted with .boost()---they're
+    # boosted in the query text itself.
+    return {
+        'query_string': {'default_field': field_name, 'query': val}
+    }
+
+
+def _query_range_action(field_name, key, val, action, boost):
+    # Ranges are special and have a different syntax, so we handle
+    # them separately.
+    return {
+        'range': {field_name: _boosted_value(action, action, key, val, boost)}
+    }
+
+
+def _query_range(field_name, key, val, action, boost):
+    lower, upper = val
+    value = {
+        'gte': lower,
+        'lte': upper,
+    }
+    if boost:
+        value['boost'] = boost
+
+    return {'range': {field_name: value}}
+
+
+#: Maps query field actions to the functions that build them.
+_QUERY_HANDLERS = dict((action, _query_mapped) for action in QUERY_ACTION_MAP)
+_QUERY_HANDLERS['query_string'] = _query_query_string
+_QUERY_HANDLERS['range'] = _query_range
+_QUERY_HANDLERS.update((action, _query_range_action)
+                       for action in RANGE_ACTIONS)
+
+
+_NO_HANDLER = (None, False)
+
+
+def _get_handler(cls, name):
+    """Returns a function for cls.name that takes the S as first arg."""
+    attr = getattr(cls, name)
+    func = getattr(attr, '__func__', None)
+    if func is not None and getattr(attr, '__self__', None) is None:
+        return func
+    # Not a plain method (e.g. a staticmethod), so look it up on the
+    # instance when it's called.
+    return lambda self, *args: getattr(self, name)(*args)
+
+
+class _StepNode(SlotPickleMixin):
+    """A link in the chain of steps of an S.
+
+    Steps are stored as a linked list that points from the newest
+    step back to the oldest. Cloning an S and adding a step creates a
+    single new node that points at the parent's chain, so S instances
+    share their common steps rather than copying them.
+
+    Each node also memoizes the fingerprint of its step and the
+    partially compiled query state up to and including it, so cloned
+    S instances share that work, too. The state is memoized as a
+    ``(cls, state)`` tuple in `memo`, so threads with different S
+    classes never see one's class with the other's state.
+
+    """
+    __slots__ = ('parent', 'step', 'fingerprint', 'memo')
+
+    def __init__(self, parent, step):
+        self.parent = parent
+        self.step = step
+        self.fingerprint = None
+        self.memo = None
+
+    def __iter__(self):
+        """Iterates over the steps from the newest to the oldest."""
+        node = self
+        while node is not None:
+            yield node.step
+            node = node.parent
+
+
+def _cons_to_list(cons):
+    """Converts a (parent, item) cons chain into a list of items."""
+    items = []
+    while cons is not None:
+        cons, item = cons
+        items.append(item)
+    items.reverse()
+    return items
+
+
+class _QueryState(object):
+    """Partially compiled query accumulated from the steps of an S.
+
+    States are never mutated once they're attached to a step node.
+    Each step copies the state it's based on and then replaces the
+    bits that it changes. Filters and queries are accumulated in
+    (parent, item) cons chains, so that copy is constant time.
+
+    """
+    def __init__(self):
+        self.filters = None
+        self.filters_raw = None
+        self.queries = None
+        self.query_raw = None
+        self.sort = []
+        self.dict_fields = frozenset()
+        self.list_fields = frozenset()
+        self.facets = {}
+        self.facets_raw = {}
+        self.demote = None
+        self.highlight_fields = frozenset()
+        self.highlight_options = {}
+        self.explain = False
+        self.optimize = None
+        self.bool_filters = None
+        self.as_list = self.as_dict = False
+
+    def copy(self):
+        new = _QueryState.__new__(_QueryState)
+        new.__dict__.update(self.__dict__)
+        return new
+
+
 class PythonMixin(object):
     """Mixin that provides ES results fixing"""
+    __slots__ = ()
+
     def to_python(self, obj):
         """Converts strings in a data structure to Python types
 
@@ -380,7 +1298,7 @@ class PythonMixin(object):
         return obj
 
 
-class S(PythonMixin):
+class S(PythonMixin, SlotPickleMixin):
     """Represents a lazy Elasticsearch Search API request.
 
     The API for `S` takes inspiration from Django's QuerySet.
@@ -393,6 +1311,11 @@ class S(PythonMixin):
     over it, calling ``.count``, doing ``len(s)``, or calling
     ``.facet_count``.
 
+    ``s.steps`` is a tuple of the ``(action, value)`` steps the `S`
+    was built with. The steps are shared with the `S` instances
+    cloned from it, so they can't be changed in place; set
+    ``s.steps`` to a new sequence instead.
+
 
     **Adding support for other queries**
 
@@ -452,7 +1375,67 @@ class S(PythonMixin):
         s = FunkyS().filter(F(foo__funkyfilter='bar'))
         s = FunkyS().filter(foo__funkyfilter='bar')
 
+
+    .. Note::
+
+       ``process_query_ACTION`` and ``process_filter_ACTION`` methods
+       are looked up once per class the first time a search of that
+       class is compiled, so define them on the class rather than
+       adding them afterwards.
+
     """
+    __slots__ = ('type', '_steps_tail', 'start', 'stop', 'as_list',
+                 'as_dict', 'fields', 'field_boosts', '_results_cache',
+                 '_compiled', '_params', '_total', '__weakref__')
+
+    #: Whether filters are optimized when the optimize step isn't
+    #: used. Set this to True on S or a subclass to optimize filters
+    #: for all searches. See :py:meth:`optimize`.
+    default_optimize = False
+
+    #: Whether filters are compiled to bool filters when the
+    #: bool_filters step isn't used. Set this to True on S or a
+    #: subclass to do it for all searches. See :py:meth:`bool_filters`.
+    default_bool_filters = False
+
+    #: Something with a ``search(s)`` method that executes searches
+    #: for this class, like a
+    #: :py:class:`elasticutils.dispatch.MSearchDispatcher` which
+    #: coalesces searches from many threads into multi search
+    #: requests. None executes each search with its own request.
+    default_dispatcher = None
+
+    #: Something with a ``raw(s)`` method that executes searches for
+    #: this class, like a :py:class:`elasticutils.hedge.Hedger` which
+    #: sends slow searches again to another host and takes the first
+    #: response. None sends each search once. The dispatcher goes
+    #: first if there is one.
+    default_hedger = None
+
+    #: Seconds the total of a search is kept in a process-wide cache
+    #: keyed by its fingerprint, so ``count()`` on an equivalent
+    #: search doesn't make a request. Totals change as documents are
+    #: indexed, so this is 0, which turns the cache off, by default.
+    default_count_ttl = 0
+
+    #: Seconds the response of a search that found nothing is kept in
+    #: a process-wide cache keyed by its fingerprint, so executing an
+    #: equivalent search, or any slice of one, doesn't make a request.
+    #: This is 0, which turns the cache off, by default.
+    default_empty_ttl = 0
+
+    #: Seconds the responses of searches, counts and facets are kept
+    #: in the result cache, see :py:mod:`elasticutils.cache`, unless
+    #: ``cache()`` says otherwise. This is 0, which turns the cache
+    #: off, by default.
+    default_result_ttl = 0
+
+    #: Whether a search waits for an identical search that another
+    #: thread is executing, rather than sending its own request. It
+    #: gets its own results built from the other search's response.
+    #: See :py:func:`elasticutils.single_flight_info`.
+    default_single_flight = False
+
     def __init__(self, type_=None):
         """Create and return an S.
 
@@ -460,12 +1443,15 @@ class S(PythonMixin):
 
         """
         self.type = type_
-        self.steps = []
+        self._steps_tail = None
         self.start = 0
         self.stop = None
         self.as_list = self.as_dict = False
         self.field_boosts = {}
         self._results_cache = None
+        self._compiled = None
+        self._params = None
+        self._total = None
 
     def __repr__(self):
         try:
@@ -476,14 +1462,36 @@ class S(PythonMixin):
             # calls _build_query and ...
             return repr(self.steps)
 
+    def _get_steps(self):
+        if self._steps_tail is None:
+            return ()
+        steps = list(self._steps_tail)
+        steps.reverse()
+        return tuple(steps)
+
+    def _set_steps(self, steps):
+        self._steps_tail = None
+        for step in steps:
+            self._add_step(step)
+
+    #: Tuple of (action, value) steps this S was built with. Set it
+    #: to a new sequence to change them.
+    steps = property(_get_steps, _set_steps)
+
+    def _add_step(self, step):
+        self._steps_tail = _StepNode(self._steps_tail, step)
+
     def _clone(self, next_step=None):
         new = self.__class__(self.type)
-        new.steps = list(self.steps)
+        # Clones share the chain of steps and field boosts with their
+        # parent. Neither is ever mutated in place.
+        new._steps_tail = self._steps_tail
         if next_step:
-            new.steps.append(next_step)
+            new._add_step(next_step)
         new.start = self.start
         new.stop = self.stop
-        new.field_boosts = self.field_boosts.copy()
+        new.field_boosts = self.field_boosts
+        new._params = self._params
         return new
 
     def es(self, **settings):
@@ -522,6 +1530,76 @@ class S(PythonMixin):
         """
         return self._clone(next_step=('explain', value))
 
+    def optimize(self, value=True):
+        """
+        Return a new S instance with filter optimization set.
+
+        When this is on, the filter clause is rewritten before it's
+        sent to Elasticsearch:
+
+        * nested ``and`` in ``and`` and ``or`` in ``or`` are flattened
+        * duplicate clauses are removed
+        * ``term`` filters on the same field in an ``or`` are merged
+          into a single ``terms`` filter
+        * ``not`` of a ``not`` is removed
+        * cheap term filters are put ahead of range and prefix filters
+          which are put ahead of everything else
+
+        The optimized filter matches the same documents as the
+        original. Filters specified with ``.filter_raw()`` are left
+        alone.
+
+        To optimize filters for every search, set
+        ``S.default_optimize = True``.
+
+        """
+        return self._clone(next_step=('optimize', value))
+
+    def bool_filters(self, value=True):
+        """
+        Return a new S instance with bool filter compilation set.
+
+        By default, F trees are compiled to ``and``, ``or`` and
+        ``not`` filters which Elasticsearch evaluates document by
+        document. When this is on, they're compiled to ``bool``
+        filters with ``must``, ``should`` and ``must_not`` clauses
+        which Elasticsearch can run with cached bitsets. Clauses that
+        can't use bitsets like scripts and geo filters stay in an
+        ``and`` or ``or`` after the ``bool`` filter.
+
+        The compiled filter matches the same documents either way.
+        Filters specified with ``.filter_raw()`` are left alone.
+
+        To do this for every search, set
+        ``S.default_bool_filters = True``.
+
+        """
+        return self._clone(next_step=('bool_filters', value))
+
+    def cache(self, ttl):
+        """
+        Return a new S instance that caches its results.
+
+        :arg ttl: the seconds to keep the results in the result cache;
+            0 doesn't cache them
+
+        Executing the search, ``count()`` and ``facet_counts()`` use a
+        cached response of an identical request to the same indexes
+        and doctypes if there is one. Otherwise they cache theirs for
+        `ttl` seconds. Indexing with :py:class:`elasticutils.Indexable`
+        invalidates the cached results for the index.
+
+        For example:
+
+        >>> s = S().filter(category='news').facet('author').cache(60)
+
+        To cache results for every search, set
+        ``S.default_result_ttl``. See :py:mod:`elasticutils.cache` for
+        the backends.
+
+        """
+        return self._clone(next_step=('cache', ttl))
+
     def values_list(self, *fields):
         """
         Return a new S instance that returns ListSearchResults.
@@ -801,7 +1879,7 @@ class S(PythonMixin):
 
         """
         new = self._clone()
-        new.field_boosts.update(kw)
+        new.field_boosts = dict(self.field_boosts, **kw)
         return new
 
     def demote(self, amount_, *queries, **kw):
@@ -907,9 +1985,9 @@ class S(PythonMixin):
         for key, vals in kw.items():
             assert key in actions
             if hasattr(vals, 'items'):
-                new.steps.append((key, vals.items()))
+                new._add_step((key, vals.items()))
             else:
-                new.steps.append((key, vals))
+                new._add_step((key, vals))
         return new
 
     def __getitem__(self, k):
@@ -922,76 +2000,221 @@ class S(PythonMixin):
             new.start, new.stop = k, k + 1
             return list(new)[0]
 
+    def _fingerprint(self, sliced=True):
+        """Returns a hashable key identifying the compiled query
+
+        Two S instances with the same fingerprint build the same
+        query, so the compiled form can be shared between them.
+        Returns None if the search contains something that can't be
+        fingerprinted in which case it won't be cached.
+
+        :arg sliced: if False, the key is the same for any slice of
+            the search
+
+        """
+        steps = []
+        node = self._steps_tail
+        try:
+            while node is not None:
+                if node.fingerprint is None:
+                    node.fingerprint = _fingerprint(node.step)
+                steps.append(node.fingerprint)
+                node = node.parent
+            return (self.__class__,
+                    tuple(steps),
+                    self.start if sliced else None,
+                    self.stop if sliced else None,
+                    _fingerprint(self.field_boosts),
+                    self.default_optimize,
+                    self.default_bool_filters)
+        except _Unfingerprintable:
+            return None
+
     def _build_query(self):
         """
-        Loop self.steps to build the query format that will be sent to
-        Elasticsearch, and return it as a dict.
+        Build the query format that will be sent to Elasticsearch, and
+        return it as a dict.
+
+        Compiled queries are cached on the S and in a process-wide
+        cache keyed by :py:meth:`_fingerprint`. Since S is
+        clone-on-write, the cache never needs invalidating.
+
+        .. Note::
+
+           The returned dict is shared between equivalent searches, so
+           don't mutate it.
+
         """
-        filters = []
-        filters_raw = None
-        queries = []
-        query_raw = None
-        sort = []
-        dict_fields = set()
-        list_fields = set()
-        facets = {}
-        facets_raw = {}
-        demote = None
-        highlight_fields = set()
-        highlight_options = {}
-        explain = False
-        as_list = as_dict = False
-        for action, value in self.steps:
-            if action == 'order_by':
-                sort = []
-                for key in value:
-                    if key.startswith('-'):
-                        sort.append({key[1:]: 'desc'})
-                    else:
-                        sort.append(key)
-            elif action == 'values_list':
-                if not value:
-                    list_fields = set()
-                else:
-                    list_fields |= set(value)
-                as_list, as_dict = True, False
-            elif action == 'values_dict':
-                if not value:
-                    dict_fields = set()
-                else:
-                    dict_fields |= set(value)
-                as_list, as_dict = False, True
-            elif action == 'explain':
-                explain = value
-            elif action == 'query':
-                queries.append(value)
-            elif action == 'query_raw':
-                query_raw = value
-            elif action == 'demote':
-                # value here is a tuple of (negative_boost, query)
-                demote = value
-            elif action == 'filter':
-                filters.extend(self._process_filters(value))
-            elif action == 'filter_raw':
-                filters_raw = value
-            elif action == 'facet':
-                # value here is a (args, kwargs) tuple
-                facets.update(_process_facets(*value))
-            elif action == 'facet_raw':
-                facets_raw.update(dict(value))
-            elif action == 'highlight':
-                if value[0] == (None,):
-                    highlight_fields = set()
+        compiled = self._compiled
+        if compiled is None:
+            key = self._fingerprint()
+            if key is not None:
+                compiled = _query_cache.get(key)
+            if compiled is None:
+                compiled = self._compile_query()
+                if key is not None:
+                    _query_cache.set(key, compiled)
+
+            if self._params is not None:
+                # This S was bound from a prepared search, so fill in
+                # the param values.
+                template = None
+                if key is not None:
+                    template = _template_cache.get(key)
+                if template is None:
+                    template = _compile_template(compiled[0])
+                    if key is not None and template is not None:
+                        _template_cache.set(key, template)
+                if template is not None:
+                    compiled = (template(self._params),) + compiled[1:]
+
+            self._compiled = compiled
+
+        qs, self.fields, self.as_list, self.as_dict = compiled
+        return qs
+
+    def prepare(self):
+        """
+        Compile this S into a :py:class:`elasticutils.PreparedS` which
+        you can bind :py:class:`elasticutils.Param` values to.
+
+        For example::
+
+            prepared = (S().filter(category=Param('cat'))
+                           .query(title__match=Param('q'))
+                           .prepare())
+
+            for cat, q in searches:
+                results = prepared.bind(cat=cat, q=q).execute()
+
+        Binding values substitutes them into the precompiled query,
+        so the search isn't compiled again.
+
+        """
+        return PreparedS(self)
+
+    def _get_state(self):
+        """Returns the _QueryState for all the steps of this S
+
+        States are memoized on the step nodes, so this only folds the
+        steps that were added since the last time a state was built
+        for an S sharing this chain.
+
+        """
+        cls = self.__class__
+        pending = []
+        state = None
+        node = self._steps_tail
+        while node is not None:
+            # Read it once: another thread can replace it.
+            memo = node.memo
+            if memo is not None and memo[0] is cls:
+                state = memo[1]
+                break
+            pending.append(node)
+            node = node.parent
+
+        if state is None:
+            state = _QueryState()
+        for node in reversed(pending):
+            state = self._fold_step(state, node.step)
+            node.memo = (cls, state)
+        return state
+
+    def _fold_step(self, state, step):
+        """Returns a new _QueryState with step applied to state."""
+        action, value = step
+        if action in ('es', 'indexes', 'doctypes', 'boost', 'cache'):
+            # Ignore these--we use these elsewhere, but want to make
+            # sure lack of handling it here doesn't throw an error.
+            return state
+
+        state = state.copy()
+        if action == 'order_by':
+            sort = []
+            for key in value:
+                if key.startswith('-'):
+                    sort.append({key[1:]: 'desc'})
                 else:
-                    highlight_fields |= set(value[0])
-                highlight_options.update(value[1])
-            elif action in ('es', 'indexes', 'doctypes', 'boost'):
-                # Ignore these--we use these elsewhere, but want to
-                # make sure lack of handling it here doesn't throw an
-                # error.
-                pass
+                    sort.append(key)
+            state.sort = sort
+        elif action == 'values_list':
+            if not value:
+                state.list_fields = frozenset()
+            else:
+                state.list_fields = state.list_fields.union(value)
+            state.as_list, state.as_dict = True, False
+        elif action == 'values_dict':
+            if not value:
+                state.dict_fields = frozenset()
             else:
-                raise NotImplementedError(action)
+                state.dict_fields = state.dict_fields.union(value)
+            state.as_list, state.as_dict = False, True
+        elif action == 'explain':
+            state.explain = value
+        elif action == 'optimize':
+            state.optimize = value
+        elif action == 'bool_filters':
+            state.bool_filters = value
+        elif action == 'query':
+            state.queries = (state.queries, value)
+        elif action == 'query_raw':
+            state.query_raw = value
+        elif action == 'demote':
+            # value here is a tuple of (negative_boost, query)
+            state.demote = value
+        elif action == 'filter':
+            processed = self._process_filters(value)
+            if processed:
+                state.filters = (state.filters, processed)
+        elif action == 'filter_raw':
+            state.filters_raw = value
+        elif action == 'facet':
+            # value here is a (args, kwargs) tuple
+            state.facets = dict(state.facets)
+            state.facets.update(_process_facets(*value))
+        elif action == 'facet_raw':
+            state.facets_raw = dict(state.facets_raw)
+            state.facets_raw.update(dict(value))
+        elif action == 'highlight':
+            if value[0] == (None,):
+                state.highlight_fields = frozenset()
+            else:
+                state.highlight_fields = state.highlight_fields.union(
+                    value[0])
+            state.highlight_options = dict(state.highlight_options)
+            state.highlight_options.update(value[1])
+        else:
+            raise NotImplementedError(action)
+        return state
+
+    def _compile_query(self):
+        """
+        Build the query format that will be sent to Elasticsearch from
+        the partially compiled state of the steps.
+
+        :returns: tuple of (query dict, fields, as_list, as_dict)
+
+        """
+        state = self._get_state()
+        filters = []
+        for chunk in _cons_to_list(state.filters):
+            filters.extend(chunk)
+        filters_raw = state.filters_raw
+        queries = _cons_to_list(state.queries)
+        query_raw = state.query_raw
+        sort = state.sort
+        dict_fields = state.dict_fields
+        list_fields = state.list_fields
+        # The facet dicts get facet_filter filled in below, so they're
+        # copied to keep the shared state pristine.
+        facets = dict((key, dict(val)) for key, val in state.facets.items())
+        facets_raw = state.facets_raw
+        demote = state.demote
+        highlight_fields = state.highlight_fields
+        highlight_options = state.highlight_options
+        explain = state.explain
+        as_list, as_dict = state.as_list, state.as_dict
 
         qs = {}
 
@@ -1004,6 +2227,18 @@ class S(PythonMixin):
             elif filters:
                 qs['filter'] = filters[0]
 
+            optimize = state.optimize
+            if optimize is None:
+                optimize = self.default_optimize
+            if optimize and 'filter' in qs:
+                qs['filter'] = _optimize_filter(qs['filter'])
+
+            bool_filters = state.bool_filters
+            if bool_filters is None:
+                bool_filters = self.default_bool_filters
+            if bool_filters and 'filter' in qs:
+                qs['filter'] = _bool_filter(qs['filter'])
+
         # If there's a query_raw, we use that. Otherwise we use
         # whatever we got from query and demote.
         if query_raw:
@@ -1058,8 +2293,7 @@ class S(PythonMixin):
         if explain:
             qs['explain'] = True
 
-        self.fields, self.as_list, self.as_dict = fields, as_list, as_dict
-        return qs
+        return qs, fields, as_list, as_dict
 
     def _build_highlight(self, fields, options):
         """Return the portion of the query that controls highlighting."""
@@ -1068,74 +2302,108 @@ class S(PythonMixin):
         ret.update(options)
         return ret
 
+    @classmethod
+    def _get_dispatch(cls, kind):
+        """Returns the field action dispatch table for this class
+
+        :arg kind: either ``'filter'`` or ``'query'``
+
+        :returns: dict of field action -> (handler, custom) where
+            custom is True if the handler is a ``process_KIND_ACTION``
+            method and False if it's one of the built-in handlers
+
+        The table is built the first time it's needed for each class
+        and includes ``process_filter_*`` and ``process_query_*``
+        methods defined on the class and its superclasses.
+
+        """
+        attr = '_filter_dispatch' if kind == 'filter' else '_query_dispatch'
+        dispatch = cls.__dict__.get(attr)
+        if dispatch is None:
+            builtins = (_FILTER_HANDLERS if kind == 'filter'
+                        else _QUERY_HANDLERS)
+            dispatch = dict((action, (handler, False))
+                            for action, handler in builtins.items())
+
+            prefix = 'process_{0}_'.format(kind)
+            for name in dir(cls):
+                if name.startswith(prefix) and len(name) > len(prefix):
+                    dispatch[name[len(prefix):]] = (
+                        _get_handler(cls, name), True)
+            setattr(cls, attr, dispatch)
+        return dispatch
+
     def _process_filters(self, filters):
         """Takes a list of filters and returns ES JSON API
 
-        :arg filters: list of F, (key, val) tuples, or dicts
+        :arg filters: list of F, F tree nodes, (key, val) tuples, or
+            dicts
 
         :returns: list of ES JSON API filters
 
         """
+        dispatch = self._get_dispatch('filter')
         rv = []
         for f in filters:
-            if isinstance(f, F):
-                if f.filters:
-                    rv.extend(self._process_filters(f.filters))
+            if f.__class__ is not tuple:
+                if isinstance(f, F):
+                    items = f._get_items()
+                    if items:
+                        rv.extend(self._process_filters(items))
                     continue
 
-            elif isinstance(f, dict):
-                key = f.keys()[0]
-                val = f[key]
-                key = key.strip('_')
-
-                if key not in ('or', 'and', 'not', 'filter'):
-                    raise InvalidFieldActionError(
-                        '%s is not a valid connector' % f.keys()[0])
+                elif isinstance(f, _Connector):
+                    rv.append({f.conn: self._process_filters(f.children())})
+                    continue
 
-                if 'filter' in val:
-                    filter_filters = self._process_filters(val['filter'])
+                elif isinstance(f, _Not):
+                    filter_filters = self._process_filters(f.items)
                     if len(filter_filters) == 1:
                         filter_filters = filter_filters[0]
-                    rv.append({key: {'filter': filter_filters}})
-                else:
-                    rv.append({key: self._process_filters(val)})
+                    rv.append({'not': {'filter': filter_filters}})
+                    continue
 
-            else:
-                key, val = f
-                key, field_action = split_field_action(key)
-                handler_name = 'process_filter_{0}'.format(field_action)
-
-                if field_action and hasattr(self, handler_name):
-                    rv.append(getattr(self, handler_name)(
-                            key, val, field_action))
-
-                elif key.strip('_') in ('or', 'and', 'not'):
-                    connector = key.strip('_')
-                    rv.append({connector: self._process_filters(val.items())})
-
-                elif field_action is None:
-                    if val is None:
-                        rv.append({'missing': {
-                                    'field': key, "null_value": True}})
+                elif isinstance(f, dict):
+                    key = f.keys()[0]
+                    val = f[key]
+                    key = key.strip('_')
+
+                    if key not in ('or', 'and', 'not', 'filter'):
+                        raise InvalidFieldActionError(
+                            '%s is not a valid connector' % f.keys()[0])
+
+                    if 'filter' in val:
+                        filter_filters = self._process_filters(val['filter'])
+                        if len(filter_filters) == 1:
+                            filter_filters = filter_filters[0]
+                        rv.append({key: {'filter': filter_filters}})
                     else:
-                        rv.append({'term': {key: val}})
+                        rv.append({key: self._process_filters(val)})
+                    continue
 
-                elif field_action in ('startswith', 'prefix'):
-                    rv.append({'prefix': {key: val}})
+            # Otherwise it's a (key, val) pair. These are the bulk of
+            # the filters, so this is inlined and does a single lookup
+            # in the dispatch table.
+            key, val = f
+            if '__' in key:
+                key, field_action = key.rsplit('__', 1)
+            else:
+                field_action = None
+            handler, custom = dispatch.get(field_action, _NO_HANDLER)
 
-                elif field_action == 'in':
-                    rv.append({'in': {key: val}})
+            if custom:
+                rv.append(handler(self, key, val, field_action))
 
-                elif field_action in RANGE_ACTIONS:
-                    rv.append({'range': {key: {field_action: val}}})
+            elif key.strip('_') in ('or', 'and', 'not'):
+                connector = key.strip('_')
+                rv.append({connector: self._process_filters(val.items())})
 
-                elif field_action == 'range':
-                    lower, upper = val
-                    rv.append({'range': {key: {'gte': lower, 'lte': upper}}})
+            elif handler is not None:
+                rv.append(handler(key, val, field_action))
 
-                else:
-                    raise InvalidFieldActionError(
-                        '%s is not a valid field action' % field_action)
+            else:
+                raise InvalidFieldActionError(
+                    '%s is not a valid field action' % field_action)
 
         return rv
 
@@ -1149,45 +2417,14 @@ class S(PythonMixin):
         if boost is None:
             boost = self.field_boosts.get(field_name)
 
-        handler_name = 'process_query_{0}'.format(field_action)
-
-        if field_action and hasattr(self, handler_name):
-            return getattr(self, handler_name)(field_name, val, field_action)
-
-        elif field_action in QUERY_ACTION_MAP:
-            return {
-                QUERY_ACTION_MAP[field_action]: _boosted_value(
-                    field_name, field_action, key, val, boost)
-            }
-
-        elif field_action == 'query_string':
-            # query_string has different syntax, so it's handled
-            # differently.
-            #
-            # Note: query_string queries are not boosted with
-            # .boost()---they're boosted in the query text itself.
-            return {
-                'query_string': {'default_field': field_name, 'query': val}
-            }
-
-        elif field_action in RANGE_ACTIONS:
-            # Ranges are special and have a different syntax, so
-            # we handle them separately.
-            return {
-                'range': {field_name: _boosted_value(
-                        field_action, field_action, key, val, boost)}
-           }
-
-        elif field_action == 'range':
-            lower, upper = val
-            value = {
-                'gte': lower,
-                'lte': upper,
-            }
-            if boost:
-                value['boost'] = boost
-
-            return {'range': {field_name: value}}
+        handler, custom = self._get_dispatch('query').get(
+            field_action, _NO_HANDLER)
+
+        if custom:
+            return handler(self, field_name, val, field_action)
+
+        elif handler is not None:
+            return handler(field_name, key, val, field_action, boost)
 
         raise InvalidFieldActionError(
             '%s is not a valid field action' % field_action)
@@ -1200,17 +2437,21 @@ class S(PythonMixin):
         :returns: dict which is the query clause value
 
         """
-        # First, let's mush everything into a single Q. Then we can
-        # parse that into bits.
-        new_q = Q()
-
+        # First, let's mush everything into a single set of clauses.
+        # This is what adding the Qs together would do, but without
+        # copying the lists for every Q.
+        should_q = []
+        must_q = []
+        must_not_q = []
         for query in queries:
-            new_q += query
+            should_q.extend(query.should_q)
+            must_q.extend(query.must_q)
+            must_not_q.extend(query.must_not_q)
 
-        # Now we have a single Q that needs to be processed.
-        should_q = [self._process_query(query) for query in new_q.should_q]
-        must_q = [self._process_query(query) for query in new_q.must_q]
-        must_not_q = [self._process_query(query) for query in new_q.must_not_q]
+        # Now we have a single set of clauses that need processing.
+        should_q = [self._process_query(query) for query in should_q]
+        must_q = [self._process_query(query) for query in must_q]
+        must_not_q = [self._process_query(query) for query in must_not_q]
 
         if len(must_q) > 1 or (len(should_q) + len(must_not_q) > 0):
             # If there's more than one must_q or there are must_not_q
@@ -1250,14 +2491,150 @@ class S(PythonMixin):
         Perform the search, then convert that raw format into a
         SearchResults instance and return it.
         """
-        if not self._results_cache:
-            response = self.raw()
-            ResultsClass = self.get_results_class()
-            results = self.to_python(response.get('hits', {}).get('hits', []))
-            self._results_cache = ResultsClass(
-                self.type, response, results, self.fields)
+        # SearchResults with no hits are falsy, so this checks for
+        # None rather than truth.
+        if self._results_cache is None:
+            response = self._cached_empty_response()
+            if response is not None:
+                # This sets fields, as_list and as_dict, which the
+                # results depend on.
+                self._build_query()
+                self._results_cache = self._results_from_response(response)
+            else:
+                self._results_cache = self._fetch_results()
+                if not self._results_cache.count:
+                    self._set_empty_response(self._results_cache.response)
+            self._set_total(self._results_cache.count)
         return self._results_cache
 
+    def _fetch_results(self):
+        """Returns results from the result cache, an identical search
+        in flight or a new request"""
+        serializer = self.get_serializer()
+        body = None
+        if self._result_ttl() or self.default_single_flight:
+            body = serializer.dumps(self._build_query())
+
+        key = self._result_key('search', body)
+        response = self._cached_result(key)
+        if response is not None:
+            return self._results_from_response(response)
+
+        if not self.default_single_flight:
+            return self._search_and_cache(key)
+
+        def share(results):
+            try:
+                return serializer.dumps(results.response)
+            except TypeError:
+                # to_python turned something into something that
+                # can't be serialized, so the others search themselves.
+                return None
+
+        index, doc_type = self._search_path()
+        flight_key = (id(self.get_es()), index, doc_type, body)
+        results, leader = _single_flight.do(
+            flight_key, lambda: self._search_and_cache(key), share)
+        if leader:
+            return results
+        return self._results_from_response(serializer.loads(results))
+
+    def _search_and_cache(self, key):
+        """Executes the search and caches the response if key isn't None"""
+        dispatcher = self.default_dispatcher
+        if dispatcher is not None:
+            results = dispatcher.search(self)
+            self._cache_result(key, results.response)
+            return results
+        hedger = self.default_hedger
+        if hedger is not None:
+            # Compile it first so the hedger's requests don't both do
+            # it.
+            self._build_query()
+            response = hedger.raw(self)
+        else:
+            response = self.raw()
+        # Cache it before to_python changes it.
+        self._cache_result(key, response)
+        return self._results_from_response(response)
+
+    def get_result_cache(self):
+        """Returns the result cache backend to use.
+
+        This returns the one set with
+        :py:func:`elasticutils.cache.set_result_cache`. Override it to
+        use a different one for a subclass.
+
+        """
+        return get_result_cache()
+
+    def _result_ttl(self):
+        """Returns the seconds to cache results for"""
+        for action, value in self._steps_tail or ():
+            if action == 'cache':
+                return value
+        return self.default_result_ttl
+
+    def _result_key(self, kind, body):
+        """Returns the result cache key for a request or None
+
+        :arg kind: ``'search'`` or ``'count'``
+        :arg body: the serialized request body
+
+        Returns None if results aren't cached.
+
+        """
+        if not self._result_ttl():
+            return None
+        index, doc_type = self._search_path()
+        return make_key(kind, index, doc_type, body,
+                        self.get_result_cache().generations_for(index))
+
+    def _cached_result(self, key):
+        """Returns the cached response for key or None"""
+        if key is None:
+            return None
+        cached = self.get_result_cache().get(key)
+        if cached is None:
+            return None
+        return self.get_serializer().loads(cached)
+
+    def _cache_result(self, key, response):
+        """Caches a response if key isn't None"""
+        if key is None:
+            return
+        try:
+            cached = self.get_serializer().dumps(response)
+        except TypeError:
+            # to_python turned something into something that can't be
+            # serialized.
+            return
+        self.get_result_cache().set(key, cached, self._result_ttl())
+
+    def _cached_empty_response(self):
+        """Returns the cached response if this finds nothing or None"""
+        if self.default_empty_ttl:
+            key = self._count_key()
+            if key is not None:
+                cached = _empty_cache.get(key)
+                if cached is not None and cached[0] > time.time():
+                    return cached[1]
+        return None
+
+    def _set_empty_response(self, response):
+        """Remembers the response of a search that found nothing"""
+        ttl = self.default_empty_ttl
+        if ttl:
+            key = self._count_key()
+            if key is not None:
+                _empty_cache.set(key, (time.time() + ttl, response))
+
+    def _results_from_response(self, response):
+        """Converts a search response into a SearchResults instance"""
+        ResultsClass = self.get_results_class()
+        results = self.to_python(response.get('hits', {}).get('hits', []))
+        return ResultsClass(self.type, response, results, self.fields)
+
     def get_es(self, default_builder=get_es):
         """Returns the ElasticSearch object to use.
 
@@ -1272,20 +2649,31 @@ class S(PythonMixin):
            this method.
 
         """
-        # .es() calls are incremental, so we go through them all and
-        # update bits that are specified.
+        # .es() calls are incremental and later ones win. The steps
+        # go from the newest, so keep the first value of each setting.
         args = {}
-        for action, value in self.steps:
+        for action, value in self._steps_tail or ():
             if action == 'es':
-                args.update(**value)
+                for key, val in value.items():
+                    args.setdefault(key, val)
 
         # TODO: store the ElasticSearch on the S if we've already
         # created one since we don't need to do it multiple times.
         return default_builder(**args)
 
+    def get_serializer(self):
+        """Returns the serializer to use for the request body.
+
+        This returns the one set with
+        :py:func:`elasticutils.serializers.set_serializer`. Override
+        it to use a different serializer for a subclass.
+
+        """
+        return get_serializer()
+
     def get_indexes(self, default_indexes=DEFAULT_INDEXES):
         """Returns the list of indexes to act on."""
-        for action, value in reversed(self.steps):
+        for action, value in self._steps_tail or ():
             if action == 'indexes':
                 return list(value)
 
@@ -1299,7 +2687,7 @@ class S(PythonMixin):
 
     def get_doctypes(self, default_doctypes=DEFAULT_DOCTYPES):
         """Returns the list of doctypes to use."""
-        for action, value in reversed(self.steps):
+        for action, value in self._steps_tail or ():
             if action == 'doctypes':
                 return list(value)
 
@@ -1308,14 +2696,12 @@ class S(PythonMixin):
 
         return default_doctypes
 
-    def raw(self):
-        """
-        Build query and passes to Elasticsearch, then returns the raw
-        format returned.
-        """
-        qs = self._build_query()
-        es = self.get_es()
+    def _search_path(self):
+        """Returns the comma-delimited ``(indexes, doctypes)`` to search
 
+        :raises BadSearch: if there are doctypes but no indexes
+
+        """
         index = self.get_indexes()
         doc_type = self.get_doctypes()
 
@@ -1323,9 +2709,24 @@ class S(PythonMixin):
             raise BadSearch(
                 'You must specify an index if you are specifying doctypes.')
 
-        hits = es.search(qs,
-                         index=self.get_indexes(),
-                         doc_type=self.get_doctypes())
+        return _join_names(index), _join_names(doc_type)
+
+    def raw(self):
+        """
+        Build query and passes to Elasticsearch, then returns the raw
+        format returned.
+        """
+        qs = self._build_query()
+        es = self.get_es()
+        index, doc_type = self._search_path()
+
+        # The body is serialized here rather than by pyelasticsearch
+        # so it goes through our serializer.
+        hits = es.send_request(
+            'GET',
+            [index, doc_type, '_search'],
+            self.get_serializer().dumps(qs),
+            encode_body=False)
 
         log.debug('[%s] %s' % (hits['took'], qs))
         return hits
@@ -1341,11 +2742,111 @@ class S(PythonMixin):
         >>> s = S().query(name__prefix='Jimmy')
         >>> count = s.count()
 
+        If the search was executed, this uses the total from its
+        results. Otherwise it sends a ``count`` search type request,
+        which doesn't fetch any hits, and remembers the total. See
+        ``default_count_ttl`` for sharing totals between equivalent
+        searches.
+
         """
-        if self._results_cache:
+        total = self._cached_total()
+        if total is None:
+            body = self._count_body()
+            key = None
+            if self._result_ttl():
+                key = self._result_key(
+                    'count', self.get_serializer().dumps(body))
+            response = self._cached_result(key)
+            if response is None:
+                response = self._count_raw(body)
+                self._cache_result(key, response)
+            total = response['hits']['total']
+            self._set_total(total)
+        return total
+
+    def _count_key(self):
+        """Returns the count cache key or None if it can't be cached"""
+        key = self._fingerprint(sliced=False)
+        if key is not None and self._params is not None:
+            try:
+                key = (key, _fingerprint(self._params))
+            except _Unfingerprintable:
+                key = None
+        if key is not None:
+            # The steps don't say what's searched when it comes from
+            # the mapping type or the defaults.
+            key = (self._search_path(), key)
+        return key
+
+    def _cached_total(self):
+        """Returns the total if it's known without a request or None"""
+        if self._results_cache is not None:
             return self._results_cache.count
-        else:
-            return self[:0].raw()['hits']['total']
+        if self._total is not None:
+            return self._total
+        if self._cached_empty_response() is not None:
+            self._total = 0
+            return 0
+
+        if self.default_count_ttl:
+            key = self._count_key()
+            if key is not None:
+                cached = _count_cache.get(key)
+                if cached is not None and cached[0] > time.time():
+                    self._total = cached[1]
+                    return self._total
+        return None
+
+    def _set_total(self, total):
+        """Remembers the total on this S and in the count cache"""
+        self._total = total
+        ttl = self.default_count_ttl
+        if ttl:
+            key = self._count_key()
+            if key is not None:
+                _count_cache.set(key, (time.time() + ttl, total))
+
+    def _count_body(self):
+        """Returns the parts of the query that affect the total"""
+        qs = self._build_query()
+        return dict((key, qs[key]) for key in ('query', 'filter', 'min_score')
+                    if key in qs)
+
+    def _count_raw(self, body=None):
+        """Sends a count request and returns the raw response
+
+        This uses the ``count`` search type, so Elasticsearch doesn't
+        fetch hits. Only the parts of the query that affect the total
+        are sent.
+
+        """
+        if body is None:
+            body = self._count_body()
+        index, doc_type = self._search_path()
+
+        hits = self.get_es().send_request(
+            'GET',
+            [index, doc_type, '_search'],
+            self.get_serializer().dumps(body),
+            query_params={'search_type': 'count'},
+            encode_body=False)
+
+        log.debug('[%s] count %s' % (hits['took'], body))
+        return hits
+
+    def count_async(self, executor=None):
+        """
+        Like ``count()`` but runs in the background and returns a
+        `Future`.
+
+        :arg executor: the executor to use; see ``execute_async()``
+
+        :returns: :py:class:`elasticutils.futures.Future` whose result
+            is an integer
+
+        """
+        executor = executor or get_default_executor()
+        return executor.submit(self.count)
 
     def __len__(self):
         """
@@ -1388,16 +2889,214 @@ class S(PythonMixin):
 
         .. Warning::
 
-           This returns ALL search results. The way it does this is by
-           calling ``.count()`` first to figure out how many to return,
-           then by slicing by that size and returning a list of ALL
-           search results.
+           This returns ALL search results in one response. If the
+           total is known, because ``count()`` was called or the search
+           was executed, it slices by that size, and if it's 0 there's
+           no request unless the search has facets. Otherwise it asks
+           for the first ``ALL_FIRST_SIZE`` (500) results and, if there
+           are more than that, asks again for all of them.
+
+           Don't use this if you've got 1000s of results! Use
+           ``scan()`` or ``iterate()`` instead.
+
+        """
+        total = self._cached_total()
+        if total == 0:
+            results = self._known_empty_results()
+            if results is not None:
+                return results
+        if total is None:
+            results = self[:ALL_FIRST_SIZE].execute()
+            self._set_total(results.count)
+            if results.count <= ALL_FIRST_SIZE:
+                return results
+            total = results.count
+        return self[:total].execute()
+
+    def _known_empty_results(self):
+        """Returns the results of ``self[:0]`` without a request or None
+
+        This is for when the total is known to be 0. It's None if the
+        search has facets and there's no cached response to get them
+        from.
+
+        """
+        if self._results_cache is not None:
+            return self._results_cache
+        s = self[:0]
+        response = s._cached_empty_response()
+        # This sets fields, as_list and as_dict, which the results
+        # depend on.
+        qs = s._build_query()
+        if response is None:
+            if 'facets' in qs:
+                return None
+            response = {'took': 0, 'timed_out': False,
+                        'hits': {'total': 0, 'max_score': None, 'hits': []}}
+        s._results_cache = s._results_from_response(response)
+        return s._results_cache
+
+    def scan(self, batch_size=SCAN_BATCH_SIZE, scroll=SCROLL_TIMEOUT):
+        """
+        Returns a `Scroll` that iterates over all the results in
+        batches using the ``scan`` search type.
+
+        :arg batch_size: the number of results to ask each shard for
+            at a time, so a batch has up to `batch_size` times the
+            number of shards results
+        :arg scroll: how long Elasticsearch keeps the scroll open
+            between batches, like ``'1m'``
+
+        :returns: :py:class:`elasticutils.Scroll`
+
+        For example:
+
+        >>> for result in S().query(name__prefix='Jimmy').scan():
+        ...     export(result)
+
+        Only one batch is in memory at a time, so this is the way to
+        go through a lot of results. Results are converted like
+        ``execute()`` converts them. They aren't sorted, and the
+        slice of the S is ignored. Use ``iterate()`` to keep the
+        order.
+
+        """
+        return Scroll(self, batch_size, scroll, search_type='scan')
+
+    def iterate(self, batch_size=SCAN_BATCH_SIZE, scroll=SCROLL_TIMEOUT):
+        """
+        Like ``scan()``, but keeps the order of the search.
+
+        :arg batch_size: the number of results in each batch
+        :arg scroll: how long Elasticsearch keeps the scroll open
+            between batches, like ``'1m'``
+
+        :returns: :py:class:`elasticutils.Scroll`
+
+        This scrolls without the ``scan`` search type, so it's slower
+        because the shards sort the results for every batch.
+
+        """
+        return Scroll(self, batch_size, scroll)
+
+    def sliced_scan(self, slices, field=None, batch_size=SCAN_BATCH_SIZE,
+                    scroll=SCROLL_TIMEOUT, executor=None):
+        """
+        Returns a `SlicedScroll` that splits the search into disjoint
+        slices and scans them in parallel.
+
+        :arg slices: the number of slices
+        :arg field: an integer field to slice on; if None, each slice
+            searches some of the shards instead
+        :arg batch_size: the number of results to ask each shard for
+            at a time in each slice
+        :arg scroll: how long Elasticsearch keeps the scrolls open
+            between batches, like ``'1m'``
+        :arg executor: the :py:class:`elasticutils.futures.ThreadPoolExecutor`
+            to scan the slices with; by default, one with a thread per
+            slice is made for them
+
+        :returns: :py:class:`elasticutils.SlicedScroll`
+
+        For example:
+
+        >>> for result in S().indexes('logs').sliced_scan(8, 'id'):
+        ...     export(result)
+
+        With a `field`, slice ``i`` has the results where the absolute
+        value of `field` modulo `slices` is ``i`` (results without
+        the field are in slice 0). That uses a script filter, so
+        scripting has to be enabled; with a ``filter_raw()``, it's
+        ANDed with the raw filter. Without a `field`, the shards
+        are dealt out between the slices, so there are at most as
+        many slices as the index has shards.
+
+        Like ``scan()``, results aren't sorted and the slice of the S
+        is ignored.
+
+        """
+        return SlicedScroll(self, slices, field, batch_size, scroll,
+                            executor=executor)
+
+    def _order_by_fields(self):
+        """Returns the fields of the last ``order_by()``"""
+        for action, value in self._steps_tail or ():
+            if action == 'order_by':
+                return list(value)
+        return []
+
+    def keyset_page(self, per_page, cursor=None):
+        """
+        Returns a page of results after a cursor.
+
+        :arg per_page: the number of results on a page
+        :arg cursor: the ``next_cursor`` of the previous page or None
+            for the first page
+
+        :returns: :py:class:`elasticutils.KeysetPage`
+
+        :raises BadSearch: if the search isn't ordered or is ordered
+            by ``_score``
+        :raises InvalidCursorError: if the cursor is malformed or is
+            for a search with a different ordering
+
+        Unlike slicing, which makes every shard collect and sort all
+        the results up to the end of the slice, this filters on the
+        sort values of the last result of the previous page, so every
+        page costs the same however deep it is. The cursor is an
+        opaque string you can hand to a client.
+
+        For example:
+
+        >>> s = S().filter(status='open').order_by('-created', 'id')
+        >>> page = s.keyset_page(20, cursor=request.GET.get('cursor'))
+        >>> next_url = page.has_next and '?cursor=' + page.next_cursor
+
+        The last field of the ``order_by()`` has to be unique, like an
+        id, or results with the same sort values as the end of a page
+        are skipped. The sort fields should be in every document and
+        not analyzed. There's no way to jump to page n; use slicing
+        for that.
+
+        """
+        fields = self._order_by_fields()
+        if not fields:
+            raise BadSearch('keyset_page() needs an order_by().')
+        if '_score' in [field.lstrip('-') for field in fields]:
+            raise BadSearch('keyset_page() can\'t order by _score.')
+
+        s = self
+        if cursor is not None:
+            cursor_fields, values = _decode_cursor(cursor)
+            if cursor_fields != fields:
+                raise InvalidCursorError(
+                    'The cursor is for a search ordered by {0}.'.format(
+                        ', '.join(cursor_fields)))
+            s = s.filter(_keyset_filter(fields, values))
+
+        results = s[:per_page].execute()
+        next_cursor = None
+        # The total is what's left after the cursor.
+        if results.results and results.count > len(results.results):
+            next_cursor = _encode_cursor(fields, results.results[-1]['sort'])
+        return KeysetPage(results, cursor, next_cursor)
+
+    def keyset_pages(self, per_page, cursor=None):
+        """
+        Yields a :py:class:`elasticutils.KeysetPage` for each page
+        starting after `cursor`.
 
-           Don't use this if you've got 1000s of results!
+        See ``keyset_page()``. This is for going through all the
+        results in order, like ``iterate()`` does but without keeping
+        a scroll open.
 
         """
-        count = self.count()
-        return self[:count].execute()
+        while True:
+            page = self.keyset_page(per_page, cursor)
+            yield page
+            if page.next_cursor is None:
+                return
+            cursor = page.next_cursor
 
     def execute(self):
         """
@@ -1412,6 +3111,26 @@ class S(PythonMixin):
         """
         return self._do_search()
 
+    def execute_async(self, executor=None):
+        """
+        Executes search in the background and returns a `Future`.
+
+        :arg executor: the :py:class:`elasticutils.futures.ThreadPoolExecutor`
+            to run the search with; defaults to the one
+            :py:func:`elasticutils.futures.get_default_executor` returns
+
+        :returns: :py:class:`elasticutils.futures.Future` whose result
+            is a `SearchResults` instance
+
+        For example:
+
+        >>> s = S().query(name__prefix='Jimmy')
+        >>> future = s.execute_async()
+        >>> results = future.result(timeout=10)
+        """
+        executor = executor or get_default_executor()
+        return executor.submit(self._do_search)
+
     def __iter__(self):
         """
         Executes search and returns an iterator of results.
@@ -1460,6 +3179,709 @@ class S(PythonMixin):
         return facets
 
 
+class PreparedS(object):
+    """A compiled S with :py:class:`elasticutils.Param` placeholders.
+
+    Don't create these directly---use :py:meth:`elasticutils.S.prepare`.
+
+    :property params: set of the param names in the search
+
+    """
+    def __init__(self, s):
+        self.s = s
+        qs = s._build_query()
+        self._compiled = (qs, s.fields, s.as_list, s.as_dict)
+        self._template = _compile_template(qs)
+        self.params = frozenset(_find_params(qs))
+
+    def __repr__(self):
+        return '<PreparedS {0}>'.format(repr(self._compiled[0]))
+
+    def bind(self, **values):
+        """Returns an S with the param values filled in.
+
+        :arg values: param name -> value for every param in the
+            search
+
+        :returns: an S of the same class as the one that was prepared.
+            You can execute it, iterate over it, slice it, etc. just
+            like any other S.
+
+        :raises MissingParamError: if a value isn't provided for every
+            param
+
+        """
+        missing = self.params.difference(values)
+        if missing:
+            raise MissingParamError(
+                'Missing values for params: {0}'.format(
+                    ', '.join(sorted(missing))))
+
+        new = self.s._clone()
+        new._params = values
+        if self._template is None:
+            new._compiled = self._compiled
+        else:
+            new._compiled = ((self._template(values),)
+                             + self._compiled[1:])
+        return new
+
+
+def _encode_cursor(fields, values):
+    """Returns an opaque cursor for sort values of fields
+
+    The values are from results, so ``to_python`` may have turned
+    strings into datetimes. They're turned back into the strings
+    Elasticsearch sent.
+
+    """
+    data = json.dumps([fields, values], separators=(',', ':'),
+                      default=to_json_default)
+    return base64.urlsafe_b64encode(data).rstrip('=')
+
+
+def _decode_cursor(cursor):
+    """Returns ``(fields, values)`` from a cursor
+
+    :raises InvalidCursorError: if the cursor isn't one
+
+    """
+    try:
+        cursor = str(cursor)
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        fields, values = json.loads(data)
+    except (TypeError, ValueError, UnicodeError):
+        raise InvalidCursorError('Invalid cursor.')
+    if (not isinstance(fields, list) or not isinstance(values, list)
+            or len(fields) != len(values)):
+        raise InvalidCursorError('Invalid cursor.')
+    return fields, values
+
+
+def _keyset_filter(fields, values):
+    """Returns an F for what sorts after values when ordered by fields
+
+    For fields ``a, -b`` that's ``a > va or (a == va and b < vb)``.
+
+    """
+    f = equal = None
+    for field, value in zip(fields, values):
+        if field.startswith('-'):
+            field, action = field[1:], 'lt'
+        else:
+            action = 'gt'
+        after = F(**{'{0}__{1}'.format(field, action): value})
+        if equal is not None:
+            after = equal & after
+        f = after if f is None else f | after
+        same = F(**{field: value})
+        equal = same if equal is None else equal & same
+    return f
+
+
+class KeysetPage(object):
+    """A page of results from :py:meth:`elasticutils.S.keyset_page`
+
+    :property results: the `SearchResults` for the page
+    :property cursor: the cursor the page was fetched with or None for
+        the first page
+    :property next_cursor: the cursor for the next page or None if
+        this is the last page
+
+    Iterating over it iterates over the results.
+
+    """
+    __slots__ = ('results', 'cursor', 'next_cursor')
+
+    def __init__(self, results, cursor, next_cursor):
+        self.results = results
+        self.cursor = cursor
+        self.next_cursor = next_cursor
+
+    def __repr__(self):
+        return '<KeysetPage {0} results next_cursor={1!r}>'.format(
+            len(self.results), self.next_cursor)
+
+    def __iter__(self):
+        return iter(self.results)
+
+    def __len__(self):
+        return len(self.results)
+
+    @property
+    def has_next(self):
+        """Whether there's a page after this one."""
+        return self.next_cursor is not None
+
+
+class ScrollStats(namedtuple('ScrollStats', [
+        'batches', 'hits', 'total', 'elapsed', 'request_time'])):
+    """Statistics for a :py:class:`Scroll`
+
+    :property batches: the number of batches fetched
+    :property hits: the number of results fetched
+    :property total: the total number of results the search found or
+        None if the scroll hasn't started
+    :property elapsed: the seconds since the scroll started
+    :property request_time: the seconds spent waiting for
+        Elasticsearch, added up
+
+    """
+    __slots__ = ()
+
+    @property
+    def hits_per_second(self):
+        """The number of results fetched per second."""
+        if not self.elapsed:
+            return 0.0
+        return self.hits / self.elapsed
+
+
+class Scroll(object):
+    """Iterates over all the results of a search with the scroll API.
+
+    Don't create these directly---use :py:meth:`elasticutils.S.scan`
+    or :py:meth:`elasticutils.S.iterate`.
+
+    Iterating over it yields results like iterating over the S does,
+    fetching them a batch at a time. ``batches()`` yields a
+    `SearchResults` for each batch instead. Each iteration starts a
+    new scroll.
+
+    The scroll is cleared when iteration finishes, including when you
+    stop early and the iterator is garbage collected. Call
+    ``close()``, or use it as a context manager, to clear it right
+    away::
+
+        with s.scan() as scroll:
+            for result in scroll:
+                if done(result):
+                    break
+
+    """
+    def __init__(self, s, batch_size=SCAN_BATCH_SIZE,
+                 scroll=SCROLL_TIMEOUT, search_type=None, preference=None):
+        self.s = s
+        self.batch_size = batch_size
+        self.scroll = scroll
+        self.search_type = search_type
+        self.preference = preference
+        self.scroll_id = None
+        self._es = None
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self._batches = 0
+        self._hits = 0
+        self._total = None
+        self._started = self._finished = None
+        self._request_time = 0.0
+
+    def __repr__(self):
+        return '<Scroll {0!r} batch_size={1}>'.format(
+            self.s, self.batch_size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def __iter__(self):
+        try:
+            for results in self.batches():
+                for result in results:
+                    yield result
+        finally:
+            self.close()
+
+    def batches(self):
+        """Yields a `SearchResults` for each batch of results."""
+        self.close()
+        self._reset_stats()
+        try:
+            for response in self._responses():
+                yield self.s._results_from_response(response)
+        finally:
+            self.close()
+
+    def _responses(self):
+        """Yields the responses with hits in them"""
+        s = self.s
+        qs = dict(s._build_query())
+        qs.pop('from', None)
+        qs['size'] = self.batch_size
+        index, doc_type = s._search_path()
+        params = {'scroll': self.scroll}
+        if self.search_type:
+            params['search_type'] = self.search_type
+        if self.preference:
+            params['preference'] = self.preference
+
+        self._es = s.get_es()
+        self._started = time.time()
+        response = self._send(
+            [index, doc_type, '_search'],
+            s.get_serializer().dumps(qs),
+            params)
+        self._total = response['hits']['total']
+        s._set_total(self._total)
+
+        first = True
+        while True:
+            hits = response['hits']['hits']
+            if hits:
+                self._batches += 1
+                self._hits += len(hits)
+                yield response
+            elif not first or self.search_type != 'scan':
+                # The scan search type's first response never has
+                # hits. After that, no hits means we're done.
+                break
+            if self._hits >= self._total:
+                break
+            first = False
+            response = self._send(
+                ['_search', 'scroll'], self.scroll_id,
+                {'scroll': self.scroll})
+
+    def _send(self, path, body, params):
+        start = time.time()
+        response = self._es.send_request(
+            'GET', path, body, query_params=params, encode_body=False)
+        took = time.time() - start
+        self._request_time += took
+        self.scroll_id = response.get('_scroll_id')
+        log.debug('[%s] scroll batch %s' % (response.get('took'),
+                                            self._batches + 1))
+        return response
+
+    def close(self):
+        """Clears the scroll in Elasticsearch if it's open."""
+        if self._started is not None and self._finished is None:
+            self._finished = time.time()
+        scroll_id, self.scroll_id = self.scroll_id, None
+        if scroll_id is None:
+            return
+        try:
+            self._es.send_request('DELETE', ['_search', 'scroll', scroll_id])
+        except (ElasticHttpError, ConnectionError, Timeout) as exc:
+            # It expires by itself anyway.
+            log.debug('clearing scroll failed: %s' % exc)
+
+    def stats(self):
+        """Returns a :py:class:`ScrollStats`."""
+        elapsed = 0.0
+        if self._started is not None:
+            elapsed = (self._finished or time.time()) - self._started
+        return ScrollStats(self._batches, self._hits, self._total, elapsed,
+                           self._request_time)
+
+
+class SlicedScroll(object):
+    """Scans disjoint slices of a search in parallel.
+
+    Don't create these directly---use :py:meth:`elasticutils.S.sliced_scan`.
+
+    Iterating over it yields the results of all the slices, in the
+    order the batches come in. ``batches()`` yields ``(slice,
+    SearchResults)`` for each batch instead. Each slice is scanned
+    with a :py:class:`Scroll` in a worker thread. The workers wait
+    while there's a batch from every slice that hasn't been yielded
+    yet, so memory stays bounded if you're slower than they are.
+
+    To write a file per slice, give ``map()`` a function that takes
+    the slice number and its `Scroll`::
+
+        def export(i, scroll):
+            with open('export-%d.json' % i, 'w') as fp:
+                for result in scroll:
+                    fp.write(json.dumps(result) + '\\n')
+                return scroll.stats()
+
+        stats = S().indexes('logs').sliced_scan(8, 'id').map(export)
+
+    The scrolls ``scrolls()`` returns can be pickled if the S can, so
+    they can also be handed to a ``multiprocessing.Pool``.
+
+    """
+    def __init__(self, s, slices, field=None, batch_size=SCAN_BATCH_SIZE,
+                 scroll=SCROLL_TIMEOUT, executor=None):
+        if slices <= 0:
+            raise ValueError('slices must be greater than 0')
+        self.s = s
+        self.slices = slices
+        self.field = field
+        self.batch_size = batch_size
+        self.scroll = scroll
+        self.executor = executor
+        self._scrolls = []
+        self._started = self._finished = None
+
+    def __repr__(self):
+        return '<SlicedScroll {0!r} slices={1}>'.format(self.s, self.slices)
+
+    def _shard_count(self):
+        """Returns the most shards any of the searched indexes has"""
+        index = self.s._search_path()[0] or '_all'
+        response = self.s.get_es().send_request('GET', [index, '_settings'])
+        counts = [0]
+        for index_settings in response.values():
+            settings = index_settings.get('settings', {})
+            count = settings.get('index.number_of_shards')
+            if count is None:
+                # Newer versions of Elasticsearch nest the settings.
+                count = settings.get('index', {}).get('number_of_shards')
+            counts.append(int(count or 0))
+        return max(counts)
+
+    def _slice(self, i):
+        """Returns the S for slice i of a field slicing"""
+        key = '{0}__slice'.format(self.field)
+        filters_raw = self.s._get_state().filters_raw
+        if not filters_raw:
+            return self.s.filter(**{key: (i, self.slices)})
+
+        # A filter_raw replaces the filters, so the slice goes in it.
+        slice_filter = self.s._process_filters([(key, (i, self.slices))])
+        return self.s.filter_raw({'and': [filters_raw] + slice_filter})
+
+    def scrolls(self):
+        """Returns a `Scroll` for each slice.
+
+        Slicing by shard asks Elasticsearch how many shards the
+        indexes have.
+
+        """
+        if self.field is not None:
+            return [Scroll(self._slice(i), self.batch_size, self.scroll,
+                           search_type='scan')
+                    for i in range(self.slices)]
+
+        shards = self._shard_count()
+        return [Scroll(self.s, self.batch_size, self.scroll,
+                       search_type='scan',
+                       preference='_shards:' + ','.join(
+                           str(shard)
+                           for shard in range(i, shards, self.slices)))
+                for i in range(min(self.slices, shards))]
+
+    def __iter__(self):
+        for i, results in self.batches():
+            for result in results:
+                yield result
+
+    def batches(self):
+        """Yields ``(slice, SearchResults)`` for each batch of results.
+
+        If scanning a slice fails, the exception is raised here and
+        the other slices are stopped.
+
+        """
+        scrolls = self._start()
+        if not scrolls:
+            return
+        # Holds at most one batch per slice.
+        queue = Queue(len(scrolls))
+        stopped = Event()
+
+        def put(item):
+            while not stopped.is_set():
+                try:
+                    queue.put(item, timeout=0.1)
+                    return True
+                except Full:
+                    pass
+            return False
+
+        def scan(i, scroll):
+            try:
+                for results in scroll.batches():
+                    if not put(('batch', i, results)):
+                        break
+            except Exception as exc:
+                put(('error', i, exc))
+            finally:
+                scroll.close()
+                put(('done', i, None))
+
+        executor, own_executor = self._get_executor(len(scrolls))
+        futures = []
+        try:
+            for i, scroll in enumerate(scrolls):
+                futures.append(executor.submit(scan, i, scroll))
+            running = len(scrolls)
+            while running:
+                try:
+                    # Queue.get without a timeout can't be interrupted
+                    # with Ctrl-C in Python 2, so wait in slices.
+                    kind, i, value = queue.get(timeout=60)
+                except Empty:
+                    continue
+                if kind == 'done':
+                    running -= 1
+                elif kind == 'error':
+                    raise value
+                else:
+                    yield i, value
+        finally:
+            stopped.set()
+            for future in futures:
+                future.cancel()
+            if own_executor:
+                # Wait so the scrolls are cleared when this returns.
+                executor.shutdown(wait=True)
+            self._finished = time.time()
+
+    def map(self, fn):
+        """Calls ``fn(slice, scroll)`` for each slice in parallel.
+
+        :returns: list of what `fn` returned for each slice, in slice
+            order
+
+        If a call raises an exception, it's raised here.
+
+        """
+        scrolls = self._start()
+        executor, own_executor = self._get_executor(len(scrolls))
+        try:
+            return list(executor.map(fn, range(len(scrolls)), scrolls))
+        finally:
+            if own_executor:
+                executor.shutdown(wait=False)
+            self._finished = time.time()
+
+    def _start(self):
+        self._scrolls = self.scrolls()
+        self._started = time.time()
+        self._finished = None
+        return self._scrolls
+
+    def _get_executor(self, workers):
+        if self.executor is not None:
+            return self.executor, False
+        return ThreadPoolExecutor(max(workers, 1)), True
+
+    def stats(self):
+        """Returns a :py:class:`ScrollStats` for all the slices.
+
+        The totals are added up. ``elapsed`` is the wall clock time
+        and ``request_time`` adds up the time of all the slices, so it
+        can be more than ``elapsed``.
+
+        """
+        stats = [scroll.stats() for scroll in self._scrolls]
+        totals = [stat.total for stat in stats if stat.total is not None]
+        elapsed = 0.0
+        if self._started is not None:
+            elapsed = (self._finished or time.time()) - self._started
+        return ScrollStats(
+            sum(stat.batches for stat in stats),
+            sum(stat.hits for stat in stats),
+            sum(totals) if totals else None,
+            elapsed,
+            sum(stat.request_time for stat in stats))
+
+
+def msearch(searches, es=None):
+    """Executes searches with one Elasticsearch multi search request.
+
+    :arg searches: list of `S` instances
+    :arg es: the `ElasticSearch` to use; defaults to the one each
+        search's ``get_es()`` returns. Searches with different
+        `ElasticSearch` objects go in separate requests.
+
+    :returns: list with the `SearchResults` for each search in the
+        same order. If a search failed, its item is the exception
+        instead: a :py:class:`elasticutils.MultiSearchError` with the
+        error Elasticsearch returned or the error building the search
+        raised. The other searches aren't affected.
+
+    The results are cached on each search just like ``execute()``
+    does, so iterating over it, ``len()``, ``count()`` and
+    ``facet_counts()`` don't make another request. Searches that
+    already have results aren't sent again.
+
+    Example::
+
+        results, sidebar, related = msearch([
+            S().query(title__text='red'),
+            S().facet('category')[:0],
+            S().filter(related=True)[:5],
+        ])
+
+    """
+    searches = list(searches)
+    outcomes = [None] * len(searches)
+
+    # Group the searches by ElasticSearch in order of first use.
+    batches = []
+    batch_for_es = {}
+    for i, s in enumerate(searches):
+        if s._results_cache is not None:
+            outcomes[i] = s._results_cache
+            continue
+        search_es = es or s.get_es()
+        batch = batch_for_es.get(id(search_es))
+        if batch is None:
+            batch = batch_for_es[id(search_es)] = (search_es, [])
+            batches.append(batch)
+        batch[1].append((i, s))
+
+    for batch_es, batch in batches:
+        lines = []
+        sent = []
+        for i, s in batch:
+            try:
+                index, doc_type = s._search_path()
+                qs = s._build_query()
+            except ElasticUtilsError as exc:
+                outcomes[i] = exc
+                continue
+
+            header = {}
+            if index:
+                header['index'] = index
+            if doc_type:
+                header['type'] = doc_type
+            dumps = s.get_serializer().dumps
+            lines.append(dumps(header))
+            lines.append(dumps(qs))
+            sent.append((i, s))
+
+        if not sent:
+            continue
+
+        # The multi search API needs the trailing newline.
+        lines.append('')
+        response = batch_es.send_request(
+            'GET', ['_msearch'], '\n'.join(lines), encode_body=False)
+        log.debug('[msearch] %d searches', len(sent))
+
+        for (i, s), item in zip(sent, response['responses']):
+            if 'error' in item:
+                outcomes[i] = MultiSearchError(item['error'])
+            else:
+                s._results_cache = s._results_from_response(item)
+                outcomes[i] = s._results_cache
+
+    return outcomes
+
+
+def execute_many(searches, max_workers=DEFAULT_MAX_WORKERS, timeout=None,
+                 ordered=True, executor=None):
+    """Executes searches in parallel and yields their results.
+
+    :arg searches: list of `S` instances
+    :arg max_workers: the most searches to run at a time
+    :arg timeout: the most seconds a search can run; if it takes
+        longer, you get a :py:class:`elasticutils.futures.TimeoutError`
+        for it instead of its results. None waits as long as it takes.
+    :arg ordered: if True, yields in the same order as `searches`,
+        each as soon as it and the ones before it are done; if False,
+        yields each as soon as it's done
+    :arg executor: the :py:class:`elasticutils.futures.ThreadPoolExecutor`
+        to run the searches with; by default, one with `max_workers`
+        threads is made for them
+
+    :returns: generator of ``(s, results)`` tuples where results is
+        the `SearchResults` for the search or, if it failed, the
+        exception it raised
+
+    The searches use the `ElasticSearch` objects from their
+    ``get_es()``, so they share the pooled connections of the ones
+    :py:func:`elasticutils.get_es` caches. Searches that haven't
+    started are cancelled if you stop iterating, for example by
+    breaking out of the loop.
+
+    Example::
+
+        searches = [S().filter(customer=c).facet('product')
+                    for c in customers]
+        for s, results in execute_many(searches, max_workers=8,
+                                       timeout=30):
+            if isinstance(results, Exception):
+                log.warning('report failed: %s', results)
+            else:
+                write_report(s, results)
+
+    """
+    searches = list(searches)
+    own_executor = executor is None
+    if own_executor:
+        executor = ThreadPoolExecutor(max_workers)
+
+    # Workers put ('started', i) and ('done', i) events on this.
+    events = Queue()
+
+    def execute(i, s):
+        events.put(('started', i))
+        try:
+            return s.execute()
+        finally:
+            events.put(('done', i))
+
+    futures = []
+    try:
+        for i, s in enumerate(searches):
+            futures.append(executor.submit(execute, i, s))
+
+        deadlines = {}
+        outcomes = {}
+        resolved = set()
+        next_index = 0
+        while len(resolved) < len(searches):
+            if deadlines:
+                wait = max(min(deadlines.values()) - time.time(), 0)
+            else:
+                # Queue.get without a timeout can't be interrupted
+                # with Ctrl-C in Python 2, so wait in slices.
+                wait = 60
+            try:
+                event, i = events.get(timeout=wait)
+            except Empty:
+                event = None
+
+            finished = []
+            if event == 'started':
+                if timeout is not None and i not in resolved:
+                    deadlines[i] = time.time() + timeout
+            elif event == 'done' and i not in resolved:
+                deadlines.pop(i, None)
+                future = futures[i]
+                outcome = future.exception()
+                if outcome is None:
+                    outcome = future.result()
+                finished.append((i, outcome))
+
+            now = time.time()
+            for i, deadline in deadlines.items():
+                if deadline <= now:
+                    # The thread keeps running, but its results are
+                    # dropped.
+                    del deadlines[i]
+                    finished.append((i, TimeoutError(
+                        'Search took longer than {0} seconds.'.format(
+                            timeout))))
+
+            for i, outcome in finished:
+                resolved.add(i)
+                if ordered:
+                    outcomes[i] = outcome
+                else:
+                    yield searches[i], outcome
+
+            if ordered:
+                while next_index in outcomes:
+                    yield searches[next_index], outcomes.pop(next_index)
+                    next_index += 1
+    finally:
+        for future in futures:
+            future.cancel()
+        if own_executor:
+            executor.shutdown(wait=False)
+
+
 class MLT(PythonMixin):
     """Represents a lazy Elasticsearch More Like This API request.
 
@@ -1533,6 +3955,19 @@ class MLT(PythonMixin):
     def __len__(self):
         return len(self._do_search())
 
+    def execute_async(self, executor=None):
+        """Runs the more like this request in the background.
+
+        :arg executor: the executor to use; see
+            :py:meth:`elasticutils.S.execute_async`
+
+        :returns: :py:class:`elasticutils.futures.Future` whose result
+            is a `SearchResults` instance
+
+        """
+        executor = executor or get_default_executor()
+        return executor.submit(self._do_search)
+
     def get_es(self):
         """Returns an `ElasticSearch`.
 
@@ -1545,7 +3980,7 @@ class MLT(PythonMixin):
         Override this if that behavior isn't correct for you.
 
         """
-        if self.s:
+        if self.s is not None:
             return self.s.get_es()
 
         return self.es or get_es()
@@ -1560,10 +3995,27 @@ class MLT(PythonMixin):
         params = dict(self.query_params)
         mlt_fields = self.mlt_fields or params.pop('mlt_fields', [])
 
-        body = self.s._build_query() if self.s else ''
+        # Like pyelasticsearch, allow es_ prefixed query params.
+        for key in params.keys():
+            if key.startswith('es_'):
+                params[key[3:]] = params.pop(key)
+            elif key not in MLT_QUERY_PARAMS:
+                raise TypeError(
+                    'more_like_this() got an unexpected keyword argument '
+                    '{0!r}'.format(key))
+
+        if self.s is not None:
+            body = self.s.get_serializer().dumps(self.s._build_query())
+        else:
+            body = ''
+        params['mlt_fields'] = _join_names(mlt_fields)
 
-        hits = es.more_like_this(
-            self.index, self.doctype, self.id, mlt_fields, body, **params)
+        hits = es.send_request(
+            'GET',
+            [self.index, self.doctype, self.id, '_mlt'],
+            body,
+            query_params=params,
+            encode_body=False)
 
         log.debug(hits)
 
@@ -1574,7 +4026,7 @@ class MLT(PythonMixin):
         Perform the mlt call, then convert that raw format into a
         SearchResults instance and return it.
         """
-        if not self._results_cache:
+        if self._results_cache is None:
             response = self.raw()
             results = self.to_python(response.get('hits', {}).get('hits', []))
             self._results_cache = DictSearchResults(
@@ -1582,7 +4034,7 @@ class MLT(PythonMixin):
         return self._results_cache
 
 
-class SearchResults(object):
+class SearchResults(SlotPickleMixin):
     """
     After executing a search, this is the class that manages the
     results.
@@ -1612,6 +4064,8 @@ class SearchResults(object):
         print results.results
 
     """
+    __slots__ = ('type', 'response', 'took', 'count', 'results', 'fields',
+                 'objects', '__weakref__')
 
     def __init__(self, type, response, results, fields):
         self.type = type
@@ -1633,8 +4087,13 @@ class SearchResults(object):
         return len(self.objects)
 
 
-class DictResult(dict):
-    pass
+#: Attributes decorate_with_metadata sets on results.
+_RESULT_METADATA = ('_id', '_source', '_score', '_type', '_explanation',
+                    '_highlight')
+
+
+class DictResult(SlotPickleMixin, dict):
+    __slots__ = _RESULT_METADATA
 
 
 class TupleResult(tuple):
@@ -1890,6 +4349,28 @@ class Indexable(object):
         """
         return get_es()
 
+    @classmethod
+    def get_serializer(cls):
+        """Returns the serializer to use for documents
+
+        This returns the one set with
+        :py:func:`elasticutils.serializers.set_serializer`. Override
+        this if you need special functionality.
+
+        """
+        return get_serializer()
+
+    @classmethod
+    def get_result_cache(cls):
+        """Returns the result cache backend to invalidate
+
+        This returns the one set with
+        :py:func:`elasticutils.cache.set_result_cache`. Override this
+        if your S uses a different one.
+
+        """
+        return get_result_cache()
+
     @classmethod
     def get_mapping(cls):
         """Returns the mapping for this mapping type.
@@ -1987,12 +4468,17 @@ class Indexable(object):
         if index is None:
             index = cls.get_index()
 
-        es.index(
-            index,
-            cls.get_mapping_type_name(),
-            document,
-            id=id_,
-            overwrite_existing=overwrite_existing)
+        query_params = {}
+        if not overwrite_existing:
+            query_params['op_type'] = 'create'
+
+        es.send_request(
+            'POST' if id_ is None else 'PUT',
+            [index, cls.get_mapping_type_name(), id_],
+            cls.get_serializer().dumps(document),
+            query_params=query_params,
+            encode_body=False)
+        cls.get_result_cache().invalidate(index)
 
     @classmethod
     def bulk_index(cls, documents, id_field='id', es=None, index=None):
@@ -2027,10 +4513,56 @@ class Indexable(object):
         if index is None:
             index = cls.get_index()
 
-        es.bulk_index(index,
-                      cls.get_mapping_type_name(),
-                      documents,
-                      id_field)
+        if not documents:
+            raise ValueError('No documents provided for bulk indexing!')
+
+        dumps = cls.get_serializer().dumps
+        doctype = cls.get_mapping_type_name()
+        body_bits = []
+        for doc in documents:
+            action = {'_index': index, '_type': doctype}
+            if doc.get(id_field) is not None:
+                action['_id'] = doc[id_field]
+            if doc.get('_parent') is not None:
+                action['_parent'] = doc['_parent']
+                doc = dict(doc)
+                del doc['_parent']
+
+            body_bits.append(dumps({'index': action}))
+            body_bits.append(dumps(doc))
+
+        # The bulk API needs the trailing newline.
+        body_bits.append('')
+        es.send_request('POST', ['_bulk'], '\n'.join(body_bits),
+                        encode_body=False)
+        cls.get_result_cache().invalidate(index)
+
+    @classmethod
+    def bulk_index_async(cls, documents, id_field='id', es=None, index=None,
+                         executor=None):
+        """Like ``bulk_index()`` but runs in the background.
+
+        :arg executor: the executor to use; see
+            :py:meth:`elasticutils.S.execute_async`
+
+        :returns: :py:class:`elasticutils.futures.Future` which is
+            done when the documents are indexed
+
+        The other arguments are the same as for ``bulk_index()``.
+
+        Example::
+
+            futures = [
+                MyMappingType.bulk_index_async(chunk)
+                for chunk in chunked(documents, 500)
+            ]
+            for future in futures:
+                future.result()
+
+        """
+        executor = executor or get_default_executor()
+        return executor.submit(
+            cls.bulk_index, documents, id_field=id_field, es=es, index=index)
 
     @classmethod
     def unindex(cls, id_, es=None, index=None):
@@ -2053,6 +4585,7 @@ class Indexable(object):
             index = cls.get_index()
 
         es.delete(index, cls.get_mapping_type_name(), id_)
+        cls.get_result_cache().invalidate(index)
 
     @classmethod
     def refresh_index(cls, es=None, index=None):
@@ -2078,3 +4611,5 @@ class Indexable(object):
             index = cls.get_index()
 
         es.refresh(index)
+        # Documents indexed since the last refresh show up now.
+        cls.get_result_cache().invalidate(index)
@@ -0,0 +1,196 @@
+"""
+Caches for search results.
+
+Searches with a cache TTL, set with :py:meth:`elasticutils.S.cache`
+or ``S.default_result_ttl``, keep their responses in the cache
+:py:func:`get_result_cache` returns. The default is a
+:py:class:`LocalResultCache` in each process. To share results
+between processes, set another backend with :py:func:`set_result_cache`,
+like :py:class:`elasticutils.contrib.django.ResultCache`.
+
+Cache keys include a generation number for each index searched.
+:py:meth:`ResultCache.invalidate` bumps the generations, so results
+cached before are never looked up again and age out. The indexing
+methods of :py:class:`elasticutils.Indexable` invalidate their index.
+
+"""
+import hashlib
+import time
+from threading import RLock
+
+from elasticutils.utils import LRUCache
+
+
+#: Maximum number of responses a LocalResultCache holds by default.
+RESULT_CACHE_SIZE = 1000
+
+#: Maximum total size in bytes of the responses a LocalResultCache
+#: holds by default.
+RESULT_CACHE_BYTES = 50 * 1024 * 1024
+
+#: Name the generation of searches across all indexes is kept under.
+ALL_INDEXES = '_all'
+
+
+def make_key(kind, index, doc_type, body, generations):
+    """Returns a cache key for a search
+
+    :arg kind: the kind of request, like ``'search'`` or ``'count'``
+    :arg index: the comma-delimited indexes or None
+    :arg doc_type: the comma-delimited doctypes or None
+    :arg body: the serialized request body
+    :arg generations: the generations of the indexes
+
+    """
+    key = hashlib.sha1('{0}|{1}|{2}|{3}\n'.format(
+        kind, index or '', doc_type or '',
+        ','.join(str(gen) for gen in generations)))
+    key.update(body)
+    return 'elasticutils:result:' + key.hexdigest()
+
+
+class ResultCache(object):
+    """Base class for result cache backends
+
+    Subclasses store str values with ``get``, ``set`` and ``clear``
+    and keep an integer generation for each index with
+    ``get_generations`` and ``incr_generation``.
+
+    """
+    def get(self, key):
+        """Returns the value for `key` or None"""
+        raise NotImplementedError
+
+    def set(self, key, value, ttl):
+        """Caches `value` for `key` for `ttl` seconds"""
+        raise NotImplementedError
+
+    def clear(self):
+        """Removes everything from the cache"""
+        raise NotImplementedError
+
+    def get_generations(self, indexes):
+        """Returns a list of the generation of each of `indexes`"""
+        raise NotImplementedError
+
+    def incr_generation(self, index):
+        """Bumps the generation of `index`"""
+        raise NotImplementedError
+
+    def generations_for(self, index):
+        """Returns the generations for searches of `index`
+
+        :arg index: the comma-delimited indexes searched or None for
+            all of them
+
+        """
+        if not index:
+            return self.get_generations([ALL_INDEXES])
+        return self.get_generations(index.split(','))
+
+    def invalidate(self, index):
+        """Makes cached results of searches of `index` stale
+
+        :arg index: the name of the index or a list of them
+
+        Searches across all indexes are invalidated too.
+
+        """
+        if isinstance(index, basestring):
+            index = [index]
+        for name in list(index) + [ALL_INDEXES]:
+            self.incr_generation(name)
+
+
+class LocalResultCache(ResultCache):
+    """In-process result cache
+
+    :arg maxsize: the most responses to hold
+    :arg maxbytes: the most bytes of responses to hold
+
+    When either limit is reached, the least recently used responses
+    are evicted. Responses bigger than `maxbytes` aren't cached.
+
+    """
+    def __init__(self, maxsize=RESULT_CACHE_SIZE,
+                 maxbytes=RESULT_CACHE_BYTES):
+        self.maxbytes = maxbytes
+        # The LRUCache calls _evicted while set holds this.
+        self._lock = RLock()
+        self._cache = LRUCache(maxsize=maxsize, on_evict=self._evicted)
+        self._generations = {}
+        self.currbytes = 0
+
+    def _evicted(self, key, item):
+        with self._lock:
+            self.currbytes -= len(item[1])
+
+    def get(self, key):
+        # set() holds the lock, so if the item has expired, it's still
+        # the one in the cache when it's deleted.
+        with self._lock:
+            item = self._cache.get(key)
+            if item is None:
+                return None
+            if item[0] <= time.time():
+                self._delete(key)
+                return None
+        return item[1]
+
+    def _delete(self, key):
+        with self._lock:
+            item = self._cache.pop(key)
+            if item is not None:
+                self.currbytes -= len(item[1])
+
+    def set(self, key, value, ttl):
+        if len(value) > self.maxbytes or self._cache.maxsize <= 0:
+            return
+        with self._lock:
+            self._delete(key)
+            self._cache.set(key, (time.time() + ttl, value))
+            self.currbytes += len(value)
+            while self.currbytes > self.maxbytes:
+                oldest, item = self._cache.popitem()
+                self.currbytes -= len(item[1])
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self.currbytes = 0
+
+    def get_generations(self, indexes):
+        generations = self._generations
+        return [generations.get(index, 0) for index in indexes]
+
+    def incr_generation(self, index):
+        with self._lock:
+            self._generations[index] = self._generations.get(index, 0) + 1
+
+    def info(self):
+        """Returns a ``CacheInfo(hits, misses, maxsize, currsize)``"""
+        return self._cache.info()
+
+
+_result_cache = LocalResultCache()
+
+
+def get_result_cache():
+    """Returns the result cache backend"""
+    return _result_cache
+
+
+def set_result_cache(cache):
+    """Sets the result cache backend
+
+    :arg cache: a :py:class:`ResultCache`
+
+    Example::
+
+        from elasticutils.cache import LocalResultCache, set_result_cache
+
+        set_result_cache(LocalResultCache(maxbytes=200 * 1024 * 1024))
+
+    """
+    global _result_cache
+    _result_cache = cache
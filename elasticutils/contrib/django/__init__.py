@@ -1,4 +1,5 @@
 import logging
+import time
 from functools import wraps
 
 import pyelasticsearch
@@ -12,6 +13,7 @@ from elasticutils import S as BaseS
 from elasticutils import get_es as base_get_es
 from elasticutils import Indexable as BaseIndexable
 from elasticutils import MappingType as BaseMappingType
+from elasticutils.cache import ResultCache as BaseResultCache
 
 
 log = logging.getLogger('elasticutils')
@@ -157,6 +159,71 @@ es_required_or_50x = decorator_from_middleware_with_args(
     ESExceptionMiddleware)
 
 
+class ResultCache(BaseResultCache):
+    """Result cache backend that uses a Django cache
+
+    :arg alias: the name of the cache in ``CACHES`` to use
+
+    With a shared cache like memcached, processes share cached results
+    and indexing in one process invalidates them for all of them.
+
+    Example::
+
+        from elasticutils.cache import set_result_cache
+        from elasticutils.contrib.django import ResultCache
+
+        set_result_cache(ResultCache('search'))
+
+    """
+    #: Seconds index generations are kept. This is the longest
+    #: memcached allows.
+    generation_timeout = 30 * 24 * 60 * 60
+
+    def __init__(self, alias='default'):
+        from django.core.cache import get_cache
+        self.cache = get_cache(alias)
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value, ttl):
+        self.cache.set(key, value, ttl)
+
+    def clear(self):
+        self.cache.clear()
+
+    def _generation_key(self, index):
+        return 'elasticutils:generation:' + index
+
+    def _initial_generation(self):
+        # If a generation is evicted, it starts again from a value that
+        # is bigger than any it had before rather than from 0.
+        return int(time.time() * 1000)
+
+    def get_generations(self, indexes):
+        keys = [self._generation_key(index) for index in indexes]
+        found = self.cache.get_many(keys)
+        generations = []
+        for key in keys:
+            generation = found.get(key)
+            if generation is None:
+                generation = self._initial_generation()
+                if not self.cache.add(key, generation,
+                                      self.generation_timeout):
+                    # Someone else set it first.
+                    generation = self.cache.get(key, generation)
+            generations.append(generation)
+        return generations
+
+    def incr_generation(self, index):
+        key = self._generation_key(index)
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            # It isn't set, so the next search starts it.
+            pass
+
+
 class S(BaseS):
     """S that's based on Django settings"""
     def __init__(self, mapping_type):
@@ -0,0 +1,32 @@
+import time
+from unittest import TestCase
+
+from nose.tools import eq_
+
+from elasticutils.contrib.django import ResultCache
+
+
+class ResultCacheTest(TestCase):
+    def setUp(self):
+        super(ResultCacheTest, self).setUp()
+        self.cache = ResultCache()
+        self.cache.clear()
+
+    def test_get_set(self):
+        eq_(self.cache.get('a'), None)
+        self.cache.set('a', '{}', 60)
+        eq_(self.cache.get('a'), '{}')
+
+    def test_generations(self):
+        first = self.cache.generations_for('a,b')
+        eq_(self.cache.generations_for('a,b'), first)
+
+        self.cache.invalidate('a')
+        eq_(self.cache.generations_for('a,b'), [first[0] + 1, first[1]])
+
+    def test_lost_generation(self):
+        generation = self.cache.generations_for('a')[0]
+        self.cache.clear()
+        time.sleep(0.01)
+        # It starts again from a generation that wasn't used before.
+        assert self.cache.generations_for('a')[0] > generation
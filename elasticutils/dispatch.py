@@ -0,0 +1,199 @@
+"""
+Coalescing searches from many threads into multi search requests.
+
+With a :py:class:`MSearchDispatcher` set as
+``S.default_dispatcher``, searches executed at about the same time
+by different threads (or greenlets with gevent's monkey patching)
+are sent together in one ``_msearch`` request. Each caller still gets
+its own results back from ``execute()``, iterating, ``len()`` and so
+on::
+
+    from elasticutils import S
+    from elasticutils.dispatch import MSearchDispatcher
+
+    S.default_dispatcher = MSearchDispatcher(window=0.002, max_batch=20)
+
+This trades a little latency, at most `max_wait`, for fewer requests
+to the cluster, so it helps when there are many concurrent searches.
+
+"""
+import os
+import time
+from collections import namedtuple
+from threading import Condition, Lock
+
+from elasticutils import MultiSearchError, msearch
+from elasticutils.futures import Future
+
+
+class DispatchStats(namedtuple('DispatchStats', [
+        'batches', 'searches', 'max_batch_size', 'total_wait',
+        'max_wait', 'total_request_time'])):
+    """Statistics for a :py:class:`MSearchDispatcher`
+
+    :property batches: the number of ``_msearch`` requests sent
+    :property searches: the number of searches in them
+    :property max_batch_size: the most searches sent in one request
+    :property total_wait: the seconds searches spent waiting for
+        their batch to be sent, added up
+    :property max_wait: the longest a search waited for its batch to
+        be sent
+    :property total_request_time: the seconds spent in ``_msearch``
+        requests, added up
+
+    """
+    __slots__ = ()
+
+    @property
+    def mean_batch_size(self):
+        """The average number of searches per request."""
+        if not self.batches:
+            return 0.0
+        return float(self.searches) / self.batches
+
+    @property
+    def mean_wait(self):
+        """The average seconds a search waited for its batch to be sent.
+        """
+        if not self.searches:
+            return 0.0
+        return self.total_wait / self.searches
+
+    @property
+    def mean_request_time(self):
+        """The average seconds an ``_msearch`` request took."""
+        if not self.batches:
+            return 0.0
+        return self.total_request_time / self.batches
+
+
+class _Batch(object):
+    def __init__(self, now):
+        self.first = self.last = now
+        self.items = []
+
+
+class MSearchDispatcher(object):
+    """Collects searches from many threads and sends them together.
+
+    :arg window: after a search arrives, the seconds to wait for
+        another one before sending the batch
+    :arg max_batch: send the batch as soon as it has this many
+        searches
+    :arg max_wait: the most seconds the first search in a batch waits
+        for the batch to be sent, however many searches keep arriving;
+        defaults to 5 times `window`
+
+    The first thread to add a search to a batch sends it with
+    :py:func:`elasticutils.msearch`, so there's no background thread.
+    If a search fails, only that search's caller gets the error. It's
+    the error ``execute()`` raises without a dispatcher, so a search
+    Elasticsearch rejects is sent again on its own to get it.
+
+    This is thread-safe.
+
+    """
+    def __init__(self, window=0.002, max_batch=10, max_wait=None):
+        if max_batch < 1:
+            raise ValueError('max_batch must be at least 1')
+        self.window = window
+        self.max_batch = max_batch
+        self.max_wait = max_wait if max_wait is not None else window * 5
+        self._reset()
+
+    def _reset(self):
+        self._cond = Condition(Lock())
+        self._batch = None
+        self._pid = os.getpid()
+        self._batches = 0
+        self._searches = 0
+        self._max_batch_size = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._total_request_time = 0.0
+
+    def search(self, s):
+        """Executes a search in the next batch and returns its results.
+
+        :arg s: the S to execute
+
+        :returns: the S's `SearchResults`
+
+        :raises: whatever ``s.execute()`` would if the search fails
+
+        """
+        if self._pid != os.getpid():
+            # Another thread in the parent might have been holding the
+            # lock or leading a batch when we forked.
+            self._reset()
+
+        future = Future()
+        with self._cond:
+            now = time.time()
+            batch = self._batch
+            leader = batch is None
+            if leader:
+                batch = self._batch = _Batch(now)
+            batch.last = now
+            batch.items.append((s, future, now))
+
+            if len(batch.items) >= self.max_batch:
+                # It's full, so the next search starts a new batch.
+                self._batch = None
+                self._cond.notify_all()
+            if leader:
+                self._wait_for_batch(batch)
+                if self._batch is batch:
+                    self._batch = None
+
+        if leader:
+            self._send(batch)
+        try:
+            return future.result()
+        except MultiSearchError:
+            # The multi search response doesn't say what status the
+            # search failed with, so it's sent again on its own to
+            # raise the same error execute() would without us.
+            return s._results_from_response(s.raw())
+
+    def _wait_for_batch(self, batch):
+        # Called with the lock held by the thread leading the batch.
+        while len(batch.items) < self.max_batch:
+            deadline = min(batch.last + self.window,
+                           batch.first + self.max_wait)
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            self._cond.wait(remaining)
+
+    def _send(self, batch):
+        start = time.time()
+        searches = [s for s, future, enqueued in batch.items]
+        try:
+            outcomes = msearch(searches)
+        except Exception as exc:
+            # The whole request failed, so every search did.
+            outcomes = [exc] * len(searches)
+        request_time = time.time() - start
+
+        with self._cond:
+            self._batches += 1
+            self._searches += len(searches)
+            self._max_batch_size = max(self._max_batch_size, len(searches))
+            for s, future, enqueued in batch.items:
+                self._total_wait += start - enqueued
+            self._max_wait = max(self._max_wait, start - batch.first)
+            self._total_request_time += request_time
+
+        for (s, future, enqueued), outcome in zip(batch.items, outcomes):
+            if isinstance(outcome, Exception):
+                future.set_exception(outcome)
+            else:
+                future.set_result(outcome)
+
+    def stats(self):
+        """Returns a :py:class:`DispatchStats`."""
+        with self._cond:
+            return DispatchStats(
+                self._batches, self._searches, self._max_batch_size,
+                self._total_wait, self._max_wait, self._total_request_time)
@@ -0,0 +1,355 @@
+"""
+Futures for running requests in the background.
+
+Python 2 doesn't have asyncio or concurrent.futures, so this has the
+parts of concurrent.futures ElasticUtils needs: :py:class:`Future`,
+:py:class:`ThreadPoolExecutor` and :py:func:`as_completed`. They work
+the same way, so code using them can move to concurrent.futures
+later.
+
+Methods like :py:meth:`elasticutils.S.execute_async` run on the
+executor :py:func:`get_default_executor` returns unless you pass
+them another one. The worker threads share the pooled connections of
+the `ElasticSearch` objects from :py:func:`elasticutils.get_es`.
+
+"""
+import os
+import sys
+import time
+from Queue import Empty, Queue
+from threading import Condition, Lock, Semaphore, Thread
+
+
+#: Default number of worker threads in an executor.
+DEFAULT_MAX_WORKERS = 10
+
+PENDING = 'PENDING'
+RUNNING = 'RUNNING'
+CANCELLED = 'CANCELLED'
+FINISHED = 'FINISHED'
+
+
+class CancelledError(Exception):
+    """Raise when getting the result of a cancelled future."""
+    pass
+
+
+class TimeoutError(Exception):
+    """Raise when waiting for a future takes longer than the timeout."""
+    pass
+
+
+class Future(object):
+    """The result of a call that runs in the background.
+
+    Example::
+
+        future = S().query(title__text='red').execute_async()
+        # ... do other things ...
+        results = future.result(timeout=10)
+
+    This is thread-safe.
+
+    """
+    def __init__(self):
+        self._cond = Condition(Lock())
+        self._state = PENDING
+        self._result = None
+        self._exc_info = None
+        self._callbacks = []
+
+    def __repr__(self):
+        return '<Future {0}>'.format(self._state.lower())
+
+    def cancel(self):
+        """Cancels the call if it hasn't started.
+
+        :returns: True if the call was cancelled, False if it's
+            running or done
+
+        """
+        with self._cond:
+            if self._state in (RUNNING, FINISHED):
+                return False
+            if self._state == CANCELLED:
+                return True
+            self._state = CANCELLED
+            self._cond.notify_all()
+        self._run_callbacks()
+        return True
+
+    def cancelled(self):
+        """Returns True if the call was cancelled."""
+        return self._state == CANCELLED
+
+    def running(self):
+        """Returns True if the call is running."""
+        return self._state == RUNNING
+
+    def done(self):
+        """Returns True if the call finished or was cancelled."""
+        return self._state in (CANCELLED, FINISHED)
+
+    def _wait(self, timeout):
+        with self._cond:
+            if not self.done():
+                self._cond.wait(timeout)
+            if self._state == CANCELLED:
+                raise CancelledError()
+            if self._state != FINISHED:
+                raise TimeoutError()
+
+    def result(self, timeout=None):
+        """Returns what the call returned.
+
+        :arg timeout: the seconds to wait; None waits forever
+
+        :raises TimeoutError: if the call isn't done in time
+        :raises CancelledError: if the call was cancelled
+
+        If the call raised an exception, this raises it.
+
+        """
+        self._wait(timeout)
+        if self._exc_info is not None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+    def exception(self, timeout=None):
+        """Returns the exception the call raised or None.
+
+        This waits like :py:meth:`result`.
+
+        """
+        self._wait(timeout)
+        if self._exc_info is not None:
+            return self._exc_info[1]
+        return None
+
+    def add_done_callback(self, fn):
+        """Calls ``fn(future)`` when the future is done.
+
+        If it's already done, this calls it right away.
+
+        """
+        with self._cond:
+            if not self.done():
+                self._callbacks.append(fn)
+                return
+        fn(self)
+
+    def set_running_or_notify_cancel(self):
+        """Marks the future as running unless it was cancelled.
+
+        Executors call this before they run the call.
+
+        :returns: False if it was cancelled and the call shouldn't run
+
+        """
+        with self._cond:
+            if self._state == CANCELLED:
+                return False
+            self._state = RUNNING
+            return True
+
+    def _finish(self, result, exc_info):
+        with self._cond:
+            self._result = result
+            self._exc_info = exc_info
+            self._state = FINISHED
+            self._cond.notify_all()
+        self._run_callbacks()
+
+    def set_result(self, result):
+        """Finishes the future with the result of the call."""
+        self._finish(result, None)
+
+    def set_exception(self, exception, traceback=None):
+        """Finishes the future with an exception the call raised."""
+        self._finish(None, (type(exception), exception, traceback))
+
+    def _run_callbacks(self):
+        with self._cond:
+            callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            try:
+                fn(self)
+            except Exception:
+                # Like concurrent.futures, a bad callback doesn't
+                # stop the others.
+                pass
+
+
+class ThreadPoolExecutor(object):
+    """Runs calls with a pool of worker threads.
+
+    :arg max_workers: the most threads to run calls in at a time
+
+    Threads are started as calls are submitted. They're daemon
+    threads, so they don't keep the process from exiting.
+
+    Example::
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            future = executor.submit(s.execute)
+            results = future.result()
+
+    """
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS):
+        if max_workers <= 0:
+            raise ValueError('max_workers must be greater than 0')
+        self.max_workers = max_workers
+        self._queue = Queue()
+        self._threads = []
+        # Released by threads when they're done with a call.
+        self._idle = Semaphore(0)
+        self._shutdown = False
+        self._lock = Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        """Schedules ``fn(*args, **kwargs)`` and returns a Future for it.
+
+        :raises RuntimeError: if the executor was shut down
+
+        """
+        future = Future()
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError('Cannot submit after shutdown.')
+            self._queue.put((future, fn, args, kwargs))
+            if (not self._idle.acquire(False)
+                    and len(self._threads) < self.max_workers):
+                thread = Thread(target=self._work)
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+        return future
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            future, fn, args, kwargs = item
+            if future.set_running_or_notify_cancel():
+                try:
+                    result = fn(*args, **kwargs)
+                except Exception:
+                    exc_type, exc, tb = sys.exc_info()
+                    future.set_exception(exc, tb)
+                else:
+                    future.set_result(result)
+            # Drop the references so the results can be collected.
+            item = future = fn = args = kwargs = result = tb = None
+            self._idle.release()
+
+    def map(self, fn, *iterables, **kwargs):
+        """Like ``map(fn, *iterables)`` but the calls run in the pool.
+
+        :arg timeout: the seconds to wait for all of the results
+
+        Results are yielded in order.
+
+        """
+        timeout = kwargs.pop('timeout', None)
+        deadline = time.time() + timeout if timeout is not None else None
+        futures = [self.submit(fn, *args) for args in zip(*iterables)]
+
+        def results():
+            try:
+                for future in futures:
+                    if deadline is None:
+                        yield future.result()
+                    else:
+                        yield future.result(max(deadline - time.time(), 0))
+            finally:
+                for future in futures:
+                    future.cancel()
+        return results()
+
+    def shutdown(self, wait=True):
+        """Stops the worker threads after the submitted calls finish.
+
+        :arg wait: whether to wait for the threads to stop
+
+        """
+        with self._lock:
+            self._shutdown = True
+            threads = list(self._threads)
+        for thread in threads:
+            self._queue.put(None)
+        if wait:
+            for thread in threads:
+                thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.shutdown(wait=True)
+        return False
+
+
+def as_completed(futures, timeout=None):
+    """Yields futures as they finish.
+
+    :arg futures: the futures to wait for
+    :arg timeout: the seconds to wait for all of them; None waits
+        forever
+
+    :raises TimeoutError: if they're not all done in time
+
+    """
+    futures = set(futures)
+    deadline = time.time() + timeout if timeout is not None else None
+    done = Queue()
+    for future in futures:
+        future.add_done_callback(done.put)
+
+    for i in range(len(futures)):
+        if deadline is None:
+            # Queue.get without a timeout can't be interrupted with
+            # Ctrl-C in Python 2, so wait in slices.
+            while True:
+                try:
+                    future = done.get(timeout=60)
+                    break
+                except Empty:
+                    pass
+        else:
+            try:
+                future = done.get(timeout=max(deadline - time.time(), 0))
+            except Empty:
+                raise TimeoutError(
+                    '{0} of {1} futures are not done.'.format(
+                        len(futures) - i, len(futures)))
+        yield future
+
+
+_default_executor = None
+_default_executor_pid = None
+_default_executor_lock = Lock()
+
+
+def get_default_executor():
+    """Returns the executor ``*_async`` methods use by default.
+
+    It's a :py:class:`ThreadPoolExecutor` with
+    ``DEFAULT_MAX_WORKERS`` threads. A process forked after it was
+    created gets a new one since threads don't survive ``os.fork()``.
+
+    """
+    global _default_executor, _default_executor_pid, _default_executor_lock
+
+    pid = os.getpid()
+    if _default_executor_pid != pid:
+        # Another thread in the parent might have been holding the
+        # lock when we forked.
+        _default_executor_lock = Lock()
+        _default_executor_pid = pid
+        _default_executor = None
+
+    with _default_executor_lock:
+        if _default_executor is None:
+            _default_executor = ThreadPoolExecutor(DEFAULT_MAX_WORKERS)
+        return _default_executor
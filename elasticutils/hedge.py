@@ -0,0 +1,224 @@
+"""
+Hedged searches for lower tail latency.
+
+With a :py:class:`Hedger` set as ``S.default_hedger``, a search that
+hasn't returned within a delay is sent again, to another host if
+there is one, and the caller gets whichever response comes back
+first::
+
+    from elasticutils import S
+    from elasticutils.hedge import Hedger
+
+    class InteractiveS(S):
+        default_hedger = Hedger(percentile=95, max_rate=0.05)
+
+This trades a few extra requests to the cluster, at most `max_rate`
+of the searches, for fewer slow ones. Only searches are hedged:
+they're safe to send twice.
+
+"""
+import math
+import os
+import sys
+import time
+from collections import deque, namedtuple
+from threading import Lock
+
+from elasticutils.futures import (
+    DEFAULT_MAX_WORKERS, ThreadPoolExecutor, TimeoutError, as_completed)
+from elasticutils.transport import HostSelector
+
+
+#: Number of recent search times a Hedger learns its delay from.
+HEDGE_WINDOW = 100
+
+#: Number of search times a Hedger needs before it learns a delay.
+HEDGE_MIN_SAMPLES = 20
+
+
+class HedgeStats(namedtuple('HedgeStats', [
+        'searches', 'hedged', 'won', 'throttled', 'delay'])):
+    """Statistics for a :py:class:`Hedger`
+
+    :property searches: the number of searches executed
+    :property hedged: the number of them that were sent again
+    :property won: the number of hedges that returned first
+    :property throttled: the number of searches that were slow enough
+        to hedge but weren't because of `max_rate`
+    :property delay: the seconds a search waits before it's hedged now
+        or None if it's still learning
+
+    """
+    __slots__ = ()
+
+    @property
+    def hedge_rate(self):
+        """The fraction of searches that were hedged."""
+        if not self.searches:
+            return 0.0
+        return float(self.hedged) / self.searches
+
+    @property
+    def win_rate(self):
+        """The fraction of hedges that returned first."""
+        if not self.hedged:
+            return 0.0
+        return float(self.won) / self.hedged
+
+
+class Hedger(object):
+    """Sends slow searches again and takes the first response.
+
+    :arg delay: the seconds to wait for a response before hedging;
+        None learns it from recent searches
+    :arg percentile: with no `delay`, hedge searches slower than this
+        percentile of the last ``HEDGE_WINDOW`` searches
+    :arg max_rate: the most hedges per search over time
+    :arg burst: the most hedges in a row when searches have been
+        fast for a while
+    :arg max_workers: the most threads to send hedges in
+
+    The first request of each search is sent from a worker thread of
+    its own, so the caller can get the hedge's response while the
+    first request is still going. There are as many of those threads
+    as searches at a time; only the hedges share `max_workers`
+    threads. Until there's a delay, searches aren't hedged and the
+    first request is sent from the caller's thread.
+    When the search goes through a
+    :py:class:`elasticutils.transport.HostSelector`, the hedge goes
+    to another host than the first request.
+
+    The delay is learned from how long the first request of each
+    search took, whether or not it was hedged. Until there are
+    ``HEDGE_MIN_SAMPLES`` of them, nothing is hedged.
+
+    Hedges are rationed: each search earns `max_rate` of a hedge and
+    there can be at most `burst` saved up. Slow searches that come
+    when there are none left wait for their first request.
+
+    The request that loses is cancelled if it hasn't been sent yet.
+    Elasticsearch can't stop a search that's running, so otherwise it
+    finishes in the background and its response is dropped.
+
+    If a request fails, the search gets the other one's response. If
+    both fail, it raises the first one's error. A search that fails
+    before it's hedged isn't hedged: pyelasticsearch's ``max_retries``
+    covers that.
+
+    This is thread-safe.
+
+    """
+    def __init__(self, delay=None, percentile=95, max_rate=0.1, burst=10,
+                 max_workers=DEFAULT_MAX_WORKERS):
+        if not 0 < percentile <= 100:
+            raise ValueError('percentile must be between 0 and 100')
+        self.delay = delay
+        self.percentile = percentile
+        self.max_rate = max_rate
+        self.burst = burst
+        self.max_workers = max_workers
+        self._reset()
+
+    def _reset(self):
+        # Threads don't survive os.fork(), so a forked child gets new
+        # workers.
+        self._lock = Lock()
+        self._pid = os.getpid()
+        # The first requests mustn't queue behind each other, so they
+        # get a thread each; idle ones are reused.
+        self._first_executor = ThreadPoolExecutor(sys.maxsize)
+        self._executor = ThreadPoolExecutor(self.max_workers)
+        self._times = deque(maxlen=HEDGE_WINDOW)
+        self._tokens = float(self.burst)
+        self._searches = 0
+        self._hedged = 0
+        self._won = 0
+        self._throttled = 0
+
+    def get_delay(self):
+        """Returns the seconds to wait before hedging or None"""
+        if self.delay is not None:
+            return self.delay
+        with self._lock:
+            times = sorted(self._times)
+        if len(times) < HEDGE_MIN_SAMPLES:
+            return None
+        rank = int(math.ceil(self.percentile / 100.0 * len(times)))
+        return times[max(rank, 1) - 1]
+
+    def _record(self, elapsed):
+        with self._lock:
+            self._times.append(elapsed)
+
+    def _take_hedge(self):
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                self._hedged += 1
+                return True
+            self._throttled += 1
+            return False
+
+    def _send(self, s, selector, picked, avoid, record=False):
+        start = time.time()
+        if selector is None:
+            response = s.raw()
+        else:
+            with selector.steer(picked, avoid):
+                response = s.raw()
+        if record:
+            self._record(time.time() - start)
+        return response
+
+    def raw(self, s):
+        """Executes a search and returns the response.
+
+        :arg s: the S to execute
+
+        :returns: the response like ``s.raw()``
+
+        :raises: whatever ``s.raw()`` would if the search fails
+
+        """
+        if self._pid != os.getpid():
+            self._reset()
+
+        with self._lock:
+            self._searches += 1
+            self._tokens = min(self._tokens + self.max_rate, self.burst)
+        delay = self.get_delay()
+
+        servers = getattr(s.get_es(), 'servers', None)
+        selector = servers if isinstance(servers, HostSelector) else None
+
+        picked = []
+        if delay is None:
+            return self._send(s, selector, picked, (), record=True)
+        first = self._first_executor.submit(
+            self._send, s, selector, picked, (), record=True)
+        try:
+            return first.result(delay)
+        except TimeoutError:
+            pass
+        if not self._take_hedge():
+            return first.result()
+
+        hedge = self._executor.submit(
+            self._send, s, selector, None, list(picked))
+        for future in as_completed([first, hedge]):
+            if future.exception() is None:
+                if future is hedge:
+                    first.cancel()
+                    with self._lock:
+                        self._won += 1
+                else:
+                    hedge.cancel()
+                return future.result()
+        return first.result()
+
+    def stats(self):
+        """Returns a :py:class:`HedgeStats`."""
+        delay = self.get_delay()
+        with self._lock:
+            return HedgeStats(self._searches, self._hedged, self._won,
+                              self._throttled, delay)
@@ -0,0 +1,174 @@
+import json
+import re
+import uuid
+from decimal import Decimal
+
+import simplejson
+
+
+class RawJSON(object):
+    """A pre-serialized piece of JSON
+
+    Serializers splice the JSON in as is, so a big list of ids or a
+    filter that's the same for every request only gets serialized
+    once::
+
+        ids = RawJSON.from_value(big_list_of_ids)
+
+        S().filter(id__in=ids)
+
+    The JSON isn't checked, so make sure it's valid.
+
+    :arg value: str or unicode; the JSON text
+
+    """
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        if isinstance(value, unicode):
+            value = value.encode('utf-8')
+        self.value = value
+
+    @classmethod
+    def from_value(cls, value, serializer=None):
+        """Serializes value and returns it as a RawJSON
+
+        :arg value: the Python value to serialize
+        :arg serializer: the serializer to use; defaults to the one
+            returned by :py:func:`get_serializer`
+
+        """
+        if serializer is None:
+            serializer = get_serializer()
+        return cls(serializer.dumps(value))
+
+    def __eq__(self, other):
+        return isinstance(other, RawJSON) and self.value == other.value
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((RawJSON, self.value))
+
+    def __repr__(self):
+        if len(self.value) > 50:
+            return '<RawJSON %s...>' % self.value[:50]
+        return '<RawJSON %s>' % self.value
+
+
+def to_json_default(value):
+    """Converts values the json module doesn't know about
+
+    This converts the same things pyelasticsearch does: dates and
+    datetimes to ISO 8601 strings, sets to lists and strs to unicode.
+    Decimals become numbers without losing precision. RawJSON values
+    are returned as is for the serializer to splice in.
+
+    :raises TypeError: if value can't be converted
+
+    """
+    if isinstance(value, RawJSON):
+        return value
+    if hasattr(value, 'strftime'):
+        if hasattr(value, 'hour'):
+            return value.isoformat()
+        return '%sT00:00:00' % value.isoformat()
+    if isinstance(value, str):
+        return unicode(value, errors='replace')
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if isinstance(value, Decimal):
+        return RawJSON(str(value))
+    raise TypeError('%r is not JSON serializable' % (value,))
+
+
+class JSONSerializer(object):
+    """Serializes request bodies with the json module
+
+    This is the default serializer. To use a different one, pass an
+    instance of a subclass to :py:func:`set_serializer`. Subclasses
+    need to implement ``dumps`` and ``loads`` and ``dumps`` needs to
+    splice :py:class:`RawJSON` values in as is.
+
+    """
+    # Placeholders that RawJSON values are replaced with. The nonce
+    # makes sure they don't show up in real data.
+    _nonce = uuid.uuid4().hex
+    _placeholder = '@@RawJSON-' + _nonce + '-%d@@'
+    _placeholder_re = re.compile('"@@RawJSON-' + _nonce + r'-(\d+)@@"')
+
+    def dumps(self, value):
+        """Returns value serialized as a JSON str"""
+        fragments = []
+
+        def default(value):
+            value = to_json_default(value)
+            if isinstance(value, RawJSON):
+                fragments.append(value.value)
+                return self._placeholder % (len(fragments) - 1)
+            return value
+
+        text = json.dumps(value, default=default, separators=(',', ':'))
+        if fragments:
+            text = self._placeholder_re.sub(
+                lambda match: fragments[int(match.group(1))], text)
+        return text
+
+    def loads(self, text):
+        """Returns the Python value for JSON text"""
+        return json.loads(text)
+
+
+class SimpleJSONSerializer(JSONSerializer):
+    """Serializes request bodies with simplejson
+
+    simplejson's C speedups are faster than the json module's for
+    most request bodies and it has native support for raw JSON.
+
+    """
+    def __init__(self):
+        if not hasattr(simplejson, 'RawJSON'):
+            raise ImportError('SimpleJSONSerializer requires simplejson '
+                              '3.12 or later.')
+
+    def _default(self, value):
+        value = to_json_default(value)
+        if isinstance(value, RawJSON):
+            return simplejson.RawJSON(value.value)
+        return value
+
+    def dumps(self, value):
+        """Returns value serialized as a JSON str"""
+        return simplejson.dumps(value, default=self._default,
+                                separators=(',', ':'), use_decimal=True)
+
+    def loads(self, text):
+        """Returns the Python value for JSON text"""
+        return simplejson.loads(text, use_decimal=True)
+
+
+_serializer = JSONSerializer()
+
+
+def get_serializer():
+    """Returns the serializer used for request bodies"""
+    return _serializer
+
+
+def set_serializer(serializer):
+    """Sets the serializer used for request bodies
+
+    :arg serializer: a :py:class:`JSONSerializer` or something with
+        the same ``dumps`` and ``loads`` methods
+
+    Example::
+
+        from elasticutils.serializers import (
+            SimpleJSONSerializer, set_serializer)
+
+        set_serializer(SimpleJSONSerializer())
+
+    """
+    global _serializer
+    _serializer = serializer
@@ -1,4 +1,9 @@
+import json
+import socket
+import threading
 import time
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
 from unittest import TestCase
 
 from nose import SkipTest
@@ -133,3 +138,251 @@ class ESTestCase(TestCase):
 
 def facet_counts_dict(qs, field):
     return dict((t['term'], t['count']) for t in qs.facet_counts()[field])
+
+
+def evaluate_filter(f, doc):
+    """Returns whether filter dict f matches doc.
+
+    This knows a small subset of the Elasticsearch filter dsl and
+    field values are compared as is. It's for checking that filters
+    that are built differently match the same documents.
+
+    """
+    name, val = f.items()[0]
+    if name == 'and':
+        return all(evaluate_filter(child, doc) for child in val)
+    if name == 'or':
+        return any(evaluate_filter(child, doc) for child in val)
+    if name == 'not':
+        return not evaluate_filter(val['filter'], doc)
+    if name == 'bool':
+        must, should, must_not = [
+            val.get(occur, []) for occur in ('must', 'should', 'must_not')]
+        must, should, must_not = [
+            [clauses] if isinstance(clauses, dict) else clauses
+            for clauses in (must, should, must_not)]
+        return (all(evaluate_filter(child, doc) for child in must)
+                and (not should
+                     or any(evaluate_filter(child, doc) for child in should))
+                and not any(evaluate_filter(child, doc) for child in must_not))
+
+    if name == 'script':
+        # Scripts built by ScriptS compare a field to a value.
+        params = val['params']
+        return doc.get(params['field']) == params['value']
+
+    field, value = val.items()[0]
+    if name == 'term':
+        return doc.get(field) == value
+    if name in ('terms', 'in'):
+        return doc.get(field) in value
+    if name == 'missing':
+        return doc.get(value) is None
+    if name == 'prefix':
+        return unicode(doc.get(field, '')).startswith(value)
+    if name == 'range':
+        if field not in doc:
+            return False
+        for op, bound in value.items():
+            if op == 'gt' and not doc[field] > bound:
+                return False
+            if op == 'gte' and not doc[field] >= bound:
+                return False
+            if op == 'lt' and not doc[field] < bound:
+                return False
+            if op == 'lte' and not doc[field] <= bound:
+                return False
+        return True
+    raise ValueError('Unknown filter {0}'.format(name))
+
+
+#: Fields and values random_f and random_docs pick from.
+RANDOM_FIELDS = ('a', 'b', 'c')
+RANDOM_VALUES = (1, 2, 3, 4)
+
+
+class ScriptS(S):
+    """S with a ``script`` field action that evaluate_filter knows"""
+    def process_filter_script(self, key, val, action):
+        return {'script': {
+            'script': 'doc[field].value == value',
+            'params': {'field': key, 'value': val}}}
+
+
+def random_f(rng, depth=3, scripts=False):
+    """Returns a random F tree built with rng.
+
+    :arg rng: a ``random.Random``
+    :arg depth: maximum nesting depth of the tree
+    :arg scripts: whether to include ``script`` actions which need a
+        :py:class:`ScriptS` to compile
+
+    """
+    from elasticutils import F
+
+    choice = rng.randint(0, 9 if depth > 0 else 4)
+    field = rng.choice(RANDOM_FIELDS)
+    value = rng.choice(RANDOM_VALUES)
+    if choice == 0 and scripts:
+        return F(**{field + '__script': value})
+    if choice <= 1:
+        return F(**{field: value})
+    if choice == 2:
+        return F(**{field + '__in': rng.sample(RANDOM_VALUES, 2)})
+    if choice == 3:
+        action = rng.choice(('gt', 'gte', 'lt', 'lte'))
+        return F(**{field + '__' + action: value})
+    if choice == 4:
+        return F(**{field + '__prefix': unicode(value)})
+    if choice <= 6:
+        return (random_f(rng, depth - 1, scripts)
+                | random_f(rng, depth - 1, scripts))
+    if choice <= 8:
+        return (random_f(rng, depth - 1, scripts)
+                & random_f(rng, depth - 1, scripts))
+    return ~random_f(rng, depth - 1, scripts)
+
+
+def random_docs(rng, count=50):
+    """Returns count random documents built with rng."""
+    docs = []
+    for i in range(count):
+        doc = {}
+        for field in RANDOM_FIELDS:
+            if rng.random() < 0.9:
+                doc[field] = rng.choice(RANDOM_VALUES)
+        docs.append(doc)
+    return docs
+
+
+def search_response(hits=(), took=1):
+    """Returns a search response for hits like Elasticsearch's."""
+    hits = list(hits)
+    return {
+        'took': took,
+        'timed_out': False,
+        '_shards': {'total': 1, 'successful': 1, 'failed': 0},
+        'hits': {'total': len(hits), 'max_score': 1.0, 'hits': hits},
+    }
+
+
+def default_responder(method, path, body):
+    """Responds to everything with an empty search response."""
+    return 200, search_response()
+
+
+class _FakeESHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.server.fake.connection_made(self.connection)
+
+    def _respond(self):
+        fake = self.server.fake
+        length = int(self.headers.get('content-length') or 0)
+        body = self.rfile.read(length) if length else ''
+        fake.request_made(self.command, self.path, body)
+
+        status, response = fake.responder(self.command, self.path, body)
+        if not isinstance(response, basestring):
+            response = json.dumps(response)
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(response)))
+        if not fake.keep_alive:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(response)
+
+        if fake.drop_connections:
+            # Close the connection without telling the client, like a
+            # server closing idle keep-alive connections does.
+            self.close_connection = 1
+
+    do_GET = do_POST = do_PUT = do_DELETE = do_HEAD = _respond
+
+    def log_message(self, *args):
+        pass
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Tests time out and hang up on it on purpose.
+        pass
+
+
+class FakeESServer(object):
+    """Stand-in Elasticsearch HTTP server on localhost for tests.
+
+    :arg responder: function taking ``(method, path, body)`` and
+        returning ``(status, response)`` where response is something
+        to serialize as JSON or a str; defaults to responding to
+        everything with an empty search response
+
+    :property url: the url of the server
+    :property requests: list of ``(method, path, body)`` requests it
+        got
+    :property connections: the number of connections it accepted
+    :property keep_alive: set this to False to close connections
+        after every response
+    :property drop_connections: set this to True to close connections
+        after every response without saying so, like servers that
+        time out idle connections
+
+    Example::
+
+        server = FakeESServer().start()
+        try:
+            es = get_es(urls=[server.url], force_new=True)
+            ...
+        finally:
+            server.stop()
+
+    """
+    def __init__(self, responder=None):
+        self.responder = responder or default_responder
+        self.requests = []
+        self.connections = 0
+        self.keep_alive = True
+        self.drop_connections = False
+        self._lock = threading.Lock()
+        self._server = None
+        self._sockets = []
+
+    def connection_made(self, sock):
+        with self._lock:
+            self.connections += 1
+            self._sockets.append(sock)
+
+    def request_made(self, method, path, body):
+        with self._lock:
+            self.requests.append((method, path, body))
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{0}'.format(self._server.server_port)
+
+    def start(self):
+        self._server = _ThreadingHTTPServer(('127.0.0.1', 0), _FakeESHandler)
+        self._server.fake = self
+        thread = threading.Thread(
+            target=self._server.serve_forever, kwargs={'poll_interval': 0.01})
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        # Hang up on keep-alive connections so their threads finish.
+        with self._lock:
+            sockets, self._sockets = self._sockets, []
+        for sock in sockets:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
@@ -0,0 +1,123 @@
+import random
+from unittest import TestCase
+
+from nose.tools import eq_
+
+from elasticutils import S, F
+from elasticutils.tests import (
+    ScriptS, evaluate_filter, random_docs, random_f)
+
+
+def get_filter(s):
+    return s._build_query().get('filter')
+
+
+class BoolFiltersTest(TestCase):
+    def test_off_by_default(self):
+        s = S().filter(F(a=1) | F(b=2))
+        eq_(get_filter(s), {'or': [{'term': {'a': 1}}, {'term': {'b': 2}}]})
+
+    def test_and(self):
+        s = S().filter(a=1).filter(b=2).bool_filters()
+        eq_(get_filter(s), {'bool': {'must': [
+            {'term': {'a': 1}}, {'term': {'b': 2}}]}})
+
+        # A single filter isn't wrapped.
+        s = S().filter(a=1).bool_filters()
+        eq_(get_filter(s), {'term': {'a': 1}})
+
+    def test_or(self):
+        s = S().filter(F(a=1) | F(b__gt=2)).bool_filters()
+        eq_(get_filter(s), {'bool': {'should': [
+            {'term': {'a': 1}}, {'range': {'b': {'gt': 2}}}]}})
+
+    def test_not(self):
+        s = S().filter(~F(a=1)).bool_filters()
+        eq_(get_filter(s), {'bool': {'must_not': [{'term': {'a': 1}}]}})
+
+        # Nots in an and go in its must_not.
+        s = S().filter(~F(a=1), b=2).bool_filters()
+        eq_(get_filter(s), {'bool': {
+            'must': [{'term': {'b': 2}}],
+            'must_not': [{'term': {'a': 1}}]}})
+
+    def test_nested(self):
+        s = S().filter((F(a=1) | F(b=2)) & ~(F(c=3) & F(d=4))).bool_filters()
+        eq_(get_filter(s), {'bool': {
+            'must': [{'bool': {'should': [
+                {'term': {'a': 1}}, {'term': {'b': 2}}]}}],
+            'must_not': [{'bool': {'must': [
+                {'term': {'c': 3}}, {'term': {'d': 4}}]}}]}})
+
+    def test_scripts_fall_back(self):
+        s = (ScriptS().filter(a__script=1)
+                      .filter(b=2)
+                      .filter(c=3)
+                      .bool_filters())
+        eq_(get_filter(s), {'and': [
+            {'bool': {'must': [{'term': {'b': 2}}, {'term': {'c': 3}}]}},
+            {'script': {'script': 'doc[field].value == value',
+                        'params': {'field': 'a', 'value': 1}}}]})
+
+        s = ScriptS().filter(F(a__script=1) | F(b=2) | F(c=3)).bool_filters()
+        eq_(get_filter(s), {'or': [
+            {'bool': {'should': [{'term': {'b': 2}}, {'term': {'c': 3}}]}},
+            {'script': {'script': 'doc[field].value == value',
+                        'params': {'field': 'a', 'value': 1}}}]})
+
+        s = ScriptS().filter(~F(a__script=1)).bool_filters()
+        eq_(get_filter(s), {'not': {'filter': {'script': {
+            'script': 'doc[field].value == value',
+            'params': {'field': 'a', 'value': 1}}}}})
+
+    def test_filter_raw_left_alone(self):
+        raw = {'and': [{'term': {'a': 1}}, {'term': {'b': 1}}]}
+        eq_(get_filter(S().filter_raw(raw).bool_filters()), raw)
+
+    def test_default_bool_filters(self):
+        class BoolS(S):
+            default_bool_filters = True
+
+        s = BoolS().filter(a=1).filter(b=2)
+        eq_(get_filter(s), {'bool': {'must': [
+            {'term': {'a': 1}}, {'term': {'b': 2}}]}})
+        eq_(get_filter(s.bool_filters(False)), {'and': [
+            {'term': {'a': 1}}, {'term': {'b': 2}}]})
+
+    def test_with_optimize(self):
+        s = (S().filter(F(a=1) | F(a=2))
+                .filter(b__gt=1)
+                .filter(c=1)
+                .optimize()
+                .bool_filters())
+        eq_(get_filter(s), {'bool': {'must': [
+            {'terms': {'a': [1, 2]}},
+            {'term': {'c': 1}},
+            {'range': {'b': {'gt': 1}}}]}})
+
+    def test_facet_filter(self):
+        s = (S().filter(a=1)
+                .filter(b=2)
+                .facet('tag', filtered=True)
+                .bool_filters())
+        eq_(s._build_query()['facets']['tag']['facet_filter'],
+            {'bool': {'must': [{'term': {'a': 1}}, {'term': {'b': 2}}]}})
+
+    def test_equivalence(self):
+        rng = random.Random(42)
+        docs = random_docs(rng)
+        for i in range(500):
+            f = random_f(rng, scripts=True)
+            for s in (ScriptS().filter(f),
+                      ScriptS().filter(f, a__script=rng.choice([1, 2]))):
+                before = get_filter(s)
+                after = get_filter(s.bool_filters())
+                optimized = get_filter(s.optimize().bool_filters())
+                for doc in docs:
+                    expected = evaluate_filter(before, doc)
+                    eq_(expected, evaluate_filter(after, doc),
+                        '{0!r} and {1!r} differ on {2!r}'.format(
+                            before, after, doc))
+                    eq_(expected, evaluate_filter(optimized, doc),
+                        '{0!r} and {1!r} differ on {2!r}'.format(
+                            before, optimized, doc))
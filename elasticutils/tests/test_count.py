@@ -0,0 +1,194 @@
+import json
+import time
+from unittest import TestCase
+
+from nose.tools import eq_
+
+import elasticutils
+from elasticutils import MappingType, S, Param, get_es
+from elasticutils.tests import FakeESServer, search_response
+
+
+class CountTest(TestCase):
+    total = 3
+
+    def setUp(self):
+        super(CountTest, self).setUp()
+        self.server = FakeESServer(self.respond).start()
+        self.es = get_es(urls=[self.server.url], force_new=True)
+        self.s_classes = {}
+        elasticutils._count_cache.clear()
+
+    def tearDown(self):
+        self.es.session.close()
+        self.server.stop()
+        elasticutils._count_cache.clear()
+        super(CountTest, self).tearDown()
+
+    def respond(self, method, path, body):
+        body = json.loads(body)
+        if 'search_type=count' in path:
+            hits = []
+        else:
+            size = body.get('size', 10)
+            hits = [{'_id': str(i), '_type': 'doctype123', '_score': 1.0,
+                     '_source': {'id': i}}
+                    for i in range(min(size, self.total))]
+        response = search_response(hits)
+        response['hits']['total'] = self.total
+        return 200, response
+
+    def get_s(self, count_ttl=0):
+        # The class is part of the fingerprint, so reuse it.
+        s_class = self.s_classes.get(count_ttl)
+        if s_class is None:
+            es = self.es
+
+            class FakeS(S):
+                default_count_ttl = count_ttl
+
+                def get_es(self):
+                    return es
+
+            s_class = self.s_classes[count_ttl] = FakeS
+        return s_class().indexes('index123').doctypes('doctype123')
+
+    def test_count_request(self):
+        s = (self.get_s().query(title__text='red').filter(id=1)
+                         .facet('tag').order_by('id').highlight('title'))
+        eq_(s.count(), 3)
+
+        eq_(len(self.server.requests), 1)
+        method, path, body = self.server.requests[0]
+        eq_(path, '/index123/doctype123/_search?search_type=count')
+        # Only the parts that change the total are sent.
+        eq_(json.loads(body), {'query': {'text': {'title': 'red'}},
+                               'filter': {'term': {'id': 1}}})
+
+    def test_count_cached_on_s(self):
+        s = self.get_s()
+        eq_(s.count(), 3)
+        eq_(s.count(), 3)
+        eq_(len(self.server.requests), 1)
+
+        # Without a count TTL, equivalent searches make a request.
+        eq_(self.get_s().count(), 3)
+        eq_(len(self.server.requests), 2)
+
+    def test_count_after_execute(self):
+        s = self.get_s()
+        s.execute()
+        eq_(s.count(), 3)
+        eq_(len(self.server.requests), 1)
+
+    def test_count_of_empty_results(self):
+        self.total = 0
+        s = self.get_s()
+        eq_(len(s.execute()), 0)
+        eq_(s.count(), 0)
+        eq_(len(self.server.requests), 1)
+
+    def test_count_ttl(self):
+        eq_(self.get_s(count_ttl=60).filter(id=1).count(), 3)
+        # Equivalent searches and slices of them share the total.
+        eq_(self.get_s(count_ttl=60).filter(id=1).count(), 3)
+        eq_(self.get_s(count_ttl=60).filter(id=1)[10:20].count(), 3)
+        eq_(len(self.server.requests), 1)
+
+        # Different searches don't.
+        eq_(self.get_s(count_ttl=60).filter(id=2).count(), 3)
+        eq_(len(self.server.requests), 2)
+
+    def test_count_ttl_mapping_types(self):
+        class A(MappingType):
+            @classmethod
+            def get_index(cls):
+                return 'ia'
+
+            @classmethod
+            def get_mapping_type_name(cls):
+                return 'a'
+
+        class B(A):
+            @classmethod
+            def get_index(cls):
+                return 'ib'
+
+            @classmethod
+            def get_mapping_type_name(cls):
+                return 'b'
+
+        # The same steps search different indexes and doctypes, so
+        # they don't share the total.
+        FakeS = type(self.get_s(count_ttl=60))
+        FakeS(A).filter(id=1)._set_total(42)
+        eq_(FakeS(B).filter(id=1).count(), 3)
+        eq_(len(self.server.requests), 1)
+        eq_(self.server.requests[0][1].split('?')[0], '/ib/b/_search')
+        eq_(FakeS(A).filter(id=1).count(), 42)
+        eq_(len(self.server.requests), 1)
+
+        # Nor do explicit indexes.
+        eq_(FakeS(A).indexes('ib').filter(id=1).count(), 3)
+        eq_(len(self.server.requests), 2)
+
+    def test_count_ttl_expires(self):
+        eq_(self.get_s(count_ttl=0.05).count(), 3)
+        time.sleep(0.1)
+        self.total = 4
+        eq_(self.get_s(count_ttl=0.05).count(), 4)
+        eq_(len(self.server.requests), 2)
+
+    def test_count_ttl_execute(self):
+        # Executing a search remembers its total, too.
+        self.get_s(count_ttl=60).filter(id=1).execute()
+        eq_(self.get_s(count_ttl=60).filter(id=1).count(), 3)
+        eq_(len(self.server.requests), 1)
+
+    def test_count_ttl_bound_params(self):
+        prepared = self.get_s(count_ttl=60).filter(id=Param('id')).prepare()
+        prepared.bind(id=1).count()
+        prepared.bind(id=1).count()
+        eq_(len(self.server.requests), 1)
+        prepared.bind(id=2).count()
+        eq_(len(self.server.requests), 2)
+
+    def test_all_one_request(self):
+        results = self.get_s().all()
+        eq_(len(results), 3)
+        eq_(len(self.server.requests), 1)
+        eq_(json.loads(self.server.requests[0][2])['size'],
+            elasticutils.ALL_FIRST_SIZE)
+
+    def test_all_known_total(self):
+        s = self.get_s()
+        s.count()
+        eq_(len(s.all()), 3)
+        eq_(len(self.server.requests), 2)
+        eq_(json.loads(self.server.requests[1][2])['size'], 3)
+
+    def test_all_many_results(self):
+        self.total = elasticutils.ALL_FIRST_SIZE + 10
+        results = self.get_s().all()
+        eq_(len(results), self.total)
+        eq_(len(self.server.requests), 2)
+        eq_(json.loads(self.server.requests[1][2])['size'], self.total)
+
+    def test_all_known_empty(self):
+        self.total = 0
+        s = self.get_s()
+        eq_(s.count(), 0)
+        results = s.all()
+        eq_((len(results), results.count), (0, 0))
+        eq_(len(self.server.requests), 1)
+
+        # The cached total works the same.
+        eq_(self.get_s(count_ttl=60).filter(id=1).count(), 0)
+        eq_(len(self.get_s(count_ttl=60).filter(id=1).all()), 0)
+        eq_(len(self.server.requests), 2)
+
+        # Facets need a search.
+        s = self.get_s().facet('tag')
+        s.count()
+        s.all()
+        eq_(len(self.server.requests), 4)
@@ -0,0 +1,172 @@
+import threading
+import time
+from unittest import TestCase
+
+from nose.tools import eq_
+from pyelasticsearch.exceptions import ElasticHttpError
+
+from elasticutils import S, get_es
+from elasticutils.dispatch import DispatchStats, MSearchDispatcher
+from elasticutils.tests import FakeESServer
+from elasticutils.tests.test_msearch import msearch_responder
+
+
+def failing_responder(method, path, body):
+    """Like msearch_responder, but searches with a ``fail`` filter
+    sent on their own get a 400 too"""
+    if path != '/_msearch' and '"fail"' in body:
+        return 400, {'error': 'SearchPhaseExecutionException[fail]',
+                     'status': 400}
+    return msearch_responder(method, path, body)
+
+
+class MSearchDispatcherTest(TestCase):
+    def setUp(self):
+        super(MSearchDispatcherTest, self).setUp()
+        self.server = FakeESServer(msearch_responder).start()
+        self.es = get_es(urls=[self.server.url], force_new=True)
+
+    def tearDown(self):
+        self.es.session.close()
+        self.server.stop()
+        super(MSearchDispatcherTest, self).tearDown()
+
+    def get_s(self, dispatcher):
+        es = self.es
+
+        class FakeS(S):
+            default_dispatcher = dispatcher
+
+            def get_es(self):
+                return es
+
+        return FakeS().indexes('index123').doctypes('doctype123')
+
+    def execute_in_threads(self, searches, delay=0):
+        """Executes each search in its own thread
+
+        :arg delay: seconds between starting threads
+
+        :returns: list of the results or exception for each search
+
+        """
+        outcomes = [None] * len(searches)
+        start = threading.Event()
+
+        def execute(i, s):
+            start.wait()
+            try:
+                outcomes[i] = s.execute()
+            except Exception as exc:
+                outcomes[i] = exc
+
+        threads = [threading.Thread(target=execute, args=(i, s))
+                   for i, s in enumerate(searches)]
+        if delay:
+            start.set()
+        for thread in threads:
+            thread.start()
+            time.sleep(delay)
+        start.set()
+        for thread in threads:
+            thread.join()
+        return outcomes
+
+    def test_coalesces(self):
+        dispatcher = MSearchDispatcher(window=0.05, max_batch=20)
+        searches = [self.get_s(dispatcher).filter(id=i) for i in range(8)]
+        outcomes = self.execute_in_threads(searches)
+
+        assert len(self.server.requests) <= 2, self.server.requests
+        for method, path, body in self.server.requests:
+            eq_(path, '/_msearch')
+        # Everyone got the results of their own search.
+        for s, results in zip(searches, outcomes):
+            eq_(results.results[0]['_source']['query'], s._build_query())
+            assert s.execute() is results
+
+        stats = dispatcher.stats()
+        eq_(stats.searches, 8)
+        eq_(stats.batches, len(self.server.requests))
+        assert stats.mean_batch_size >= 4
+
+    def test_max_batch(self):
+        # The window is long, so batches are sent because they're full.
+        dispatcher = MSearchDispatcher(window=5, max_batch=3)
+        searches = [self.get_s(dispatcher).filter(id=i) for i in range(6)]
+        start = time.time()
+        outcomes = self.execute_in_threads(searches)
+
+        assert time.time() - start < 2
+        eq_(len(self.server.requests), 2)
+        eq_(dispatcher.stats().max_batch_size, 3)
+        eq_(len([o for o in outcomes if o is not None]), 6)
+
+    def test_max_wait(self):
+        # Searches keep arriving within the window, but a batch isn't
+        # held for more than max_wait.
+        dispatcher = MSearchDispatcher(window=0.05, max_batch=100,
+                                       max_wait=0.1)
+        searches = [self.get_s(dispatcher).filter(id=i) for i in range(10)]
+        self.execute_in_threads(searches, delay=0.03)
+
+        stats = dispatcher.stats()
+        assert stats.batches >= 2, stats
+        assert stats.max_wait < 0.2, stats
+
+    def test_errors(self):
+        self.server.responder = failing_responder
+        dispatcher = MSearchDispatcher(window=0.05)
+        s = self.get_s(dispatcher)
+        outcomes = self.execute_in_threads(
+            [s.filter(id=1), s.filter(fail=True), s.filter(id=2)])
+
+        # The failed search was sent again on its own.
+        eq_([path for method, path, body in self.server.requests],
+            ['/_msearch', '/index123/doctype123/_search'])
+        eq_(len(outcomes[0]), 1)
+        assert isinstance(outcomes[1], ElasticHttpError)
+        eq_(len(outcomes[2]), 1)
+
+    def test_same_error_as_execute(self):
+        self.server.responder = failing_responder
+        s = self.get_s(None).filter(fail=True)
+        try:
+            s.execute()
+        except Exception as exc:
+            expected = exc
+
+        try:
+            self.get_s(MSearchDispatcher()).filter(fail=True).execute()
+        except Exception as exc:
+            eq_(type(exc), type(expected))
+            eq_((exc.status_code, exc.error),
+                (expected.status_code, expected.error))
+        else:
+            raise AssertionError('The search should have failed.')
+
+    def test_request_error(self):
+        dispatcher = MSearchDispatcher(window=0.01)
+        self.server.responder = lambda method, path, body: (
+            500, {'error': 'broken', 'status': 500})
+        s = self.get_s(dispatcher)
+        outcomes = self.execute_in_threads([s.filter(id=1), s.filter(id=2)])
+        for outcome in outcomes:
+            assert isinstance(outcome, Exception), outcome
+
+    def test_single_search(self):
+        dispatcher = MSearchDispatcher(window=0.01)
+        eq_(len(self.get_s(dispatcher).execute()), 1)
+        eq_(self.server.requests[0][1], '/_msearch')
+
+    def test_stats(self):
+        dispatcher = MSearchDispatcher()
+        eq_(dispatcher.stats(), DispatchStats(0, 0, 0, 0.0, 0.0, 0.0))
+        eq_(dispatcher.stats().mean_batch_size, 0.0)
+
+        list(self.get_s(dispatcher))
+        stats = dispatcher.stats()
+        eq_((stats.batches, stats.searches, stats.max_batch_size),
+            (1, 1, 1))
+        eq_(stats.mean_batch_size, 1.0)
+        assert stats.mean_request_time > 0
@@ -0,0 +1,108 @@
+import time
+from unittest import TestCase
+
+from nose.tools import eq_
+
+import elasticutils
+from elasticutils import MLT, S, get_es
+from elasticutils.tests import FakeESServer, search_response
+
+
+class EmptyResultsTest(TestCase):
+    def setUp(self):
+        super(EmptyResultsTest, self).setUp()
+        self.server = FakeESServer(self.respond).start()
+        self.es = get_es(urls=[self.server.url], force_new=True)
+        self.s_classes = {}
+        self.hits = []
+        elasticutils._empty_cache.clear()
+
+    def tearDown(self):
+        self.es.session.close()
+        self.server.stop()
+        elasticutils._empty_cache.clear()
+        super(EmptyResultsTest, self).tearDown()
+
+    def respond(self, method, path, body):
+        response = search_response(self.hits)
+        response['facets'] = {'tag': {'_type': 'terms', 'terms': []}}
+        return 200, response
+
+    def get_s(self, empty_ttl=0):
+        # The class is part of the fingerprint, so reuse it.
+        s_class = self.s_classes.get(empty_ttl)
+        if s_class is None:
+            es = self.es
+
+            class FakeS(S):
+                default_empty_ttl = empty_ttl
+
+                def get_es(self):
+                    return es
+
+            s_class = self.s_classes[empty_ttl] = FakeS
+        return s_class().indexes('index123').doctypes('doctype123')
+
+    def test_one_request(self):
+        s = self.get_s().facet('tag')
+        eq_(list(s), [])
+        eq_(len(s), 0)
+        eq_(s.count(), 0)
+        eq_(s.facet_counts(), {'tag': []})
+        eq_(list(s), [])
+        eq_(len(self.server.requests), 1)
+
+    def test_mlt_one_request(self):
+        mlt = MLT(1, s=self.get_s(), mlt_fields=['title'])
+        eq_(list(mlt), [])
+        eq_(len(mlt), 0)
+        eq_(len(self.server.requests), 1)
+
+    def test_no_empty_ttl(self):
+        self.get_s().execute()
+        self.get_s().execute()
+        eq_(len(self.server.requests), 2)
+
+    def test_empty_ttl(self):
+        results = self.get_s(empty_ttl=60).filter(id=1).execute()
+        eq_(len(results), 0)
+
+        # Equivalent searches, slices of them and their counts use the
+        # cached response. Each gets its own results.
+        s = self.get_s(empty_ttl=60).filter(id=1)[10:20]
+        other = s.execute()
+        eq_(len(other), 0)
+        assert other is not results
+        eq_(self.get_s(empty_ttl=60).filter(id=1).count(), 0)
+        eq_(len(self.server.requests), 1)
+
+        # Different searches don't.
+        self.get_s(empty_ttl=60).filter(id=2).execute()
+        eq_(len(self.server.requests), 2)
+
+    def test_empty_ttl_other_indexes(self):
+        eq_(list(self.get_s(empty_ttl=60).filter(id=1)), [])
+
+        # The same steps on other indexes or doctypes might find
+        # something.
+        self.hits = [{'_id': '1', '_type': 'doctype123', '_score': 1.0,
+                      '_source': {'id': 1}}]
+        eq_(len(self.get_s(empty_ttl=60).filter(id=1).indexes('other')
+                .execute()), 1)
+        eq_(len(self.get_s(empty_ttl=60).filter(id=1).doctypes('other')
+                .execute()), 1)
+        eq_(len(self.server.requests), 3)
+
+    def test_empty_ttl_expires(self):
+        self.get_s(empty_ttl=0.05).execute()
+        time.sleep(0.1)
+        self.get_s(empty_ttl=0.05).execute()
+        eq_(len(self.server.requests), 2)
+
+    def test_empty_ttl_ignores_hits(self):
+        # Only searches that found nothing are cached.
+        self.hits = [{'_id': '1', '_type': 'doctype123', '_score': 1.0,
+                      '_source': {'id': 1}}]
+        eq_(len(self.get_s(empty_ttl=60).execute()), 1)
+        eq_(len(self.get_s(empty_ttl=60).execute()), 1)
+        eq_(len(self.server.requests), 2)
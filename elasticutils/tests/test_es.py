@@ -1,15 +1,19 @@
+import os
+import threading
 from unittest import TestCase
 
 from nose.tools import eq_
 
-from elasticutils import get_es, _cached_elasticsearch
+import elasticutils
+from elasticutils import S, get_es, _cached_elasticsearch
+from elasticutils.tests import FakeESServer
 
 
 class ESTest(TestCase):
     def setUp(self):
         super(ESTest, self).setUp()
 
-        _cached_elasticsearch.clear()
+        get_es.cache_clear()
 
     def test_get_es_caching(self):
         """Test get_es caching."""
@@ -62,3 +66,103 @@ class ESTest(TestCase):
         es3 = get_es(max_retries=4, revival_delay=10)
         eq_(len(_cached_elasticsearch), 2)
         assert id(es) != id(es3)
+
+    def test_s_es_settings(self):
+        # Later .es() calls override earlier ones setting by setting.
+        s = (S().es(urls=['http://example.com:9200'], timeout=1)
+             .filter(id=1).es(timeout=2))
+        eq_(s.get_es(default_builder=lambda **kwargs: kwargs),
+            {'urls': ['http://example.com:9200'], 'timeout': 2})
+        eq_(S().get_es(default_builder=lambda **kwargs: kwargs), {})
+
+    def test_get_es_cache_info(self):
+        get_es()
+        get_es()
+        get_es(timeout=10)
+        eq_(get_es.cache_info(),
+            (1, 2, elasticutils.ES_CACHE_SIZE, 2))
+
+        get_es.cache_clear()
+        eq_(get_es.cache_info(), (0, 0, elasticutils.ES_CACHE_SIZE, 0))
+
+    def test_get_es_threads(self):
+        ess = []
+        start = threading.Event()
+
+        def get():
+            start.wait()
+            ess.append(get_es(timeout=7))
+
+        threads = [threading.Thread(target=get) for i in range(10)]
+        for thread in threads:
+            thread.start()
+        start.set()
+        for thread in threads:
+            thread.join()
+
+        eq_(len(ess), 10)
+        eq_(len(set(id(es) for es in ess)), 1)
+        eq_(get_es.cache_info().misses, 1)
+
+
+class ESCacheServerTest(TestCase):
+    def setUp(self):
+        super(ESCacheServerTest, self).setUp()
+        get_es.cache_clear()
+        self.server = FakeESServer().start()
+
+    def tearDown(self):
+        get_es.cache_clear()
+        self.server.stop()
+        super(ESCacheServerTest, self).tearDown()
+
+    def test_lru_evicts_and_closes(self):
+        cache = _cached_elasticsearch
+        cache.maxsize = 2
+        try:
+            es = get_es(urls=[self.server.url])
+            es.health()
+            eq_(es.session.stats()[self.server.url].idle, 1)
+
+            get_es(urls=[self.server.url], timeout=10)
+            get_es(urls=[self.server.url], timeout=11)
+            eq_(len(cache), 2)
+            assert get_es(urls=[self.server.url]) is not es
+            # The evicted ElasticSearch's connections were closed.
+            eq_(es.session.stats()[self.server.url].idle, 0)
+        finally:
+            cache.maxsize = elasticutils.ES_CACHE_SIZE
+
+    def test_fork(self):
+        es = get_es(urls=[self.server.url])
+        es.health()
+
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            # In the child, report what we find and exit without
+            # running the rest of the tests.
+            try:
+                os.close(read_fd)
+                checks = [
+                    get_es(urls=[self.server.url]) is not es,
+                    es.session.stats() == {},
+                ]
+                es.health()
+                checks.append(
+                    es.session.stats()[self.server.url].created == 1)
+                os.write(write_fd, repr(checks))
+            finally:
+                os._exit(0)
+
+        os.close(write_fd)
+        os.waitpid(pid, 0)
+        result = os.read(read_fd, 1024)
+        os.close(read_fd)
+
+        eq_(result, repr([True, True, True]))
+        # The child didn't use the parent's connection.
+        eq_(self.server.connections, 2)
+        # The parent still has its own.
+        assert get_es(urls=[self.server.url]) is es
+        eq_(es.session.stats()[self.server.url].idle, 1)
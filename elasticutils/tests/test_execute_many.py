@@ -0,0 +1,133 @@
+import json
+import threading
+import time
+from unittest import TestCase
+
+from nose.tools import eq_
+
+from elasticutils import S, execute_many, get_es
+from elasticutils.futures import ThreadPoolExecutor, TimeoutError
+from elasticutils.tests import FakeESServer, search_response
+
+
+def delay_responder(method, path, body):
+    """Sleeps for the value of the search's ``delay`` term filter
+
+    Searches with a ``fail`` term filter get an error.
+
+    """
+    term = json.loads(body).get('filter', {}).get('term', {})
+    if 'fail' in term:
+        return 500, {'error': 'failed', 'status': 500}
+    time.sleep(term.get('delay', 0))
+    hit = {'_id': '1', '_type': 'doctype123', '_score': 1.0,
+           '_source': {'term': term}}
+    return 200, search_response([hit])
+
+
+class ExecuteManyTest(TestCase):
+    def setUp(self):
+        super(ExecuteManyTest, self).setUp()
+        self.server = FakeESServer(delay_responder).start()
+        self.es = get_es(urls=[self.server.url], force_new=True,
+                         max_retries=0)
+
+    def tearDown(self):
+        self.es.session.close()
+        self.server.stop()
+        super(ExecuteManyTest, self).tearDown()
+
+    def get_s(self):
+        es = self.es
+
+        class FakeS(S):
+            def get_es(self):
+                return es
+
+        return FakeS().indexes('index123').doctypes('doctype123')
+
+    def test_ordered(self):
+        s = self.get_s()
+        delays = [0.2, 0.0, 0.1, 0.0]
+        searches = [s.filter(delay=delay) for delay in delays]
+
+        start = time.time()
+        results = list(execute_many(searches, max_workers=4))
+        # They ran at the same time.
+        assert time.time() - start < 0.35
+
+        eq_([pair[0] for pair in results], searches)
+        eq_([r.results[0]['_source']['term']['delay']
+             for search, r in results], delays)
+        # The results are cached on the searches.
+        for search, r in results:
+            assert search.execute() is r
+
+    def test_unordered(self):
+        s = self.get_s()
+        searches = [s.filter(delay=delay) for delay in [0.3, 0.0, 0.15]]
+        results = list(execute_many(searches, max_workers=3, ordered=False))
+        eq_([pair[0] for pair in results],
+            [searches[1], searches[2], searches[0]])
+
+    def test_max_workers(self):
+        s = self.get_s()
+        searches = [s.filter(delay=0.1) for i in range(4)]
+        start = time.time()
+        eq_(len(list(execute_many(searches, max_workers=2))), 4)
+        assert time.time() - start >= 0.2
+
+    def test_errors(self):
+        s = self.get_s()
+        searches = [s.filter(id=1), s.filter(fail=True), s.filter(id=2)]
+        results = list(execute_many(searches))
+
+        eq_(len(results[0][1]), 1)
+        assert isinstance(results[1][1], Exception)
+        eq_(len(results[2][1]), 1)
+
+    def test_timeout(self):
+        s = self.get_s()
+        searches = [s.filter(delay=0.5), s.filter(delay=0.0)]
+        start = time.time()
+        results = list(execute_many(searches, timeout=0.1))
+
+        assert time.time() - start < 0.4
+        assert isinstance(results[0][1], TimeoutError)
+        eq_(len(results[1][1]), 1)
+
+    def test_timeout_counts_from_start(self):
+        # With one worker, the second search waits for the first. The
+        # time it waits doesn't count against its timeout.
+        s = self.get_s()
+        searches = [s.filter(delay=0.15), s.filter(delay=0.15)]
+        results = list(execute_many(searches, max_workers=1, timeout=0.25))
+        for s, r in results:
+            eq_(len(r), 1)
+
+    def test_cancel(self):
+        s = self.get_s()
+        searches = [s.filter(delay=0.05 + i * 0.001) for i in range(6)]
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            for s, results in execute_many(searches, executor=executor):
+                break
+        # The ones that hadn't started didn't run.
+        assert len(self.server.requests) < 6, self.server.requests
+
+    def test_shares_connections(self):
+        s = self.get_s()
+        searches = [s.filter(id=i) for i in range(20)]
+        list(execute_many(searches, max_workers=2))
+        assert self.server.connections <= 2, self.server.connections
+
+    def test_empty(self):
+        eq_(list(execute_many([])), [])
+
+    def test_threads_are_stopped(self):
+        # Open the connection first so the server's thread for it is
+        # counted in before.
+        self.get_s().execute()
+        before = threading.active_count()
+        list(execute_many([self.get_s().filter(id=1)], max_workers=3))
+        time.sleep(0.05)
+        assert threading.active_count() <= before, threading.enumerate()
@@ -0,0 +1,191 @@
+import threading
+import time
+from unittest import TestCase
+
+from nose.tools import eq_
+
+from elasticutils import MLT, S, Indexable, MappingType, get_es
+from elasticutils.futures import (
+    CancelledError, Future, ThreadPoolExecutor, TimeoutError, as_completed,
+    get_default_executor)
+from elasticutils.tests import FakeESServer, search_response
+
+
+class FutureTest(TestCase):
+    def test_result(self):
+        future = Future()
+        assert not future.done()
+        self.assertRaises(TimeoutError, future.result, 0.01)
+
+        future.set_result(5)
+        assert future.done()
+        eq_(future.result(), 5)
+        eq_(future.exception(), None)
+
+    def test_exception(self):
+        future = Future()
+        future.set_exception(ValueError('bad'))
+        self.assertRaises(ValueError, future.result)
+        eq_(str(future.exception()), 'bad')
+
+    def test_cancel(self):
+        future = Future()
+        assert future.cancel()
+        assert future.cancelled()
+        assert not future.set_running_or_notify_cancel()
+        self.assertRaises(CancelledError, future.result)
+
+        future = Future()
+        assert future.set_running_or_notify_cancel()
+        assert not future.cancel()
+
+    def test_callbacks(self):
+        called = []
+        future = Future()
+        future.add_done_callback(called.append)
+        eq_(called, [])
+        future.set_result(1)
+        eq_(called, [future])
+
+        # Already done, so it's called right away.
+        future.add_done_callback(called.append)
+        eq_(called, [future, future])
+
+
+class ThreadPoolExecutorTest(TestCase):
+    def test_submit(self):
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            futures = [executor.submit(pow, 2, i) for i in range(10)]
+            eq_([future.result() for future in futures],
+                [2 ** i for i in range(10)])
+            assert len(executor._threads) <= 2
+
+    def test_exception(self):
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(int, 'nope')
+            self.assertRaises(ValueError, future.result)
+
+    def test_cancel_pending(self):
+        started = threading.Event()
+        release = threading.Event()
+        ran = []
+
+        def block():
+            started.set()
+            release.wait()
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            running = executor.submit(block)
+            started.wait()
+            pending = executor.submit(ran.append, 1)
+            assert not running.cancel()
+            assert pending.cancel()
+            release.set()
+
+        eq_(ran, [])
+
+    def test_map(self):
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            eq_(list(executor.map(pow, [2, 3, 4], [2, 2, 2])), [4, 9, 16])
+
+    def test_shutdown(self):
+        executor = ThreadPoolExecutor(max_workers=1)
+        executor.submit(time.sleep, 0.01)
+        executor.shutdown()
+        self.assertRaises(RuntimeError, executor.submit, time.sleep, 0)
+
+    def test_as_completed(self):
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            futures = [executor.submit(time.sleep, seconds)
+                       for seconds in (0.2, 0.01, 0.1)]
+            done = list(as_completed(futures))
+        eq_(done, [futures[1], futures[2], futures[0]])
+
+    def test_as_completed_timeout(self):
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(time.sleep, 0.2)
+            self.assertRaises(TimeoutError, list,
+                              as_completed([future], timeout=0.01))
+
+    def test_default_executor(self):
+        assert get_default_executor() is get_default_executor()
+
+
+class FakeIndexable(MappingType, Indexable):
+    @classmethod
+    def get_index(cls):
+        return 'index123'
+
+    @classmethod
+    def get_mapping_type_name(cls):
+        return 'doctype123'
+
+
+class AsyncTest(TestCase):
+    def setUp(self):
+        super(AsyncTest, self).setUp()
+        self.server = FakeESServer(self.respond).start()
+        self.es = get_es(urls=[self.server.url], force_new=True)
+
+    def tearDown(self):
+        self.es.session.close()
+        self.server.stop()
+        super(AsyncTest, self).tearDown()
+
+    def respond(self, method, path, body):
+        time.sleep(0.1)
+        hits = [{'_id': '1', '_type': 'doctype123', '_score': 1.0,
+                 '_source': {'id': 1}}]
+        return 200, search_response(hits)
+
+    def get_s(self):
+        es = self.es
+
+        class FakeS(S):
+            def get_es(self):
+                return es
+
+        return FakeS().indexes('index123').doctypes('doctype123')
+
+    def test_execute_async(self):
+        future = self.get_s().execute_async()
+        results = future.result(timeout=5)
+        eq_([result['id'] for result in results], [1])
+        eq_(results.count, 1)
+
+    def test_searches_run_at_the_same_time(self):
+        s = self.get_s()
+        start = time.time()
+        futures = [s.filter(id=i).execute_async() for i in range(5)]
+        for future in futures:
+            eq_(len(future.result(timeout=5)), 1)
+        # Each takes 0.1 seconds on the server.
+        assert time.time() - start < 0.4
+        eq_(len(self.server.requests), 5)
+
+    def test_count_async(self):
+        eq_(self.get_s().count_async().result(timeout=5), 1)
+        method, path, body = self.server.requests[0]
+        assert path.endswith('_search?search_type=count'), path
+
+    def test_mlt_execute_async(self):
+        future = MLT(1, s=self.get_s(), mlt_fields=['title']).execute_async()
+        eq_(len(future.result(timeout=5)), 1)
+        eq_(self.server.requests[0][1],
+            '/index123/doctype123/1/_mlt?mlt_fields=title')
+
+    def test_bulk_index_async(self):
+        future = FakeIndexable.bulk_index_async(
+            [{'id': 1}, {'id': 2}], es=self.es)
+        future.result(timeout=5)
+        eq_(self.server.requests[0][:2], ('POST', '/_bulk'))
+
+        future = FakeIndexable.bulk_index_async([], es=self.es)
+        self.assertRaises(ValueError, future.result, 5)
+
+    def test_executor(self):
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            futures = [self.get_s().filter(id=i).execute_async(executor)
+                       for i in range(2)]
+            for future in futures:
+                future.result(timeout=5)
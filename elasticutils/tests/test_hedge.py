@@ -0,0 +1,212 @@
+import threading
+import time
+from unittest import TestCase
+
+from nose.tools import eq_
+from pyelasticsearch.exceptions import ElasticHttpError
+
+from elasticutils import S, get_es
+from elasticutils.futures import ThreadPoolExecutor
+from elasticutils.hedge import HEDGE_MIN_SAMPLES, HedgeStats, Hedger
+from elasticutils.tests import FakeESServer, search_response
+
+
+def sequence_responder(*replies):
+    """Returns a responder that answers requests in turn
+
+    :arg replies: ``(seconds, status)`` for each request; the nth
+        request is answered after ``replies[n][0]`` seconds with
+        ``replies[n][1]``. Requests after the last reply get
+        ``(0, 200)``.
+
+    The hits have the number of the request, from 0, in ``request``.
+
+    """
+    lock = threading.Lock()
+    count = [0]
+
+    def responder(method, path, body):
+        with lock:
+            n = count[0]
+            count[0] += 1
+        seconds, status = replies[n] if n < len(replies) else (0, 200)
+        time.sleep(seconds)
+        if status != 200:
+            return status, {'error': 'boom', 'status': status}
+        hits = [{'_id': '1', '_type': 'doctype123', '_score': 1.0,
+                 '_source': {'id': 1, 'request': n}}]
+        return 200, search_response(hits)
+    return responder
+
+
+class HedgerTest(TestCase):
+    def setUp(self):
+        super(HedgerTest, self).setUp()
+        self.servers = []
+        self.es = None
+
+    def tearDown(self):
+        if self.es is not None:
+            self.es.session.close()
+        for server in self.servers:
+            server.stop()
+        super(HedgerTest, self).tearDown()
+
+    def start_servers(self, responder, count=1):
+        for i in range(count):
+            self.servers.append(FakeESServer(responder).start())
+        self.es = get_es(urls=[server.url for server in self.servers],
+                         force_new=True)
+
+    def get_s(self, hedger):
+        es = self.es
+
+        class FakeS(S):
+            default_hedger = hedger
+
+            def get_es(self):
+                return es
+
+        return FakeS().indexes('index123').doctypes('doctype123')
+
+    def requests(self):
+        return sum(len(server.requests) for server in self.servers)
+
+    def test_fast_searches_not_hedged(self):
+        self.start_servers(None)
+        hedger = Hedger(delay=1)
+        for i in range(3):
+            eq_(list(self.get_s(hedger).filter(id=i)), [])
+
+        eq_(self.requests(), 3)
+        eq_(hedger.stats(), HedgeStats(
+            searches=3, hedged=0, won=0, throttled=0, delay=1))
+
+    def test_hedge_wins(self):
+        self.start_servers(sequence_responder((0.5, 200)))
+        hedger = Hedger(delay=0.05)
+        start = time.time()
+        results = list(self.get_s(hedger))
+        assert time.time() - start < 0.4
+
+        # The hedge's response is the one that counts.
+        eq_(results[0]['request'], 1)
+        eq_(self.requests(), 2)
+        stats = hedger.stats()
+        eq_((stats.searches, stats.hedged, stats.won), (1, 1, 1))
+        eq_((stats.hedge_rate, stats.win_rate), (1.0, 1.0))
+
+    def test_hedge_goes_to_other_host(self):
+        self.start_servers(sequence_responder((0.3, 200)), count=2)
+        hedger = Hedger(delay=0.05)
+        list(self.get_s(hedger))
+
+        eq_([len(server.requests) for server in self.servers], [1, 1])
+        eq_(hedger.stats().won, 1)
+
+    def test_first_wins(self):
+        self.start_servers(sequence_responder((0.1, 200), (0.5, 200)))
+        hedger = Hedger(delay=0.05)
+        results = list(self.get_s(hedger))
+        eq_(results[0]['request'], 0)
+        stats = hedger.stats()
+        eq_((stats.hedged, stats.won), (1, 0))
+
+    def test_max_rate(self):
+        def responder(method, path, body):
+            time.sleep(0.05)
+            return 200, search_response()
+
+        self.start_servers(responder)
+        hedger = Hedger(delay=0.01, max_rate=0, burst=1)
+        for i in range(3):
+            list(self.get_s(hedger).filter(id=i))
+
+        eq_(self.requests(), 4)
+        stats = hedger.stats()
+        eq_((stats.searches, stats.hedged, stats.throttled), (3, 1, 2))
+
+    def test_learned_delay(self):
+        self.start_servers(None)
+        hedger = Hedger()
+        for i in range(HEDGE_MIN_SAMPLES - 1):
+            list(self.get_s(hedger).filter(id=i))
+        eq_(hedger.get_delay(), None)
+
+        list(self.get_s(hedger))
+        assert hedger.get_delay() is not None
+        eq_(hedger.stats().hedged, 0)
+
+    def test_searches_not_queued(self):
+        def responder(method, path, body):
+            time.sleep(0.2)
+            return 200, search_response()
+
+        self.start_servers(responder)
+        hedger = Hedger(delay=1, max_workers=2)
+        threads = [threading.Thread(target=list, args=(self.get_s(hedger),))
+                   for i in range(6)]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Queued behind two workers, they'd take 0.6 seconds.
+        assert time.time() - start < 0.5
+        eq_(self.requests(), 6)
+        eq_(hedger.stats().hedged, 0)
+
+    def test_delay_excludes_queue_time(self):
+        def responder(method, path, body):
+            time.sleep(0.1)
+            return 200, search_response()
+
+        self.start_servers(responder)
+        hedger = Hedger(delay=1)
+        hedger._first_executor = ThreadPoolExecutor(1)
+        threads = [threading.Thread(target=list, args=(self.get_s(hedger),))
+                   for i in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Each request took 0.1 seconds however long it waited.
+        assert max(hedger._times) < 0.2
+
+    def test_percentile(self):
+        hedger = Hedger(percentile=95)
+        hedger._times.extend(range(100, 0, -1))
+        eq_(hedger.get_delay(), 95)
+        hedger.percentile = 50
+        eq_(hedger.get_delay(), 50)
+        hedger.percentile = 100
+        eq_(hedger.get_delay(), 100)
+
+        self.assertRaises(ValueError, Hedger, percentile=0)
+
+    def test_fails_before_delay(self):
+        self.start_servers(sequence_responder((0, 500)))
+        hedger = Hedger(delay=1)
+        self.assertRaises(ElasticHttpError, list, self.get_s(hedger))
+        eq_(self.requests(), 1)
+        eq_(hedger.stats().hedged, 0)
+
+    def test_first_fails_after_hedge(self):
+        self.start_servers(sequence_responder((0.1, 500), (0.2, 200)))
+        hedger = Hedger(delay=0.05)
+        results = list(self.get_s(hedger))
+        eq_(results[0]['request'], 1)
+        eq_(hedger.stats().won, 1)
+
+    def test_both_fail(self):
+        def responder(method, path, body):
+            time.sleep(0.05)
+            return 500, {'error': 'boom', 'status': 500}
+
+        self.start_servers(responder)
+        hedger = Hedger(delay=0.01)
+        self.assertRaises(ElasticHttpError, list, self.get_s(hedger))
+        eq_(self.requests(), 2)
+        eq_(hedger.stats().won, 0)
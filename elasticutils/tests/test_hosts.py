@@ -0,0 +1,277 @@
+import os
+import signal
+import time
+from unittest import TestCase
+
+from nose.tools import eq_
+from pyelasticsearch.exceptions import ElasticHttpError
+
+from elasticutils import S, get_es
+from elasticutils.tests import FakeESServer, search_response
+from elasticutils.tests.test_transport import slow_responder
+from elasticutils.transport import (
+    CLOSED, HALF_OPEN, OPEN, HostSelector, HostStats, Transport)
+
+
+A = 'http://a:9200'
+B = 'http://b:9200'
+C = 'http://c:9200'
+
+
+def request(selector, url, elapsed, failed=False):
+    selector.start(url)
+    selector.finish(url, elapsed, failed)
+
+
+class HostSelectorTest(TestCase):
+    def test_untried_hosts_first(self):
+        selector = HostSelector([A, B])
+        request(selector, A, 0.01)
+        eq_(selector.get(), (B, False))
+
+    def test_prefers_fast_hosts(self):
+        selector = HostSelector([A, B, C])
+        request(selector, A, 0.01)
+        request(selector, B, 0.02)
+        request(selector, C, 0.5)
+        picked = [selector.get()[0] for i in range(100)]
+
+        # Two of the three hosts are compared for each request, so
+        # the slowest never wins and the fastest wins when it's one of
+        # them.
+        eq_(picked.count(C), 0)
+        assert picked.count(A) > picked.count(B)
+
+    def test_in_flight(self):
+        selector = HostSelector([A, B])
+        request(selector, A, 0.01)
+        request(selector, B, 0.02)
+        eq_(selector.get()[0], A)
+
+        for i in range(3):
+            selector.start(A)
+        eq_(selector.get()[0], B)
+
+        for i in range(3):
+            selector.finish(A, 0.01, False)
+        eq_(selector.get()[0], A)
+
+    def test_ewma(self):
+        selector = HostSelector([A], alpha=0.5)
+        request(selector, A, 0.25)
+        request(selector, A, 0.75, failed=True)
+        eq_(selector.stats()[A],
+            HostStats(state=CLOSED, latency=0.5, error_rate=0.5,
+                      in_flight=0, requests=2, failures=1))
+
+    def test_circuit(self):
+        selector = HostSelector([A, B], threshold=2, timeout=0.1)
+        request(selector, B, 0.01)
+        request(selector, A, 0.001, failed=True)
+        eq_(selector.stats()[A].state, CLOSED)
+        request(selector, A, 0.001, failed=True)
+        eq_(selector.stats()[A].state, OPEN)
+        eq_(set(selector.get() for i in range(10)), set([(B, False)]))
+
+        # After the timeout, one request at a time probes it.
+        time.sleep(0.15)
+        eq_(selector.get(), (A, True))
+        eq_(selector.stats()[A].state, HALF_OPEN)
+        eq_(selector.get(), (B, False))
+
+        request(selector, A, 0.001)
+        eq_(selector.stats()[A].state, CLOSED)
+
+    def test_probe_fails(self):
+        selector = HostSelector([A, B], threshold=1, timeout=0.1)
+        request(selector, A, 0.001, failed=True)
+        time.sleep(0.15)
+        eq_(selector.get(), (A, True))
+        request(selector, A, 0.001, failed=True)
+        eq_(selector.stats()[A].state, OPEN)
+        eq_(selector.get(), (B, False))
+
+    def test_stale_probe(self):
+        selector = HostSelector([A, B], threshold=1, timeout=0.1)
+        request(selector, A, 0.001, failed=True)
+        time.sleep(0.15)
+        eq_(selector.get(), (A, True))
+        eq_(selector.get(), (B, False))
+
+        # The probe never finished.
+        time.sleep(0.15)
+        eq_(selector.get(), (A, True))
+
+    def test_all_open(self):
+        selector = HostSelector([A, B], threshold=1, timeout=60)
+        request(selector, B, 0.001, failed=True)
+        time.sleep(0.01)
+        request(selector, A, 0.001, failed=True)
+        eq_(selector.get(), (B, True))
+
+    def test_steer(self):
+        selector = HostSelector([A, B, C], threshold=1)
+        request(selector, A, 0.01)
+        request(selector, B, 0.02)
+        request(selector, C, 0.03)
+
+        picked = []
+        with selector.steer(picked, avoid=[A]):
+            for i in range(10):
+                assert selector.get()[0] != A
+        eq_(len(picked), 10)
+        assert selector.get()[0] in (A, B)
+
+        # Avoided hosts are used if there are no others.
+        request(selector, B, 0.01, failed=True)
+        request(selector, C, 0.01, failed=True)
+        with selector.steer(avoid=[A]):
+            eq_(selector.get(), (A, False))
+
+    def test_fork(self):
+        selector = HostSelector([A, B])
+        selector.start(A)
+
+        read_fd, write_fd = os.pipe()
+        # Like another thread holding the lock when we fork.
+        with selector._lock:
+            pid = os.fork()
+        if pid == 0:
+            # In the child, report what we find and exit without
+            # running the rest of the tests.
+            try:
+                os.close(read_fd)
+                signal.alarm(5)
+                checks = [selector.stats()[A].in_flight == 0,
+                          selector.get()[1] is False]
+                os.write(write_fd, repr(checks))
+            finally:
+                os._exit(0)
+
+        os.close(write_fd)
+        os.waitpid(pid, 0)
+        result = os.read(read_fd, 1024)
+        os.close(read_fd)
+
+        eq_(result, repr([True, True]))
+        eq_(selector.stats()[A].in_flight, 1)
+
+    def test_urls(self):
+        selector = HostSelector('http://localhost/')
+        request(selector, 'http://localhost:80', 0.01)
+        eq_(selector.stats()['http://localhost'].requests, 1)
+
+        # Other hosts are ignored.
+        request(selector, A, 0.01)
+        eq_(selector.stats().keys(), ['http://localhost'])
+
+
+class GetESHostsTest(TestCase):
+    def setUp(self):
+        super(GetESHostsTest, self).setUp()
+        self.servers = []
+        self.es = None
+
+    def tearDown(self):
+        if self.es is not None:
+            self.es.session.close()
+        for server in self.servers:
+            server.stop()
+        super(GetESHostsTest, self).tearDown()
+
+    def start_server(self, responder=None):
+        server = FakeESServer(responder).start()
+        self.servers.append(server)
+        return server
+
+    def get_es(self, **kwargs):
+        self.es = get_es(urls=[server.url for server in self.servers],
+                         force_new=True, **kwargs)
+        return self.es
+
+    def get_s(self, es):
+        class FakeS(S):
+            def get_es(self):
+                return es
+
+        return FakeS().indexes('index123').doctypes('doctype123')
+
+    def search(self, s, count):
+        errors = 0
+        for i in range(count):
+            try:
+                s.filter(id=i).execute()
+            except ElasticHttpError:
+                errors += 1
+        return errors
+
+    def test_get_es_uses_selector(self):
+        server = self.start_server()
+        es = self.get_es(circuit_threshold=3, circuit_timeout=10)
+        assert isinstance(es.servers, HostSelector)
+        assert isinstance(es.session, Transport)
+        assert es.session.selector is es.servers
+        eq_((es.servers.threshold, es.servers.timeout), (3, 10))
+
+        self.search(self.get_s(es), 2)
+        stats = es.servers.stats()[server.url]
+        eq_((stats.state, stats.requests, stats.failures), (CLOSED, 2, 0))
+
+    def test_slow_host_avoided(self):
+        slow = self.start_server(slow_responder(0.1))
+        fast = self.start_server()
+        es = self.get_es()
+        eq_(self.search(self.get_s(es), 10), 0)
+
+        # The slow one got one request, to find out that it's slow.
+        eq_(len(slow.requests), 1)
+        eq_(len(fast.requests), 9)
+        assert es.servers.stats()[slow.url].latency >= 0.1
+
+    def test_failing_host_ejected(self):
+        def failing(method, path, body):
+            return 500, {'error': 'boom', 'status': 500}
+
+        bad = self.start_server(failing)
+        good = self.start_server()
+        es = self.get_es(circuit_threshold=1)
+        eq_(self.search(self.get_s(es), 10), 1)
+
+        eq_(len(bad.requests), 1)
+        eq_(len(good.requests), 9)
+        stats = es.servers.stats()[bad.url]
+        eq_((stats.state, stats.requests, stats.failures), (OPEN, 1, 1))
+
+    def test_recovery(self):
+        failing = [True]
+
+        def responder(method, path, body):
+            if failing[0]:
+                return 503, {'error': 'unavailable', 'status': 503}
+            return 200, search_response()
+
+        server = self.start_server(responder)
+        es = self.get_es(circuit_threshold=2, circuit_timeout=0.1)
+        s = self.get_s(es)
+        eq_(self.search(s, 2), 2)
+        eq_(es.servers.stats()[server.url].state, OPEN)
+
+        # It's the only host, so requests still go to it.
+        eq_(self.search(s, 1), 1)
+
+        failing[0] = False
+        time.sleep(0.15)
+        eq_(self.search(s, 1), 0)
+        eq_(es.servers.stats()[server.url].state, CLOSED)
+
+    def test_connection_refused(self):
+        down = self.start_server()
+        up = self.start_server()
+        es = self.get_es(circuit_threshold=1, max_retries=1)
+        down.stop()
+        self.servers.remove(down)
+
+        # pyelasticsearch retries on another host.
+        eq_(self.search(self.get_s(es), 5), 0)
+        eq_(len(up.requests), 5)
+        eq_(es.servers.stats()[down.url].state, OPEN)
@@ -0,0 +1,155 @@
+import json
+from operator import itemgetter
+from unittest import TestCase
+
+from nose.tools import eq_
+
+from elasticutils import (
+    BadSearch, InvalidCursorError, KeysetPage, S, get_es)
+from elasticutils.tests import FakeESServer, search_response
+
+
+def matches(f, source):
+    """Returns whether the filters keyset_page() makes match source"""
+    name, val = f.items()[0]
+    if name == 'and':
+        return all(matches(child, source) for child in val)
+    if name == 'or':
+        return any(matches(child, source) for child in val)
+    if name == 'term':
+        field, value = val.items()[0]
+        return source[field] == value
+    if name == 'range':
+        field, ops = val.items()[0]
+        op, value = ops.items()[0]
+        return {'gt': source[field] > value,
+                'lt': source[field] < value}[op]
+    raise ValueError(name)
+
+
+class SortingResponder(object):
+    """Filters and sorts documents like Elasticsearch"""
+    def __init__(self, docs):
+        self.docs = docs
+
+    def __call__(self, method, path, body):
+        qs = json.loads(body)
+        docs = self.docs
+        if 'filter' in qs:
+            docs = [doc for doc in docs if matches(qs['filter'], doc)]
+
+        # Sort by the last field first so the sorts are stable.
+        for field in reversed(qs['sort']):
+            if isinstance(field, dict):
+                field, direction = field.items()[0]
+            else:
+                direction = 'asc'
+            docs = sorted(docs, key=itemgetter(field),
+                          reverse=direction == 'desc')
+
+        start = qs.get('from', 0)
+        page = docs[start:start + qs['size']]
+        hits = [{'_id': str(doc['id']), '_type': 'doctype123',
+                 '_score': None, '_source': doc,
+                 'sort': [doc[(f.keys()[0] if isinstance(f, dict) else f)]
+                          for f in qs['sort']]}
+                for doc in page]
+        response = search_response(hits)
+        response['hits']['total'] = len(docs)
+        return 200, response
+
+
+class KeysetTest(TestCase):
+    def setUp(self):
+        super(KeysetTest, self).setUp()
+        # Lots of documents have the same created value.
+        docs = [{'id': i, 'created': i // 4} for i in range(25)]
+        self.server = FakeESServer(SortingResponder(docs)).start()
+        self.es = get_es(urls=[self.server.url], force_new=True)
+
+    def tearDown(self):
+        self.es.session.close()
+        self.server.stop()
+        super(KeysetTest, self).tearDown()
+
+    def get_s(self):
+        es = self.es
+
+        class FakeS(S):
+            def get_es(self):
+                return es
+
+        return FakeS().indexes('index123').doctypes('doctype123')
+
+    def test_pages(self):
+        s = self.get_s().order_by('-created', 'id')
+        page = s.keyset_page(10)
+        assert isinstance(page, KeysetPage)
+        eq_(page.cursor, None)
+        assert page.has_next
+        ids = [result['id'] for result in page]
+
+        while page.has_next:
+            page = s.keyset_page(10, cursor=page.next_cursor)
+            ids.extend(result['id'] for result in page)
+
+        expected = sorted(range(25), key=lambda i: (-(i // 4), i))
+        eq_(ids, expected)
+
+        # Every page starts at the beginning.
+        for method, path, body in self.server.requests:
+            qs = json.loads(body)
+            eq_((qs.get('from', 0), qs['size']), (0, 10))
+
+    def test_filter(self):
+        s = self.get_s().order_by('-created', 'id')
+        s.keyset_page(10, cursor=s.keyset_page(10).next_cursor)
+        qs = json.loads(self.server.requests[-1][2])
+        # The 10th result is id 12 with created 3.
+        eq_(qs['filter'],
+            {'or': [{'range': {'created': {'lt': 3}}},
+                    {'and': [{'term': {'created': 3}},
+                             {'range': {'id': {'gt': 12}}}]}]})
+
+    def test_date_sort(self):
+        # Sort values that look like dates are turned into datetimes
+        # in the results, but the cursor has them as they came.
+        self.server.responder.docs = [
+            {'id': i, 'created': '2013-01-%02dT00:00:00' % (i // 4 + 1)}
+            for i in range(25)]
+        s = self.get_s().order_by('created', 'id')
+        ids = [result['id']
+               for page in s.keyset_pages(10)
+               for result in page]
+        eq_(ids, range(25))
+
+        qs = json.loads(self.server.requests[1][2])
+        eq_(qs['filter']['or'][0],
+            {'range': {'created': {'gt': '2013-01-03T00:00:00'}}})
+
+    def test_keeps_filters(self):
+        s = self.get_s().filter(id__lt=20).order_by('id')
+        ids = [result['id']
+               for page in s.keyset_pages(6)
+               for result in page]
+        eq_(ids, range(20))
+        eq_(len(self.server.requests), 4)
+
+    def test_last_page(self):
+        pages = list(self.get_s().order_by('id').keyset_pages(5))
+        eq_([len(page) for page in pages], [5] * 5)
+        eq_(pages[-1].next_cursor, None)
+
+    def test_needs_order_by(self):
+        s = self.get_s()
+        self.assertRaises(BadSearch, s.keyset_page, 10)
+        self.assertRaises(BadSearch, s.order_by('-_score').keyset_page, 10)
+
+    def test_bad_cursor(self):
+        s = self.get_s().order_by('id')
+        self.assertRaises(InvalidCursorError, s.keyset_page, 10, 'nope!')
+        self.assertRaises(InvalidCursorError, s.keyset_page, 10, 'e30')
+
+        # A cursor from a search with a different ordering.
+        cursor = self.get_s().order_by('-id').keyset_page(10).next_cursor
+        self.assertRaises(InvalidCursorError, s.keyset_page, 10, cursor)
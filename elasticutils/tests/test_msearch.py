@@ -0,0 +1,130 @@
+import json
+from unittest import TestCase
+
+from nose.tools import eq_
+
+from elasticutils import (
+    BadSearch, DictSearchResults, ListSearchResults, MultiSearchError,
+    ObjectSearchResults, S, get_es, msearch)
+from elasticutils.tests import FakeESServer, search_response
+
+
+def msearch_responder(method, path, body):
+    """Answers each search in a multi search with one hit
+
+    The hit's ``_source`` is the header and the query of the search
+    and it has a value of 1 for any ``fields``. Searches with a
+    ``fail`` filter get an error.
+
+    """
+    if path != '/_msearch':
+        return 200, search_response()
+
+    lines = body.split('\n')
+    eq_(lines[-1], '')
+    responses = []
+    for header, query in zip(lines[:-1:2], lines[1:-1:2]):
+        if '"fail"' in query:
+            responses.append({'error': 'SearchPhaseExecutionException[fail]'})
+            continue
+        query = json.loads(query)
+        hit = {'_id': '1', '_type': 'doctype123', '_score': 1.0,
+               '_source': {'header': json.loads(header), 'query': query}}
+        if 'fields' in query:
+            hit['fields'] = dict((field, 1) for field in query['fields'])
+        responses.append(search_response([hit]))
+    return 200, {'responses': responses}
+
+
+class MSearchTest(TestCase):
+    def setUp(self):
+        super(MSearchTest, self).setUp()
+        self.server = FakeESServer(msearch_responder).start()
+        self.es = get_es(urls=[self.server.url], force_new=True)
+
+    def tearDown(self):
+        self.es.session.close()
+        self.server.stop()
+        super(MSearchTest, self).tearDown()
+
+    def get_s(self, es=None):
+        es = es or self.es
+
+        class FakeS(S):
+            def get_es(self):
+                return es
+
+        return FakeS().indexes('index123').doctypes('doctype123')
+
+    def test_msearch(self):
+        s = self.get_s()
+        searches = [
+            s.query(title__text='red'),
+            s.indexes('index123', 'index456').doctypes(),
+            s.values_dict('id'),
+            s.values_list('id'),
+        ]
+        results = msearch(searches)
+
+        eq_(len(self.server.requests), 1)
+        eq_(self.server.requests[0][:2], ('GET', '/_msearch'))
+        eq_([type(r) for r in results],
+            [ObjectSearchResults, ObjectSearchResults, DictSearchResults,
+             ListSearchResults])
+
+        eq_(results[0].results[0]['_source']['header'],
+            {'index': 'index123', 'type': 'doctype123'})
+        eq_(results[0].results[0]['_source']['query'],
+            searches[0]._build_query())
+        eq_(results[1].results[0]['_source']['header'],
+            {'index': 'index123,index456'})
+
+    def test_results_are_cached(self):
+        searches = [self.get_s().filter(id=i) for i in range(3)]
+        results = msearch(searches)
+
+        for s, result in zip(searches, results):
+            assert s.execute() is result
+            eq_(len(s), 1)
+            eq_(s.count(), 1)
+        eq_(len(self.server.requests), 1)
+
+        # They're not sent again.
+        eq_(msearch(searches), results)
+        eq_(len(self.server.requests), 1)
+
+    def test_errors(self):
+        s = self.get_s()
+        bad = S().doctypes('doctype123')
+        searches = [s, s.filter(fail=True), bad, s.filter(id=1)]
+        results = msearch(searches, es=self.es)
+
+        eq_(len(self.server.requests), 1)
+        assert isinstance(results[0], ObjectSearchResults)
+        assert isinstance(results[1], MultiSearchError)
+        eq_(results[1].error, 'SearchPhaseExecutionException[fail]')
+        assert isinstance(results[2], BadSearch)
+        assert isinstance(results[3], ObjectSearchResults)
+
+        # The failed search isn't cached, so executing it runs it.
+        eq_(searches[1]._results_cache, None)
+
+    def test_grouped_by_es(self):
+        other_server = FakeESServer(msearch_responder).start()
+        other_es = get_es(urls=[other_server.url], force_new=True)
+        try:
+            searches = [self.get_s(), self.get_s(other_es),
+                        self.get_s().filter(id=1)]
+            results = msearch(searches)
+
+            eq_(len(results), 3)
+            eq_(len(self.server.requests), 1)
+            eq_(len(other_server.requests), 1)
+            eq_(self.server.requests[0][2].count('\n'), 4)
+        finally:
+            other_es.session.close()
+            other_server.stop()
+
+    def test_empty(self):
+        eq_(msearch([]), [])
+        eq_(self.server.requests, [])
@@ -0,0 +1,136 @@
+import random
+from unittest import TestCase
+
+from nose.tools import eq_
+
+from elasticutils import S, F, _optimize_filter
+from elasticutils.tests import evaluate_filter, random_docs, random_f
+
+
+def get_filter(s):
+    return s._build_query().get('filter')
+
+
+class OptimizeTest(TestCase):
+    def test_off_by_default(self):
+        s = S().filter(F(a=1) | F(a=2))
+        eq_(get_filter(s), {'or': [{'term': {'a': 1}}, {'term': {'a': 2}}]})
+
+    def test_flatten(self):
+        f = {'and': [
+            {'term': {'a': 1}},
+            {'or': [{'term': {'b': 2}},
+                    {'or': [{'term': {'c': 3}}, {'term': {'d': 4}}]}]}]}
+        eq_(_optimize_filter(f), {'and': [
+            {'term': {'a': 1}},
+            {'or': [{'term': {'b': 2}},
+                    {'term': {'c': 3}},
+                    {'term': {'d': 4}}]}]})
+
+        # Separate filter calls are anded with the filters in them.
+        s = S().filter(F(a=1) & F(b=2)).filter(c=3).optimize()
+        eq_(get_filter(s), {'and': [
+            {'term': {'a': 1}}, {'term': {'b': 2}}, {'term': {'c': 3}}]})
+
+    def test_dedupe(self):
+        s = S().filter(a=1).filter(F(a=1) & F(b=2)).optimize()
+        eq_(get_filter(s), {'and': [{'term': {'a': 1}}, {'term': {'b': 2}}]})
+
+        # A filter of only duplicates is the filter.
+        s = S().filter(F(a=1) | F(a=1)).optimize()
+        eq_(get_filter(s), {'term': {'a': 1}})
+
+    def test_merge_terms(self):
+        s = S().filter(F(a=1) | F(b=2) | F(a=3) | F(a__in=[4, 1])).optimize()
+        eq_(get_filter(s), {'or': [
+            {'terms': {'a': [1, 3, 4]}}, {'term': {'b': 2}}]})
+
+        # Terms in an and don't get merged.
+        s = S().filter(F(a=1) & F(a=3)).optimize()
+        eq_(get_filter(s), {'and': [{'term': {'a': 1}}, {'term': {'a': 3}}]})
+
+        # Neither do terms filters with other options.
+        s = S().filter_raw({'or': [
+            {'term': {'a': 1}},
+            {'terms': {'a': [2], 'execution': 'bool'}}]}).optimize()
+        eq_(get_filter(s), {'or': [
+            {'term': {'a': 1}},
+            {'terms': {'a': [2], 'execution': 'bool'}}]})
+
+    def test_not_not(self):
+        s = S().filter(~~F(a=1)).optimize()
+        eq_(get_filter(s), {'term': {'a': 1}})
+
+        s = S().filter(~(~F(a=1) | ~F(a=2))).optimize()
+        eq_(get_filter(s), {'not': {'filter': {'or': [
+            {'not': {'filter': {'term': {'a': 1}}}},
+            {'not': {'filter': {'term': {'a': 2}}}}]}}})
+
+    def test_order(self):
+        class GeoS(S):
+            def process_filter_distance(self, key, val, action):
+                return {'geo_distance': {'distance': val, key: [0, 0]}}
+
+            def process_filter_script(self, key, val, action):
+                return {'script': {'script': val}}
+
+        s = (GeoS().filter(a__script='doc.a > 1')
+                   .filter(F(b__prefix='x') | F(c=1))
+                   .filter(d__distance='5km')
+                   .filter(e__gt=1)
+                   .filter(f=1)
+                   .optimize())
+        eq_(get_filter(s), {'and': [
+            {'term': {'f': 1}},
+            {'range': {'e': {'gt': 1}}},
+            {'or': [{'term': {'c': 1}}, {'prefix': {'b': 'x'}}]},
+            {'script': {'script': 'doc.a > 1'}},
+            {'geo_distance': {'distance': '5km', 'd': [0, 0]}}]})
+
+    def test_filter_raw_left_alone(self):
+        raw = {'and': [{'and': [{'term': {'a': 1}}]}, {'term': {'a': 1}}]}
+        s = S().filter_raw(raw).optimize()
+        eq_(get_filter(s), raw)
+
+    def test_optimize_off(self):
+        s = S().filter(F(a=1) | F(a=2)).optimize().optimize(False)
+        eq_(get_filter(s), {'or': [{'term': {'a': 1}}, {'term': {'a': 2}}]})
+
+    def test_default_optimize(self):
+        class OptimizedS(S):
+            default_optimize = True
+
+        s = OptimizedS().filter(F(a=1) | F(a=2))
+        eq_(get_filter(s), {'terms': {'a': [1, 2]}})
+        eq_(get_filter(s.optimize(False)),
+            {'or': [{'term': {'a': 1}}, {'term': {'a': 2}}]})
+
+        # Changing the default doesn't get a stale compiled query.
+        s = S().filter(F(b=1) | F(b=2))
+        eq_(get_filter(s), {'or': [{'term': {'b': 1}}, {'term': {'b': 2}}]})
+        S.default_optimize = True
+        try:
+            eq_(get_filter(S().filter(F(b=1) | F(b=2))),
+                {'terms': {'b': [1, 2]}})
+        finally:
+            S.default_optimize = False
+
+    def test_facet_filter(self):
+        s = (S().filter(F(a=1) | F(a=2))
+                .facet('tag', filtered=True)
+                .optimize())
+        eq_(s._build_query()['facets']['tag']['facet_filter'],
+            {'terms': {'a': [1, 2]}})
+
+    def test_equivalence(self):
+        rng = random.Random(42)
+        docs = random_docs(rng)
+        for i in range(500):
+            f = random_f(rng)
+            before = get_filter(S().filter(f))
+            after = get_filter(S().filter(f).optimize())
+            for doc in docs:
+                eq_(evaluate_filter(before, doc),
+                    evaluate_filter(after, doc),
+                    '{0!r} and {1!r} differ on {2!r}'.format(
+                        before, after, doc))
@@ -1,3 +1,4 @@
+import pickle
 from datetime import datetime, timedelta
 from unittest import TestCase
 
@@ -6,7 +7,8 @@ from nose.tools import eq_
 from elasticutils import (
     S, F, Q, BadSearch, InvalidFieldActionError, InvalidFacetType,
     InvalidFlagsError, SearchResults, DefaultMappingType, MappingType,
-    DEFAULT_INDEXES, DEFAULT_DOCTYPES)
+    DEFAULT_INDEXES, DEFAULT_DOCTYPES, MissingParamError, Param,
+    clear_query_cache, query_cache_info)
 from elasticutils.tests import ESTestCase, facet_counts_dict
 
 
@@ -35,6 +37,73 @@ class STest(TestCase):
     def test_typed_s_get_doctypes(self):
         eq_(S(FakeMappingType).get_doctypes(), ['doctype123'])
 
+    def test_steps(self):
+        s = S().query(foo='bar').filter(tag='awesome').order_by('foo')
+        eq_([action for action, value in s.steps],
+            ['query', 'filter', 'order_by'])
+
+        # The steps are shared, so they can't be changed in place.
+        eq_(type(s.steps), tuple)
+        with self.assertRaises(AttributeError):
+            s.steps.append(('explain', True))
+        eq_(len(s.steps), 3)
+
+        s2 = S()
+        s2.steps = s.steps
+        eq_(s2._build_query(), s._build_query())
+
+    def test_clone_shares_steps(self):
+        s1 = S().filter(tag='awesome')
+        s2 = s1.filter(foo='bar')
+        assert s2._steps_tail.parent is s1._steps_tail
+        eq_(len(s1.steps), 1)
+        eq_(len(s2.steps), 2)
+
+    def test_incremental_compilation(self):
+        processed = []
+
+        class CountingS(S):
+            def _process_filters(self, filters):
+                processed.append(filters)
+                return super(CountingS, self)._process_filters(filters)
+
+        s = CountingS()
+        for i in range(30):
+            s = s.filter(**{'field%d' % i: i})
+            s._build_query()
+
+        # Each filter was processed exactly once even though every
+        # intermediate S was compiled.
+        eq_(len(processed), 30)
+        eq_(len(s._build_query()['filter']['and']), 30)
+
+    def test_compiled_state_per_class(self):
+        class FunkyS(S):
+            def process_filter_prefix(self, key, val, action):
+                return {'funkyprefix': {key: val}}
+
+        s = S().filter(foo__prefix='bar')
+        funky = FunkyS()
+        funky._steps_tail = s._steps_tail
+        eq_(s._build_query()['filter'], {'prefix': {'foo': 'bar'}})
+        eq_(funky._build_query()['filter'], {'funkyprefix': {'foo': 'bar'}})
+        eq_(s.filter(a=1)._build_query()['filter']['and'][0],
+            {'prefix': {'foo': 'bar'}})
+
+    def test_incremental_compilation_branches(self):
+        base = S().filter(tag='awesome').facet('tag', filtered=True)
+        base._build_query()
+        s1 = base.filter(foo='bar')
+        s2 = base.filter(foo='baz')
+        eq_(s1._build_query()['facets']['tag']['facet_filter'],
+            {'and': [{'term': {'tag': 'awesome'}},
+                     {'term': {'foo': 'bar'}}]})
+        eq_(s2._build_query()['facets']['tag']['facet_filter'],
+            {'and': [{'term': {'tag': 'awesome'}},
+                     {'term': {'foo': 'baz'}}]})
+        eq_(base._build_query()['facets']['tag']['facet_filter'],
+            {'term': {'tag': 'awesome'}})
+
 
 class QTest(TestCase):
     def test_q_should(self):
@@ -100,6 +169,276 @@ class QTest(TestCase):
             [('bat', 'must_not')])
 
 
+class FTest(TestCase):
+    def test_f_filters(self):
+        eq_(F().filters, [])
+        eq_(F(tag='awesome').filters, [('tag', 'awesome')])
+        eq_((F(tag='awesome') | F(tag='boat')).filters,
+            [{'or': [('tag', 'awesome'), ('tag', 'boat')]}])
+        eq_((~F(tag='awesome')).filters,
+            [{'not': {'filter': [('tag', 'awesome')]}}])
+
+    def test_f_flattens_same_connector(self):
+        f = F(a=1) & F(b=2) & F(c=3)
+        eq_(f.filters, [{'and': [('a', 1), ('b', 2), ('c', 3)]}])
+
+        # When the right-hand side has the connector, the left-hand
+        # side gets appended to it.
+        f = F(a=1) | (F(b=2) | F(c=3))
+        eq_(f.filters, [{'or': [('b', 2), ('c', 3), ('a', 1)]}])
+
+        # Different connectors nest.
+        f = (F(a=1) | F(b=2)) & F(c=3)
+        eq_(f.filters, [{'and': [{'or': [('a', 1), ('b', 2)]}, ('c', 3)]}])
+
+    def test_f_shares_structure(self):
+        f1 = F(a=1) & F(b=2)
+        f2 = f1 & F(c=3)
+        f3 = f1 & F(d=4)
+        eq_(f1.filters, [{'and': [('a', 1), ('b', 2)]}])
+        eq_(f2.filters, [{'and': [('a', 1), ('b', 2), ('c', 3)]}])
+        eq_(f3.filters, [{'and': [('a', 1), ('b', 2), ('d', 4)]}])
+
+    def test_f_incremental(self):
+        f = F()
+        for i in range(500):
+            f &= F(**{'field%d' % i: i})
+        eq_(len(f.filters[0]['and']), 500)
+        eq_(len(S().filter(f)._build_query()['filter']['and']), 500)
+
+    def test_f_set_filters(self):
+        f = F()
+        f.filters = [{'or': [('a', 1), ('b', 2)]}]
+        eq_((f | F(c=3)).filters,
+            [{'or': [('a', 1), ('b', 2), ('c', 3)]}])
+        eq_((~~f).filters, [{'or': [('a', 1), ('b', 2)]}])
+
+    def test_f_multiple_items(self):
+        # The items of an F are ANDed together, so none of them are
+        # lost when it's combined.
+        f = F()
+        f.filters = [{'and': [('a', 1), ('b', 2)]}, ('c', 3)]
+        eq_((f & F(d=4)).filters,
+            [{'and': [('a', 1), ('b', 2), ('c', 3), ('d', 4)]}])
+        eq_((F(d=4) & f).filters,
+            [{'and': [('a', 1), ('b', 2), ('c', 3), ('d', 4)]}])
+
+        f.filters = [{'or': [('a', 1), ('b', 2)]}, ('c', 3)]
+        eq_((f | F(d=4)).filters,
+            [{'or': [{'and': [{'or': [('a', 1), ('b', 2)]}, ('c', 3)]},
+                     ('d', 4)]}])
+        eq_((F(d=4) | f).filters,
+            [{'or': [('d', 4),
+                     {'and': [{'or': [('a', 1), ('b', 2)]}, ('c', 3)]}]}])
+
+
+class DispatchTest(TestCase):
+    def test_builtin_actions(self):
+        dispatch = S._get_dispatch('filter')
+        for action in (None, 'in', 'prefix', 'startswith', 'range', 'gt'):
+            handler, custom = dispatch[action]
+            eq_(custom, False)
+
+    def test_overrides(self):
+        class FunkyS(S):
+            def process_filter_prefix(self, key, val, action):
+                return {'funkyprefix': {key: val}}
+
+            def process_query_funkyquery(self, key, val, action):
+                return {'funkyquery': {'field': key, 'value': val}}
+
+        s = FunkyS().filter(foo__prefix='bar').query(foo__funkyquery='bar')
+        eq_(s._build_query(), {
+                'filter': {'funkyprefix': {'foo': 'bar'}},
+                'query': {'funkyquery': {'field': 'foo', 'value': 'bar'}}
+        })
+
+        # The subclass gets its own table; S is unaffected.
+        eq_(S().filter(foo__prefix='bar')._build_query(),
+            {'filter': {'prefix': {'foo': 'bar'}}})
+        assert 'funkyquery' not in S._get_dispatch('query')
+
+    def test_inherited_overrides(self):
+        class FunkyS(S):
+            def process_filter_funkyfilter(self, key, val, action):
+                return {'funkyfilter': {'field': key, 'value': val}}
+
+        class FunkierS(FunkyS):
+            @staticmethod
+            def process_filter_funkierfilter(key, val, action):
+                return {'funkierfilter': {'field': key, 'value': val}}
+
+        s = FunkierS().filter(foo__funkyfilter='bar',
+                              foo__funkierfilter='baz')
+        eq_(sorted(s._build_query()['filter']['and']), [
+                {'funkierfilter': {'field': 'foo', 'value': 'baz'}},
+                {'funkyfilter': {'field': 'foo', 'value': 'bar'}}
+        ])
+
+    def test_bad_action(self):
+        with self.assertRaises(InvalidFieldActionError):
+            S().filter(foo__bad='bar')._build_query()
+        with self.assertRaises(InvalidFieldActionError):
+            S().query(foo__bad='bar')._build_query()
+
+
+class PreparedTest(TestCase):
+    def test_bind(self):
+        prepared = (S().filter(category=Param('cat'))
+                       .query(title__match=Param('q'))
+                       .prepare())
+        eq_(prepared.params, frozenset(['cat', 'q']))
+
+        s = prepared.bind(cat='books', q='dragons')
+        eq_(s._build_query(), {
+                'filter': {'term': {'category': 'books'}},
+                'query': {'match': {'title': 'dragons'}}
+        })
+
+        s = prepared.bind(cat='music', q='ponies')
+        eq_(s._build_query(), {
+                'filter': {'term': {'category': 'music'}},
+                'query': {'match': {'title': 'ponies'}}
+        })
+
+    def test_bind_complex(self):
+        prepared = (S().filter(F(tag__in=Param('tags')) |
+                               F(width__range=(Param('lo'), Param('hi'))))
+                       .query(title__match=Param('q'))
+                       .boost(title=2.0)
+                       .facet('tag', filtered=True)
+                       .prepare())
+        qs = prepared.bind(tags=['a', 'b'], lo=1, hi=5, q='x')._build_query()
+        f = {
+            'or': [
+                {'in': {'tag': ['a', 'b']}},
+                {'range': {'width': {'gte': 1, 'lte': 5}}}
+            ]
+        }
+        eq_(qs['filter'], f)
+        eq_(qs['facets']['tag']['facet_filter'], f)
+        eq_(qs['query'], {'match': {'title': {'query': 'x', 'boost': 2.0}}})
+
+    def test_bound_s_is_an_s(self):
+        prepared = S().filter(category=Param('cat')).values_dict().prepare()
+        s = prepared.bind(cat='books')
+        assert isinstance(s, S)
+        eq_(s[:5]._build_query(), {
+                'filter': {'term': {'category': 'books'}},
+                'size': 5
+        })
+        eq_(s.filter(foo='bar')._build_query(), {
+                'filter': {'and': [
+                    {'term': {'category': 'books'}},
+                    {'term': {'foo': 'bar'}}
+                ]}
+        })
+        s._build_query()
+        assert s.as_dict
+
+    def test_no_params(self):
+        prepared = S().filter(category='books').prepare()
+        eq_(prepared.params, frozenset())
+        eq_(prepared.bind()._build_query(),
+            {'filter': {'term': {'category': 'books'}}})
+
+    def test_missing_params(self):
+        prepared = S().filter(category=Param('cat')).prepare()
+        with self.assertRaises(MissingParamError):
+            prepared.bind()
+
+
+class QueryCacheTest(TestCase):
+    def setUp(self):
+        super(QueryCacheTest, self).setUp()
+        clear_query_cache()
+
+    def test_same_s_compiles_once(self):
+        s = S().query(foo='bar').filter(tag='awesome')
+        qs = s._build_query()
+        eq_(query_cache_info().misses, 1)
+
+        # Further calls on the same S don't even consult the
+        # process-wide cache.
+        assert s._build_query() is qs
+        eq_(query_cache_info().hits, 0)
+
+    def test_equivalent_s_share_compiled_query(self):
+        s1 = S().query(foo='bar').filter(F(tag='awesome') | F(tag='boat'))
+        s2 = S().query(foo='bar').filter(F(tag='awesome') | F(tag='boat'))
+        assert s1._build_query() is s2._build_query()
+        info = query_cache_info()
+        eq_((info.hits, info.misses, info.currsize), (1, 1, 1))
+
+    def test_differences_miss(self):
+        base = S().query(foo='bar')
+        base._build_query()
+        base.filter(tag='awesome')._build_query()
+        base[:5]._build_query()
+        base.boost(foo=2.0)._build_query()
+        base.filter(width=1)._build_query()
+        base.filter(width=True)._build_query()
+        eq_(query_cache_info().misses, 6)
+        eq_(query_cache_info().hits, 0)
+
+    def test_subclasses_dont_share(self):
+        class FunkyS(S):
+            def process_filter_funkyfilter(self, key, val, action):
+                return {'funkyfilter': {'field': key, 'value': val}}
+
+        S().filter(foo='bar')._build_query()
+        FunkyS().filter(foo='bar')._build_query()
+        eq_(query_cache_info().misses, 2)
+
+    def test_values_flags_restored_on_hit(self):
+        S().values_list('foo')._build_query()
+        s = S().values_list('foo')
+        s._build_query()
+        eq_(query_cache_info().hits, 1)
+        eq_((s.fields, s.as_list, s.as_dict), (['foo'], True, False))
+
+    def test_unhashable_values_skip_cache(self):
+        class Unhashable(object):
+            __hash__ = None
+
+        s = S().filter(foo=Unhashable())
+        s._build_query()
+        eq_(query_cache_info().currsize, 0)
+
+
+class SlotsTest(TestCase):
+    def test_no_instance_dict(self):
+        for obj in (S(), F(a=1), Q(a=1)):
+            assert not hasattr(obj, '__dict__'), obj
+
+    def test_subclass_with_attributes(self):
+        class TenantS(S):
+            def __init__(self, type_=None):
+                super(TenantS, self).__init__(type_)
+                self.tenant = None
+
+        s = TenantS().filter(a=1)
+        s.tenant = 'mozilla'
+        eq_(s.tenant, 'mozilla')
+        eq_(type(s.filter(b=2)), TenantS)
+        eq_(s.filter(b=2).tenant, None)
+
+    def test_pickle(self):
+        s = (S().filter(F(a=1) | ~F(b=2))
+                .query(Q(title='boat') + Q(desc='boat', should=True))
+                .order_by('-a')[2:5])
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            s2 = pickle.loads(pickle.dumps(s, protocol))
+            eq_(s2._build_query(), s._build_query())
+            eq_(repr(s2.steps), repr(s.steps))
+
+        f = F(a=1) & F(b=2)
+        q = Q(a=1) + Q(b=2, must_not=True)
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            eq_(pickle.loads(pickle.dumps(f, protocol)).filters, f.filters)
+            eq_(pickle.loads(pickle.dumps(q, protocol)), q)
+
+
 class QueryTest(ESTestCase):
     data = [
         {
@@ -0,0 +1,237 @@
+import threading
+import time
+from unittest import TestCase
+
+from nose.tools import eq_
+
+from elasticutils import Indexable, MappingType, S, get_es
+from elasticutils.cache import (
+    LocalResultCache, get_result_cache, make_key, set_result_cache)
+from elasticutils.tests import FakeESServer, search_response
+
+
+class ResultCacheTest(TestCase):
+    def setUp(self):
+        super(ResultCacheTest, self).setUp()
+        self.server = FakeESServer(self.respond).start()
+        self.es = get_es(urls=[self.server.url], force_new=True)
+        self.old_cache = get_result_cache()
+        set_result_cache(LocalResultCache())
+
+    def tearDown(self):
+        set_result_cache(self.old_cache)
+        self.es.session.close()
+        self.server.stop()
+        super(ResultCacheTest, self).tearDown()
+
+    def respond(self, method, path, body):
+        if '/_search' not in path:
+            return 200, {'ok': True}
+        hits = [{'_id': '1', '_type': 'doctype123', '_score': 1.0,
+                 '_source': {'id': 1, 'created': '2013-09-13T14:30:00'}}]
+        response = search_response(hits)
+        response['facets'] = {'tag': {'_type': 'terms', 'terms': [
+            {'term': 'red', 'count': 1}]}}
+        return 200, response
+
+    def searches(self):
+        return [path for method, path, body in self.server.requests
+                if '/_search' in path]
+
+    def get_s(self):
+        es = self.es
+
+        class FakeS(S):
+            def get_es(self):
+                return es
+
+        return FakeS().indexes('index123').doctypes('doctype123')
+
+    def get_indexable(self):
+        es = self.es
+
+        class FakeIndexable(MappingType, Indexable):
+            @classmethod
+            def get_index(cls):
+                return 'index123'
+
+            @classmethod
+            def get_mapping_type_name(cls):
+                return 'doctype123'
+
+            @classmethod
+            def get_es(cls):
+                return es
+
+        return FakeIndexable
+
+    def test_off_by_default(self):
+        list(self.get_s())
+        list(self.get_s())
+        eq_(len(self.searches()), 2)
+
+    def test_search(self):
+        s = self.get_s().filter(id=1).cache(60)
+        results = list(s)
+        eq_(results[0]['id'], 1)
+
+        # An identical search uses the cached response.
+        results = list(self.get_s().filter(id=1).cache(60))
+        eq_(len(self.searches()), 1)
+        eq_(results[0]['id'], 1)
+        # The cached response goes through to_python.
+        eq_(results[0]['created'].year, 2013)
+
+        # Different searches don't.
+        list(self.get_s().filter(id=2).cache(60))
+        list(self.get_s().filter(id=1).cache(60)[5:10])
+        list(self.get_s().indexes('other').filter(id=1).cache(60))
+        eq_(len(self.searches()), 4)
+
+    def test_count_and_facets(self):
+        s = self.get_s().facet('tag').cache(60)
+        eq_(s.count(), 1)
+        eq_(s.facet_counts(), {'tag': [{'term': 'red', 'count': 1}]})
+        eq_(len(self.searches()), 2)
+
+        s = self.get_s().facet('tag').cache(60)
+        eq_(s.count(), 1)
+        eq_(s.facet_counts(), {'tag': [{'term': 'red', 'count': 1}]})
+        eq_(len(self.searches()), 2)
+
+    def test_default_and_override(self):
+        es = self.es
+
+        class CachingS(S):
+            default_result_ttl = 60
+
+            def get_es(self):
+                return es
+
+        list(CachingS().indexes('index123'))
+        list(CachingS().indexes('index123'))
+        eq_(len(self.searches()), 1)
+
+        # cache(0) turns it off.
+        list(CachingS().indexes('index123').cache(0))
+        eq_(len(self.searches()), 2)
+
+    def test_ttl(self):
+        list(self.get_s().cache(0.1))
+        time.sleep(0.2)
+        list(self.get_s().cache(0.1))
+        eq_(len(self.searches()), 2)
+
+    def test_invalidated_by_indexing(self):
+        FakeIndexable = self.get_indexable()
+        actions = [
+            lambda: FakeIndexable.index({'id': 1}, id_=1),
+            lambda: FakeIndexable.bulk_index([{'id': 1}]),
+            lambda: FakeIndexable.unindex(1),
+            lambda: FakeIndexable.refresh_index(),
+        ]
+        other = self.get_s().indexes('other').cache(60)
+        list(other)
+        for i, action in enumerate(actions):
+            list(self.get_s().cache(60))
+            action()
+            list(self.get_s().cache(60))
+            eq_(len(self.searches()), i + 3)
+
+        # Searches of other indexes weren't invalidated.
+        list(self.get_s().indexes('other').cache(60))
+        eq_(len(self.searches()), 6)
+
+    def test_all_indexes_invalidated(self):
+        s = self.get_s().indexes('_all').doctypes().cache(60)
+        eq_(s._search_path(), ('', ''))
+        list(s)
+        list(self.get_s().indexes('_all').doctypes().cache(60))
+        eq_(len(self.searches()), 1)
+
+        # Searches of all indexes are invalidated with every index.
+        get_result_cache().invalidate('index123')
+        list(self.get_s().indexes('_all').doctypes().cache(60))
+        eq_(len(self.searches()), 2)
+
+
+class LocalResultCacheTest(TestCase):
+    def test_get_set(self):
+        cache = LocalResultCache()
+        eq_(cache.get('a'), None)
+        cache.set('a', '{}', 60)
+        eq_(cache.get('a'), '{}')
+        eq_(cache.currbytes, 2)
+
+        cache.set('a', '[1]', 60)
+        eq_(cache.currbytes, 3)
+        cache.clear()
+        eq_((cache.get('a'), cache.currbytes), (None, 0))
+
+    def test_expires(self):
+        cache = LocalResultCache()
+        cache.set('a', 'x', -1)
+        eq_(cache.get('a'), None)
+        eq_(cache.currbytes, 0)
+
+    def test_expired_replaced(self):
+        cache = LocalResultCache()
+        cache.set('a', 'old', -1)
+        get = cache._cache.get
+        threads = []
+
+        def set_while_getting(key):
+            # Another thread sets a fresh value while this one is
+            # looking at the expired one.
+            thread = threading.Thread(target=cache.set,
+                                      args=('a', 'new', 60))
+            thread.start()
+            thread.join(0.1)
+            threads.append(thread)
+            return get(key)
+
+        cache._cache.get = set_while_getting
+        eq_(cache.get('a'), None)
+        cache._cache.get = get
+        threads[0].join()
+
+        eq_(cache.get('a'), 'new')
+        eq_(cache.currbytes, 3)
+
+    def test_maxbytes(self):
+        cache = LocalResultCache(maxbytes=10)
+        cache.set('a', 'x' * 4, 60)
+        cache.set('b', 'x' * 4, 60)
+        cache.get('a')
+        cache.set('c', 'x' * 4, 60)
+        # b was the least recently used.
+        eq_(cache.get('b'), None)
+        eq_(cache.get('a'), 'x' * 4)
+        eq_(cache.currbytes, 8)
+
+        # Too big to cache at all.
+        cache.set('d', 'x' * 11, 60)
+        eq_(cache.get('d'), None)
+        eq_(cache.currbytes, 8)
+
+    def test_maxsize(self):
+        cache = LocalResultCache(maxsize=1)
+        cache.set('a', 'xx', 60)
+        cache.set('b', 'xxx', 60)
+        eq_(cache.get('a'), None)
+        eq_(cache.currbytes, 3)
+
+    def test_generations(self):
+        cache = LocalResultCache()
+        eq_(cache.generations_for('a,b'), [0, 0])
+        eq_(cache.generations_for(None), [0])
+        cache.invalidate('a')
+        eq_(cache.generations_for('a,b'), [1, 0])
+        eq_(cache.generations_for(None), [1])
+
+    def test_make_key(self):
+        key = make_key('search', 'a', None, '{}', [0])
+        eq_(key, make_key('search', 'a', None, '{}', [0]))
+        assert key != make_key('count', 'a', None, '{}', [0])
+        assert key != make_key('search', 'a', None, '{}', [1])
+        assert key != make_key('search', 'a', None, '{"a":1}', [0])
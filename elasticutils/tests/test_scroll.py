@@ -0,0 +1,385 @@
+import json
+import threading
+from itertools import count
+from unittest import TestCase
+from urlparse import parse_qs, urlsplit
+
+from nose.tools import assert_raises, eq_
+from pyelasticsearch import ElasticHttpError
+
+from elasticutils import (
+    SLICE_SCRIPT, S, Scroll, ScrollStats, SlicedScroll, get_es)
+from elasticutils.futures import ThreadPoolExecutor
+from elasticutils.tests import FakeESServer, search_response
+
+
+class ScrollResponder(object):
+    """Responds to scroll requests like Elasticsearch
+
+    Every scroll request returns the next batch of documents and a new
+    scroll id. Hits have the ``fields`` the search asks for, if it
+    does. Cleared scrolls are recorded in ``cleared``.
+
+    """
+    def __init__(self, total):
+        self.docs = [{'_id': str(i), '_type': 'doctype123', '_score': 1.0,
+                      '_source': {'id': i}}
+                     for i in range(total)]
+        self.size = None
+        self.fields = None
+        self.cleared = []
+
+    def __call__(self, method, path, body):
+        url = urlsplit(path)
+        params = parse_qs(url.query)
+        if method == 'DELETE':
+            self.cleared.append(url.path.split('/')[-1])
+            return 200, {'ok': True}
+
+        if url.path.endswith('/_search'):
+            qs = json.loads(body)
+            self.size = qs['size']
+            self.fields = qs.get('fields')
+            if params.get('search_type') == ['scan']:
+                # The scan search type's first response has no hits.
+                return 200, self.response(0, 0)
+            return 200, self.response(0, self.size)
+
+        # A scroll id is the offset of the next batch.
+        offset = int(body)
+        return 200, self.response(offset, offset + self.size)
+
+    def hit(self, doc):
+        if not self.fields:
+            return doc
+        hit = dict(doc)
+        source = hit.pop('_source')
+        hit['fields'] = dict((field, source[field]) for field in self.fields
+                             if field in source)
+        return hit
+
+    def response(self, start, end):
+        response = search_response(
+            [self.hit(doc) for doc in self.docs[start:end]])
+        response['hits']['total'] = len(self.docs)
+        response['_scroll_id'] = str(min(end, len(self.docs)))
+        return response
+
+
+class ScrollTest(TestCase):
+    def setUp(self):
+        super(ScrollTest, self).setUp()
+        self.responder = ScrollResponder(25)
+        self.server = FakeESServer(self.responder).start()
+        self.es = get_es(urls=[self.server.url], force_new=True)
+
+    def tearDown(self):
+        self.es.session.close()
+        self.server.stop()
+        super(ScrollTest, self).tearDown()
+
+    def get_s(self):
+        es = self.es
+
+        class FakeS(S):
+            def get_es(self):
+                return es
+
+        return FakeS().indexes('index123').doctypes('doctype123')
+
+    def test_scan(self):
+        scroll = self.get_s().filter(id__gte=0).scan(batch_size=10)
+        assert isinstance(scroll, Scroll)
+        eq_([result['id'] for result in scroll], range(25))
+
+        method, path, body = self.server.requests[0]
+        url = urlsplit(path)
+        eq_(url.path, '/index123/doctype123/_search')
+        eq_(parse_qs(url.query), {'scroll': ['1m'], 'search_type': ['scan']})
+        eq_(json.loads(body), {'filter': {'range': {'id': {'gte': 0}}},
+                               'size': 10})
+        # The first response and 3 batches. After 25 hits it doesn't
+        # ask for more.
+        eq_([request[1].split('?')[0] for request in self.server.requests],
+            ['/index123/doctype123/_search'] + ['/_search/scroll'] * 3 +
+            ['/_search/scroll/25'])
+
+        # It's done, so the last scroll id was cleared.
+        eq_(self.responder.cleared, ['25'])
+        eq_(self.server.requests[-1][0], 'DELETE')
+
+    def test_iterate(self):
+        s = self.get_s().order_by('id')
+        eq_([result['id'] for result in s.iterate(batch_size=10)],
+            range(25))
+
+        method, path, body = self.server.requests[0]
+        eq_(parse_qs(urlsplit(path).query), {'scroll': ['1m']})
+        eq_(json.loads(body)['sort'], ['id'])
+
+    def test_batches(self):
+        batches = list(self.get_s().values_dict('id').scan(batch_size=10)
+                       .batches())
+        eq_([len(batch) for batch in batches], [10, 10, 5])
+        eq_(list(batches[0])[0], {'id': 0})
+        eq_(batches[0].count, 25)
+
+    def test_results_class(self):
+        s = self.get_s().values_list('id')
+        eq_(list(s.scan(batch_size=10))[:2], [(0,), (1,)])
+
+    def test_early_exit(self):
+        for result in self.get_s().scan(batch_size=10):
+            if result['id'] == 12:
+                break
+        # The scroll was cleared when the iterator went away.
+        eq_(self.responder.cleared, ['20'])
+
+    def test_close(self):
+        with self.get_s().iterate(batch_size=10) as scroll:
+            results = iter(scroll)
+            next(results)
+            eq_(self.responder.cleared, [])
+        eq_(self.responder.cleared, ['10'])
+
+        # Closing again doesn't do anything.
+        scroll.close()
+        eq_(self.responder.cleared, ['10'])
+
+    def test_stats(self):
+        scroll = self.get_s().scan(batch_size=10)
+        eq_(scroll.stats(), ScrollStats(0, 0, None, 0.0, 0.0))
+        eq_(scroll.stats().hits_per_second, 0.0)
+
+        list(scroll)
+        stats = scroll.stats()
+        eq_((stats.batches, stats.hits, stats.total), (3, 25, 25))
+        assert 0 < stats.request_time <= stats.elapsed
+        assert stats.hits_per_second > 0
+        # It stopped counting when the scroll finished.
+        eq_(scroll.stats().elapsed, stats.elapsed)
+
+    def test_remembers_total(self):
+        s = self.get_s()
+        list(s.scan())
+        requests = len(self.server.requests)
+        eq_(s.count(), 25)
+        eq_(len(self.server.requests), requests)
+
+    def test_empty(self):
+        self.responder.docs = []
+        eq_(list(self.get_s().scan()), [])
+        eq_(list(self.get_s().iterate()), [])
+
+    def test_fewer_hits_than_total(self):
+        # Documents deleted during the scroll leave it short of the
+        # total, so the first empty batch ends it.
+        response = self.responder.response
+
+        def more_than_there_are(start, end):
+            result = response(start, end)
+            result['hits']['total'] = 30
+            return result
+
+        self.responder.response = more_than_there_are
+        eq_(len(list(self.get_s().scan(batch_size=10))), 25)
+        eq_(len(list(self.get_s().iterate(batch_size=10))), 25)
+
+
+class SlicedResponder(object):
+    """Responds to sliced scans like Elasticsearch with 3 shards
+
+    Documents are on shard ``id % 3``. The ``and``, ``range`` and
+    slice ``script`` filters are applied, the script by looking at its
+    params. Hits have the ``fields`` the search asks for, if it does.
+    Scroll ids are kept in ``scrolls``.
+
+    """
+    shards = 3
+
+    def __init__(self, total):
+        self.docs = [{'_id': str(i), '_type': 'doctype123', '_score': 1.0,
+                      '_source': {'id': i}}
+                     for i in range(total)]
+        self.scrolls = {}
+        self.cleared = []
+        self.fail = False
+        self._ids = count()
+        self._lock = threading.Lock()
+
+    def __call__(self, method, path, body):
+        url = urlsplit(path)
+        params = parse_qs(url.query)
+        if url.path.endswith('/_settings'):
+            return 200, {'index123': {'settings': {
+                'index.number_of_shards': str(self.shards)}}}
+        if method == 'DELETE':
+            with self._lock:
+                self.cleared.append(url.path.split('/')[-1])
+            return 200, {'ok': True}
+
+        if url.path.endswith('/_search'):
+            qs = json.loads(body)
+            docs = self.docs
+            if 'filter' in qs:
+                docs = [doc for doc in docs
+                        if self.matches(doc['_source'], qs['filter'])]
+            fields = qs.get('fields')
+            if fields:
+                docs = [self.with_fields(doc, fields) for doc in docs]
+            if 'preference' in params:
+                shards = params['preference'][0].split(':')[1].split(',')
+                docs = [doc for doc in docs
+                        if str(int(doc['_id']) % self.shards) in shards]
+            return 200, self.response(docs, 0, qs['size'], len(docs))
+
+        if self.fail:
+            return 500, {'error': 'failed', 'status': 500}
+        with self._lock:
+            docs, offset, size = self.scrolls[body]
+        return 200, self.response(docs, offset, size, len(docs))
+
+    def matches(self, source, filter_):
+        (name, value), = filter_.items()
+        if name == 'and':
+            return all(self.matches(source, f) for f in value)
+        if name == 'range':
+            (field, bounds), = value.items()
+            return all(
+                {'gt': source[field] > bound, 'gte': source[field] >= bound,
+                 'lt': source[field] < bound, 'lte': source[field] <= bound
+                 }[op] for op, bound in bounds.items())
+        if name == 'script':
+            p = value['params']
+            return abs(source[p['field']] % p['slices']) == p['slice']
+        raise ValueError('Unexpected filter: %r' % filter_)
+
+    def with_fields(self, doc, fields):
+        hit = dict(doc)
+        source = hit.pop('_source')
+        hit['fields'] = dict((field, source[field]) for field in fields
+                             if field in source)
+        return hit
+
+    def response(self, docs, offset, size, total):
+        response = search_response(docs[offset:offset + size])
+        response['hits']['total'] = total
+        scroll_id = str(next(self._ids))
+        with self._lock:
+            self.scrolls[scroll_id] = (docs, offset + size, size)
+        response['_scroll_id'] = scroll_id
+        return response
+
+
+class SlicedScrollTest(TestCase):
+    def setUp(self):
+        super(SlicedScrollTest, self).setUp()
+        self.responder = SlicedResponder(25)
+        self.server = FakeESServer(self.responder).start()
+        self.es = get_es(urls=[self.server.url], force_new=True,
+                         max_retries=0)
+
+    def tearDown(self):
+        self.es.session.close()
+        self.server.stop()
+        super(SlicedScrollTest, self).tearDown()
+
+    def get_s(self):
+        es = self.es
+
+        class FakeS(S):
+            def get_es(self):
+                return es
+
+        return FakeS().indexes('index123').doctypes('doctype123')
+
+    def test_slice_filter(self):
+        s = self.get_s().filter(id__slice=(1, 4))
+        eq_(s._build_query()['filter'],
+            {'script': {'script': SLICE_SCRIPT,
+                        'params': {'field': 'id', 'slice': 1,
+                                   'slices': 4}}})
+
+    def test_by_field(self):
+        sliced = self.get_s().filter(id__gte=0).sliced_scan(
+            4, 'id', batch_size=3)
+        assert isinstance(sliced, SlicedScroll)
+        eq_(sorted(result['id'] for result in sliced), range(25))
+
+        searches = [json.loads(body) for method, path, body
+                    in self.server.requests if '/_search?' in path]
+        eq_(sorted(qs['filter']['and'][1]['script']['params']['slice']
+                   for qs in searches),
+            [0, 1, 2, 3])
+        eq_(searches[0]['filter']['and'][0],
+            {'range': {'id': {'gte': 0}}})
+
+    def test_by_field_filter_raw(self):
+        sliced = self.get_s().filter_raw(
+            {'range': {'id': {'lt': 20}}}).sliced_scan(4, 'id', batch_size=3)
+        eq_(sorted(result['id'] for result in sliced), range(20))
+
+        searches = [json.loads(body) for method, path, body
+                    in self.server.requests if '/_search?' in path]
+        eq_(sorted(qs['filter']['and'][1]['script']['params']['slice']
+                   for qs in searches),
+            [0, 1, 2, 3])
+
+    def test_empty_slices(self):
+        # Slices 25 to 29 match nothing.
+        sliced = self.get_s().sliced_scan(30, 'id', batch_size=3)
+        eq_(sorted(result['id'] for result in sliced), range(25))
+
+    def test_by_shard(self):
+        scrolls = self.get_s().sliced_scan(2).scrolls()
+        eq_([scroll.preference for scroll in scrolls],
+            ['_shards:0,2', '_shards:1'])
+
+        # There aren't more slices than shards.
+        sliced = self.get_s().sliced_scan(5, batch_size=4)
+        eq_(len(sliced.scrolls()), 3)
+        eq_(sorted(result['id'] for result in sliced), range(25))
+
+    def test_batches(self):
+        sliced = self.get_s().values_list('id').sliced_scan(
+            3, 'id', batch_size=5)
+        batches = list(sliced.batches())
+        eq_(sorted(len(results) for i, results in batches),
+            [3, 3, 4, 5, 5, 5])
+        for i, results in batches:
+            eq_(set(id_ % 3 for (id_,) in results), set([i]))
+
+        stats = sliced.stats()
+        eq_((stats.batches, stats.hits, stats.total), (6, 25, 25))
+        # Every scroll was cleared.
+        eq_(len(self.responder.cleared), 3)
+
+    def test_early_exit(self):
+        for result in self.get_s().sliced_scan(3, 'id', batch_size=2):
+            break
+        # The scrolls that were started are cleared when iteration
+        # stops.
+        started = [path for method, path, body in self.server.requests
+                   if '/_search?' in path]
+        assert started
+        eq_(len(self.responder.cleared), len(started))
+
+    def test_error(self):
+        self.responder.fail = True
+        sliced = self.get_s().sliced_scan(3, 'id', batch_size=2)
+        assert_raises(ElasticHttpError, list, sliced)
+
+    def test_map(self):
+        def export(i, scroll):
+            return i, [result['id'] for result in scroll]
+
+        sliced = self.get_s().sliced_scan(3, 'id', batch_size=5)
+        outputs = sliced.map(export)
+        eq_([i for i, ids in outputs], [0, 1, 2])
+        eq_(outputs[1][1], range(1, 25, 3))
+
+    def test_executor(self):
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            sliced = self.get_s().sliced_scan(3, 'id', batch_size=5,
+                                              executor=executor)
+            eq_(len(list(sliced)), 25)
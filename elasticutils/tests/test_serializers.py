@@ -0,0 +1,182 @@
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from unittest import TestCase
+
+from nose.tools import eq_
+
+from elasticutils import S, MLT, F, Indexable, MappingType
+from elasticutils.serializers import (
+    JSONSerializer, RawJSON, SimpleJSONSerializer, get_serializer,
+    set_serializer)
+
+
+class RecordingES(object):
+    """Stands in for an ElasticSearch and records requests"""
+    def __init__(self):
+        self.requests = []
+
+    def send_request(self, method, path_components, body='',
+                     query_params=None, encode_body=True):
+        self.requests.append(
+            (method, path_components, body, query_params, encode_body))
+        return {'took': 1, 'hits': {'total': 0, 'hits': []}}
+
+
+class UpperSerializer(JSONSerializer):
+    def dumps(self, value):
+        return super(UpperSerializer, self).dumps(value).upper()
+
+
+class JSONSerializerTest(TestCase):
+    serializer_class = JSONSerializer
+
+    def setUp(self):
+        self.serializer = self.serializer_class()
+
+    def test_dumps(self):
+        eq_(json.loads(self.serializer.dumps({'a': [1, 'b', None]})),
+            {'a': [1, 'b', None]})
+
+    def test_dumps_extra_types(self):
+        value = {
+            'datetime': datetime(2013, 10, 1, 12, 30),
+            'date': date(2013, 10, 1),
+            'set': set([1]),
+            'decimal': Decimal('1.10'),
+        }
+        text = self.serializer.dumps(value)
+        eq_(json.loads(text), {
+            'datetime': '2013-10-01T12:30:00',
+            'date': '2013-10-01T00:00:00',
+            'set': [1],
+            'decimal': 1.1,
+        })
+        assert '1.10' in text
+
+    def test_raw_json(self):
+        raw = RawJSON('{"terms":{"id":[1,2,3]}}')
+        text = self.serializer.dumps(
+            {'filter': {'and': [raw, {'term': {'a': 1}}, raw]}})
+        eq_(json.loads(text), {'filter': {'and': [
+            {'terms': {'id': [1, 2, 3]}},
+            {'term': {'a': 1}},
+            {'terms': {'id': [1, 2, 3]}}]}})
+
+        eq_(self.serializer.dumps(raw), raw.value)
+
+    def test_raw_json_unicode(self):
+        raw = RawJSON(u'"\xe9"')
+        eq_(json.loads(self.serializer.dumps([raw])), [u'\xe9'])
+
+    def test_raw_json_from_value(self):
+        raw = RawJSON.from_value([1, 2, 3], serializer=self.serializer)
+        eq_(raw, RawJSON('[1,2,3]'))
+        eq_(json.loads(self.serializer.dumps({'in': raw})),
+            {'in': [1, 2, 3]})
+
+    def test_loads(self):
+        eq_(self.serializer.loads('{"a": [1, "b"]}'), {'a': [1, 'b']})
+
+
+class SimpleJSONSerializerTest(JSONSerializerTest):
+    serializer_class = SimpleJSONSerializer
+
+
+class SerializerSettingTest(TestCase):
+    def tearDown(self):
+        set_serializer(JSONSerializer())
+
+    def test_set_serializer(self):
+        serializer = SimpleJSONSerializer()
+        set_serializer(serializer)
+        assert get_serializer() is serializer
+
+
+class FakeIndexable(MappingType, Indexable):
+    @classmethod
+    def get_index(cls):
+        return 'index123'
+
+    @classmethod
+    def get_mapping_type_name(cls):
+        return 'doctype123'
+
+
+class RequestBodyTest(TestCase):
+    def setUp(self):
+        self.es = RecordingES()
+
+    def tearDown(self):
+        set_serializer(JSONSerializer())
+
+    def get_s(self):
+        es = self.es
+
+        class RecordingS(S):
+            def get_es(self):
+                return es
+
+        return RecordingS().indexes('index123').doctypes('doctype123')
+
+    def test_search(self):
+        ids = RawJSON.from_value(range(5))
+        s = self.get_s().filter(F(id__in=ids) | F(tag='boat'))
+        s.execute()
+
+        method, path, body, params, encode_body = self.es.requests[0]
+        eq_((method, path, encode_body),
+            ('GET', ['index123', 'doctype123', '_search'], False))
+        eq_(json.loads(body), {'filter': {'or': [
+            {'in': {'id': [0, 1, 2, 3, 4]}},
+            {'term': {'tag': 'boat'}}]}})
+
+    def test_search_uses_serializer(self):
+        set_serializer(UpperSerializer())
+        self.get_s().query(tag='boat').execute()
+        assert '"BOAT"' in self.es.requests[0][2]
+
+    def test_mlt(self):
+        s = self.get_s().filter(tag='boat')
+        list(MLT(1, s, ['tag'], es_min_term_freq=1))
+
+        method, path, body, params, encode_body = self.es.requests[0]
+        eq_(path, ['index123', 'doctype123', 1, '_mlt'])
+        eq_(params, {'mlt_fields': 'tag', 'min_term_freq': 1})
+        eq_(json.loads(body), {'filter': {'term': {'tag': 'boat'}}})
+
+    def test_mlt_params(self):
+        list(MLT(1, self.get_s(), ['tag'], min_doc_freq=1, es_foo=2))
+        eq_(self.es.requests[0][3],
+            {'mlt_fields': 'tag', 'min_doc_freq': 1, 'foo': 2})
+
+        # Params pyelasticsearch doesn't know need the es_ prefix.
+        self.assertRaises(TypeError, list,
+                          MLT(1, self.get_s(), ['tag'], foo=2))
+
+    def test_index(self):
+        FakeIndexable.index({'id': 1, 'name': 'boat'}, id_=1, es=self.es,
+                            overwrite_existing=False)
+        method, path, body, params, encode_body = self.es.requests[0]
+        eq_((method, path, params),
+            ('PUT', ['index123', 'doctype123', 1], {'op_type': 'create'}))
+        eq_(json.loads(body), {'id': 1, 'name': 'boat'})
+
+    def test_bulk_index(self):
+        docs = [{'id': 1, 'name': RawJSON('"boat"')},
+                {'id': None, 'name': 'car', '_parent': 5}]
+        FakeIndexable.bulk_index(docs, es=self.es)
+
+        method, path, body, params, encode_body = self.es.requests[0]
+        eq_((method, path, encode_body), ('POST', ['_bulk'], False))
+        assert body.endswith('\n')
+        eq_([json.loads(line) for line in body.splitlines()], [
+            {'index': {'_index': 'index123', '_type': 'doctype123',
+                       '_id': 1}},
+            {'id': 1, 'name': 'boat'},
+            {'index': {'_index': 'index123', '_type': 'doctype123',
+                       '_parent': 5}},
+            {'id': None, 'name': 'car'}])
+
+        # The documents aren't changed.
+        eq_(docs[1]['_parent'], 5)
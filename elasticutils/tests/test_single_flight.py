@@ -0,0 +1,108 @@
+import json
+import threading
+import time
+from unittest import TestCase
+
+from nose.tools import eq_
+
+from elasticutils import S, get_es, single_flight_info
+from elasticutils.tests import FakeESServer, search_response
+
+
+def slow_responder(method, path, body):
+    """Takes a while; searches with a ``fail`` term filter get an error"""
+    term = json.loads(body).get('filter', {}).get('term', {})
+    if 'fail' in term:
+        time.sleep(0.1)
+        return 500, {'error': 'failed', 'status': 500}
+    time.sleep(0.2)
+    hit = {'_id': '1', '_type': 'doctype123', '_score': 1.0,
+           '_source': {'term': term, 'created': '2013-09-13T14:30:00'}}
+    return 200, search_response([hit])
+
+
+class SingleFlightTest(TestCase):
+    def setUp(self):
+        super(SingleFlightTest, self).setUp()
+        self.server = FakeESServer(slow_responder).start()
+        self.es = get_es(urls=[self.server.url], force_new=True,
+                         max_retries=0)
+
+    def tearDown(self):
+        self.es.session.close()
+        self.server.stop()
+        super(SingleFlightTest, self).tearDown()
+
+    def get_s(self, single_flight=True):
+        es = self.es
+
+        class FakeS(S):
+            default_single_flight = single_flight
+
+            def get_es(self):
+                return es
+
+        return FakeS().indexes('index123').doctypes('doctype123')
+
+    def run_all(self, searches):
+        """Executes searches in threads; returns results or errors"""
+        outcomes = [None] * len(searches)
+
+        def execute(i, s):
+            try:
+                outcomes[i] = s.execute()
+            except Exception as exc:
+                outcomes[i] = exc
+
+        threads = [threading.Thread(target=execute, args=(i, s))
+                   for i, s in enumerate(searches)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return outcomes
+
+    def test_coalesced(self):
+        before = single_flight_info()
+        searches = [self.get_s().filter(id=1) for i in range(5)]
+        outcomes = self.run_all(searches)
+        eq_(len(self.server.requests), 1)
+
+        info = single_flight_info()
+        eq_(info.executed - before.executed, 1)
+        eq_(info.coalesced - before.coalesced, 4)
+        eq_(info.in_flight, 0)
+
+        # Everybody gets their own results.
+        for results in outcomes:
+            eq_(results.count, 1)
+            eq_(results.objects[0]['created'].year, 2013)
+        eq_(len(set(id(results) for results in outcomes)), 5)
+        eq_(len(set(id(results.response) for results in outcomes)), 5)
+        eq_(len(set(id(results.objects[0]) for results in outcomes)), 5)
+
+    def test_results_shape(self):
+        # values_list() without fields sends the same request.
+        s = self.get_s().filter(id=1)
+        outcomes = self.run_all([s, s.values_list()])
+        eq_(len(self.server.requests), 1)
+        eq_(outcomes[0].objects[0]['term'], {'id': 1})
+        assert isinstance(outcomes[1].objects[0], tuple)
+
+    def test_different_searches(self):
+        searches = [self.get_s().filter(id=i) for i in range(3)]
+        self.run_all(searches)
+        eq_(len(self.server.requests), 3)
+
+    def test_off_by_default(self):
+        searches = [self.get_s(single_flight=False).filter(id=1)
+                    for i in range(3)]
+        self.run_all(searches)
+        eq_(len(self.server.requests), 3)
+
+    def test_errors_shared(self):
+        searches = [self.get_s().filter(fail=1) for i in range(3)]
+        outcomes = self.run_all(searches)
+        eq_(len(self.server.requests), 1)
+        for outcome in outcomes:
+            assert isinstance(outcome, Exception)
@@ -0,0 +1,276 @@
+import json
+import threading
+import time
+from unittest import TestCase
+
+from nose.tools import eq_
+from pyelasticsearch.exceptions import (
+    ConnectionError, ElasticHttpNotFoundError, InvalidJsonResponseError,
+    Timeout)
+
+from elasticutils import MLT, S, Indexable, MappingType, get_es
+from elasticutils.tests import FakeESServer, search_response
+from elasticutils.transport import (
+    ConnectionPool, PoolStats, PoolTimeoutError, Transport)
+
+
+class FakeIndexable(MappingType, Indexable):
+    @classmethod
+    def get_index(cls):
+        return 'index123'
+
+    @classmethod
+    def get_mapping_type_name(cls):
+        return 'doctype123'
+
+
+def slow_responder(seconds):
+    def responder(method, path, body):
+        time.sleep(seconds)
+        return 200, search_response()
+    return responder
+
+
+class ServerTestMixin(object):
+    responder = None
+
+    def setUp(self):
+        super(ServerTestMixin, self).setUp()
+        self.server = FakeESServer(self.responder).start()
+        self.es = None
+
+    def tearDown(self):
+        if self.es is not None:
+            self.es.session.close()
+        self.server.stop()
+        super(ServerTestMixin, self).tearDown()
+
+    def get_es(self, **kwargs):
+        self.es = get_es(urls=[self.server.url], force_new=True, **kwargs)
+        return self.es
+
+    def get_s(self, es):
+        class FakeS(S):
+            def get_es(self):
+                return es
+
+        return FakeS().indexes('index123').doctypes('doctype123')
+
+    def stats(self):
+        return self.es.session.stats()[self.server.url]
+
+
+class ConnectionReuseTest(ServerTestMixin, TestCase):
+    def test_get_es_uses_transport(self):
+        es = self.get_es(pool_maxsize=3, pool_block=True, pool_timeout=1)
+        assert isinstance(es.session, Transport)
+        eq_(es.session.maxsize, 3)
+        eq_(es.session.block, True)
+        eq_(es.session.pool_timeout, 1)
+
+    def test_searches_reuse_connection(self):
+        es = self.get_es()
+        s = self.get_s(es)
+        for i in range(5):
+            eq_(list(s.filter(id=i).execute()), [])
+
+        eq_(len(self.server.requests), 5)
+        eq_(self.server.requests[0][:2],
+            ('GET', '/index123/doctype123/_search'))
+        eq_(self.server.connections, 1)
+        eq_(self.stats(), PoolStats(in_use=0, idle=1, waits=0, created=1))
+
+    def test_mlt_and_indexing_reuse_connection(self):
+        es = self.get_es()
+        s = self.get_s(es)
+        MLT(1, s=s, mlt_fields=['title']).raw()
+        FakeIndexable.index({'id': 1}, id_=1, es=es)
+        FakeIndexable.bulk_index([{'id': 1}, {'id': 2}], es=es)
+
+        eq_([request[:2] for request in self.server.requests], [
+            ('GET', '/index123/doctype123/1/_mlt?mlt_fields=title'),
+            ('PUT', '/index123/doctype123/1'),
+            ('POST', '/_bulk'),
+        ])
+        eq_(self.server.connections, 1)
+        eq_(self.stats().created, 1)
+
+    def test_pool_per_host(self):
+        other = FakeESServer().start()
+        try:
+            es = get_es(urls=[self.server.url, other.url], force_new=True)
+            self.es = es
+            s = self.get_s(es)
+            for i in range(6):
+                s.filter(id=i).execute()
+
+            eq_(self.server.connections, 1)
+            eq_(other.connections, 1)
+            stats = es.session.stats()
+            eq_(sorted(stats.keys()), sorted([self.server.url, other.url]))
+            eq_(stats[other.url].created, 1)
+        finally:
+            other.stop()
+
+    def test_connection_close(self):
+        self.server.keep_alive = False
+        s = self.get_s(self.get_es())
+        s.execute()
+        s.filter(id=1).execute()
+
+        eq_(self.server.connections, 2)
+        eq_(self.stats(), PoolStats(in_use=0, idle=0, waits=0, created=2))
+
+    def test_stale_connection_retried(self):
+        # The server closes connections without saying so. The next
+        # request on the pooled connection fails and gets retried on a
+        # new one.
+        self.server.drop_connections = True
+        s = self.get_s(self.get_es(max_retries=0))
+        s.execute()
+        time.sleep(0.05)
+        eq_(list(s.filter(id=1).execute()), [])
+
+        eq_(len(self.server.requests), 2)
+        eq_(self.server.connections, 2)
+        eq_(self.stats().in_use, 0)
+
+    def test_stale_connection_not_retried_for_writes(self):
+        # The server might have got the request before the connection
+        # failed, so indexing isn't sent again.
+        self.server.drop_connections = True
+        es = self.get_es(max_retries=0)
+        FakeIndexable.index({'id': 1}, id_=1, es=es)
+        time.sleep(0.05)
+        self.assertRaises(ConnectionError, FakeIndexable.bulk_index,
+                          [{'id': 1}], es=es)
+
+        eq_(len(self.server.requests), 1)
+        eq_(self.stats().in_use, 0)
+
+    def test_http_error_keeps_connection(self):
+        self.server.responder = lambda method, path, body: (
+            404, {'error': 'IndexMissingException[[index123] missing]',
+                  'status': 404})
+        s = self.get_s(self.get_es())
+        for i in range(2):
+            self.assertRaises(ElasticHttpNotFoundError,
+                              s.filter(id=i).execute)
+
+        eq_(self.server.connections, 1)
+
+    def test_invalid_json(self):
+        self.server.responder = lambda method, path, body: (200, 'nope')
+        s = self.get_s(self.get_es())
+        self.assertRaises(InvalidJsonResponseError, s.execute)
+
+
+class ConnectionErrorTest(ServerTestMixin, TestCase):
+    responder = staticmethod(slow_responder(0.5))
+
+    def test_timeout(self):
+        s = self.get_s(self.get_es(timeout=0.05, max_retries=0))
+        self.assertRaises(Timeout, s.execute)
+        eq_(self.stats().in_use, 0)
+
+    def test_connection_refused(self):
+        transport = Transport()
+        # Nothing listens on the port of a stopped server.
+        other = FakeESServer().start()
+        url = other.url
+        other.stop()
+        self.assertRaises(ConnectionError, transport.get, url + '/_search')
+        eq_(transport.stats()[url].in_use, 0)
+
+
+class ConcurrencyTest(ServerTestMixin, TestCase):
+    responder = staticmethod(slow_responder(0.1))
+
+    def run_searches(self, s, count):
+        errors = []
+
+        def search(i):
+            try:
+                s.filter(id=i).execute()
+            except Exception as exc:
+                errors.append(exc)
+
+        threads = [threading.Thread(target=search, args=(i,))
+                   for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return errors
+
+    def test_no_block(self):
+        # Extra connections are made when all of them are in use, but
+        # only maxsize are kept.
+        s = self.get_s(self.get_es(pool_maxsize=2))
+        eq_(self.run_searches(s, 5), [])
+        eq_(self.stats(), PoolStats(in_use=0, idle=2, waits=0, created=5))
+
+    def test_block(self):
+        s = self.get_s(self.get_es(pool_maxsize=2, pool_block=True))
+        eq_(self.run_searches(s, 5), [])
+
+        eq_(self.server.connections, 2)
+        stats = self.stats()
+        eq_(stats.created, 2)
+        eq_(stats.idle, 2)
+        assert stats.waits >= 3, stats
+
+    def test_pool_timeout(self):
+        s = self.get_s(self.get_es(
+            pool_maxsize=1, pool_block=True, pool_timeout=0.01,
+            max_retries=0))
+        errors = self.run_searches(s, 2)
+
+        eq_(len(errors), 1)
+        assert isinstance(errors[0], PoolTimeoutError), errors
+        # It's a ConnectionError, so pyelasticsearch handles it like
+        # other connection problems.
+        assert isinstance(errors[0], ConnectionError)
+        eq_(self.stats().waits, 1)
+
+
+class ConnectionPoolTest(TestCase):
+    def test_lifo(self):
+        pool = ConnectionPool('http', 'localhost', 9200)
+        first, reused = pool.get()
+        second, reused = pool.get()
+        eq_(reused, False)
+        pool.put(first)
+        pool.put(second)
+
+        conn, reused = pool.get()
+        eq_(reused, True)
+        assert conn is second
+        eq_(pool.stats(), PoolStats(in_use=1, idle=1, waits=0, created=2))
+
+    def test_maxsize(self):
+        pool = ConnectionPool('http', 'localhost', 9200, maxsize=1)
+        conns = [pool.get()[0] for i in range(3)]
+        for conn in conns:
+            pool.put(conn)
+        eq_(pool.stats(), PoolStats(in_use=0, idle=1, waits=0, created=3))
+
+        pool.clear()
+        eq_(pool.stats().idle, 0)
+
+    def test_discard(self):
+        pool = ConnectionPool('http', 'localhost', 9200)
+        conn, reused = pool.get()
+        pool.discard(conn)
+        eq_(pool.stats(), PoolStats(in_use=0, idle=0, waits=0, created=1))
+
+
+class ResponseTest(ServerTestMixin, TestCase):
+    def test_response(self):
+        self.server.responder = lambda method, path, body: (
+            201, {'ok': True, 'body': json.loads(body)})
+        resp = Transport().post(self.server.url + '/a', data=u'{"a": "\xe9"}')
+
+        eq_(resp.status_code, 201)
+        eq_(resp.headers['content-type'], 'application/json')
+        eq_(resp.json(), {'ok': True, 'body': {'a': u'\xe9'}})
@@ -1,8 +1,10 @@
+import threading
+import time
 from unittest import TestCase
 
-from nose.tools import eq_
+from nose.tools import assert_raises, eq_
 
-from elasticutils.utils import chunked
+from elasticutils.utils import LRUCache, SingleFlight, chunked
 
 
 class ChunkedTests(TestCase):
@@ -19,3 +21,131 @@ class ChunkedTests(TestCase):
         # chunking list where len(list) > n
         eq_(list(chunked([1, 2, 3, 4, 5], 2)),
             [(1, 2), (3, 4), (5,)])
+
+
+class LRUCacheTests(TestCase):
+    def test_get_set(self):
+        cache = LRUCache(maxsize=2)
+        eq_(cache.get('a'), None)
+        cache.set('a', 1)
+        eq_(cache.get('a'), 1)
+        eq_(cache.info(), (1, 1, 2, 1))
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        # Touch a so b is the oldest.
+        cache.get('a')
+        cache.set('c', 3)
+        assert 'b' not in cache
+        eq_(cache.get('a'), 1)
+        eq_(cache.get('c'), 3)
+        eq_(len(cache), 2)
+
+    def test_clear(self):
+        cache = LRUCache()
+        cache.set('a', 1)
+        cache.get('a')
+        cache.clear()
+        eq_(cache.info(), (0, 0, 1000, 0))
+
+    def test_delete(self):
+        cache = LRUCache()
+        cache.set('a', 1)
+        cache.delete('a')
+        cache.delete('a')
+        eq_(cache.get('a'), None)
+
+    def test_pop(self):
+        cache = LRUCache()
+        cache.set('a', 1)
+        eq_(cache.pop('a'), 1)
+        eq_(cache.pop('a', 'gone'), 'gone')
+        eq_(len(cache), 0)
+
+    def test_popitem(self):
+        cache = LRUCache()
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        eq_(cache.popitem(), ('b', 2))
+        eq_(cache.popitem(), ('a', 1))
+        assert_raises(KeyError, cache.popitem)
+
+    def test_on_evict(self):
+        evicted = []
+        cache = LRUCache(
+            maxsize=1, on_evict=lambda key, value: evicted.append((key, value)))
+        cache.set('a', 1)
+        cache.set('a', 2)
+        eq_(evicted, [])
+        cache.set('b', 3)
+        eq_(evicted, [('a', 2)])
+        eq_(cache.values(), [3])
+
+
+class SingleFlightTests(TestCase):
+    def run_threads(self, flight, key, fn, share, n):
+        outcomes = []
+
+        def call():
+            try:
+                outcomes.append(flight.do(key, fn, share))
+            except Exception as exc:
+                outcomes.append(exc)
+
+        threads = [threading.Thread(target=call) for i in range(n)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return outcomes
+
+    def test_shares(self):
+        flight = SingleFlight()
+        calls = []
+
+        def fn():
+            calls.append(1)
+            time.sleep(0.1)
+            return 'result'
+
+        outcomes = self.run_threads(flight, 'key', fn, str.upper, 4)
+        eq_(len(calls), 1)
+        eq_(sorted(outcomes),
+            [('RESULT', False)] * 3 + [('result', True)])
+        eq_(flight.info(), (1, 3, 0))
+
+        # It's done, so the next call calls fn again.
+        eq_(flight.do('key', fn, str.upper), ('result', True))
+        eq_(len(calls), 2)
+
+    def test_not_shared(self):
+        flight = SingleFlight()
+        calls = []
+
+        def fn():
+            calls.append(1)
+            time.sleep(0.1)
+            return 'result'
+
+        # share returning None makes the others call fn themselves.
+        outcomes = self.run_threads(flight, 'key', fn, lambda r: None, 3)
+        eq_(len(calls), 3)
+        eq_(outcomes, [('result', True)] * 3)
+
+    def test_error(self):
+        flight = SingleFlight()
+        calls = []
+
+        def fn():
+            calls.append(1)
+            time.sleep(0.1)
+            raise ValueError('nope')
+
+        outcomes = self.run_threads(flight, 'key', fn, str.upper, 3)
+        eq_(len(calls), 1)
+        for outcome in outcomes:
+            assert isinstance(outcome, ValueError)
+        eq_(flight.info().in_flight, 0)
@@ -0,0 +1,592 @@
+"""
+Persistent HTTP connections to Elasticsearch.
+
+:py:func:`elasticutils.get_es` gives each `ElasticSearch` it creates a
+:py:class:`Transport`. pyelasticsearch sends every request through
+it, so searches, more like this and indexing all reuse keep-alive
+connections from a pool per host.
+
+It also gives the `ElasticSearch` a :py:class:`HostSelector` in place
+of pyelasticsearch's pool of servers. The transport tells it how long
+each request to a host took and whether it failed, and it sends
+requests to the fastest healthy hosts and stops sending them to
+failing ones for a while.
+
+"""
+import httplib
+import logging
+import os
+import random
+import socket
+import time
+from collections import deque, namedtuple
+from contextlib import contextmanager
+from threading import Condition, Lock, local
+from urlparse import urlsplit
+
+import simplejson
+from pyelasticsearch.exceptions import ConnectionError, Timeout
+
+
+log = logging.getLogger('elasticutils')
+
+
+#: Default maximum number of connections kept per host.
+DEFAULT_POOL_MAXSIZE = 10
+
+#: Methods that are retried on another connection when a pooled
+#: connection fails after the request was sent.
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD'])
+
+#: Default number of failed requests in a row after which a host is
+#: ejected.
+DEFAULT_CIRCUIT_THRESHOLD = 5
+
+#: Default number of seconds an ejected host gets no requests before
+#: one is let through to see whether it has recovered.
+DEFAULT_CIRCUIT_TIMEOUT = 30
+
+#: Weight of the latest request in the moving averages of latency and
+#: error rate.
+EWMA_ALPHA = 0.3
+
+#: The states of a host's circuit breaker.
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+PoolStats = namedtuple('PoolStats', ['in_use', 'idle', 'waits', 'created'])
+
+HostStats = namedtuple('HostStats', ['state', 'latency', 'error_rate',
+                                     'in_flight', 'requests', 'failures'])
+
+
+def base_url(url):
+    """Returns ``'scheme://host:port'`` for a url
+
+    The port is filled in if the url leaves it out.
+
+    """
+    parts = urlsplit(url)
+    default_port = 443 if parts.scheme == 'https' else 80
+    return '{0}://{1}:{2}'.format(
+        parts.scheme, parts.hostname, parts.port or default_port)
+
+
+class PoolTimeoutError(ConnectionError):
+    """Raise when no connection becomes free within the pool timeout."""
+    pass
+
+
+class Response(object):
+    """An HTTP response with the bits of a requests response we use.
+
+    :property status_code: the HTTP status code
+    :property headers: dict of headers with lowercase names
+    :property content: the body as a str
+
+    """
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', 'replace')
+
+    def json(self):
+        """Returns the decoded JSON body.
+
+        :raises simplejson.JSONDecodeError: if the body isn't JSON,
+            which is what pyelasticsearch expects
+
+        """
+        return simplejson.loads(self.content)
+
+
+class ConnectionPool(object):
+    """A pool of keep-alive connections to one host.
+
+    :arg scheme: ``'http'`` or ``'https'``
+    :arg host: the host name
+    :arg port: the port
+    :arg maxsize: the maximum number of connections to keep open
+    :arg block: if True, at most `maxsize` connections are used at a
+        time and requests wait for a free connection; if False, extra
+        connections are made when all of them are in use and closed
+        after the request
+    :arg pool_timeout: with `block`, the seconds to wait for a free
+        connection before raising :py:class:`PoolTimeoutError`; None
+        waits forever
+
+    This is thread-safe.
+
+    """
+    def __init__(self, scheme, host, port, maxsize=DEFAULT_POOL_MAXSIZE,
+                 block=False, pool_timeout=None):
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.maxsize = maxsize
+        self.block = block
+        self.pool_timeout = pool_timeout
+
+        self._idle = deque()
+        self._in_use = 0
+        self._waits = 0
+        self._created = 0
+        self._cond = Condition(Lock())
+
+    def _new_connection(self, timeout):
+        if self.scheme == 'https':
+            conn_class = httplib.HTTPSConnection
+        else:
+            conn_class = httplib.HTTPConnection
+        return conn_class(self.host, self.port, timeout=timeout)
+
+    def get(self, timeout=None):
+        """Returns a ``(connection, reused)`` tuple.
+
+        :arg timeout: the socket timeout for new connections
+
+        :raises PoolTimeoutError: if `block` is True and no connection
+            became free in time
+
+        """
+        deadline = None
+        with self._cond:
+            while not self._idle:
+                if not self.block or self._in_use < self.maxsize:
+                    self._in_use += 1
+                    self._created += 1
+                    break
+
+                if deadline is None:
+                    self._waits += 1
+                    if self.pool_timeout is not None:
+                        deadline = time.time() + self.pool_timeout
+                if deadline is None:
+                    self._cond.wait()
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise PoolTimeoutError(
+                            'No connection to {0} became free in {1} '
+                            'seconds.'.format(self.host, self.pool_timeout))
+                    self._cond.wait(remaining)
+            else:
+                # Most recently used first: it's the least likely to
+                # have been closed by the server.
+                self._in_use += 1
+                return self._idle.pop(), True
+
+        return self._new_connection(timeout), False
+
+    def put(self, conn):
+        """Returns a connection to the pool after a request."""
+        with self._cond:
+            self._in_use -= 1
+            if len(self._idle) < self.maxsize:
+                self._idle.append(conn)
+                conn = None
+            self._cond.notify()
+        if conn is not None:
+            conn.close()
+
+    def discard(self, conn):
+        """Closes a connection that can't be reused."""
+        conn.close()
+        with self._cond:
+            self._in_use -= 1
+            self._cond.notify()
+
+    def clear(self):
+        """Closes all the idle connections."""
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+        for conn in idle:
+            conn.close()
+
+    def stats(self):
+        """Returns a :py:class:`PoolStats` for this pool."""
+        with self._cond:
+            return PoolStats(self._in_use, len(self._idle), self._waits,
+                             self._created)
+
+
+class _Host(object):
+    __slots__ = ('url', 'state', 'latency', 'error_rate', 'in_flight',
+                 'requests', 'failures', 'consecutive', 'opened_at',
+                 'probe_at')
+
+    def __init__(self, url):
+        self.url = url
+        self.state = CLOSED
+        self.latency = None
+        self.error_rate = 0.0
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive = 0
+        self.opened_at = 0
+        self.probe_at = None
+
+
+class HostSelector(object):
+    """Picks the host for each request by latency and health.
+
+    :arg urls: the urls of the Elasticsearch hosts
+    :arg threshold: the number of failed requests in a row after which
+        a host is ejected
+    :arg timeout: the number of seconds an ejected host gets no
+        requests
+    :arg alpha: the weight of the latest request in the moving
+        averages
+
+    It keeps an exponentially weighted moving average of the latency
+    and of the error rate of each host. For each request it picks two
+    of the healthy hosts at random and sends it to the one with the
+    lower latency times the number of requests in flight to it, so
+    slow and busy hosts get fewer requests without the fastest one
+    getting all of them.
+
+    Each host has a circuit breaker. After `threshold` failures in a
+    row, the circuit opens and the host gets no requests for `timeout`
+    seconds. Then it's half-open and one request at a time goes to it
+    as a probe. If the probe succeeds, the circuit closes again; if it
+    fails, the host is ejected for another `timeout` seconds. If every
+    host is ejected, requests go to the one ejected longest ago rather
+    than fail without trying.
+
+    A failure is a request that times out, can't connect or gets a
+    5xx response.
+
+    It has the ``get``, ``mark_dead`` and ``mark_live`` methods
+    pyelasticsearch uses on its pool of servers, so it can be used as
+    ``ElasticSearch.servers``. The :py:class:`Transport` reports how
+    requests went with ``start`` and ``finish``.
+
+    This is thread-safe.
+
+    """
+    def __init__(self, urls, threshold=DEFAULT_CIRCUIT_THRESHOLD,
+                 timeout=DEFAULT_CIRCUIT_TIMEOUT, alpha=EWMA_ALPHA):
+        if isinstance(urls, basestring):
+            urls = [urls]
+        self.threshold = threshold
+        self.timeout = timeout
+        self.alpha = alpha
+        self._hosts = [_Host(url.rstrip('/')) for url in urls]
+        self._by_base = dict((base_url(host.url), host)
+                             for host in self._hosts)
+        self._reset()
+
+    def _reset(self):
+        self._lock = Lock()
+        self._local = local()
+        self._pid = os.getpid()
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            # We're in a forked child. Another thread in the parent
+            # might have been holding the lock, and the parent's
+            # requests aren't in flight here.
+            self._reset()
+            for host in self._hosts:
+                host.in_flight = 0
+                host.probe_at = None
+
+    def _score(self, host):
+        # Hosts that haven't answered yet score 0 so they get tried.
+        # Errors inflate the score so a host failing now and then but
+        # fast at it doesn't look like the best one.
+        return ((host.latency or 0) * (host.in_flight + 1) /
+                max(1 - host.error_rate, 0.1))
+
+    def get(self):
+        """Returns a ``(url, was_dead)`` tuple for the next request"""
+        picked, avoid = getattr(self._local, 'steer', None) or (None, ())
+        url, was_dead = self._pick(avoid)
+        if picked is not None:
+            picked.append(url)
+        return url, was_dead
+
+    def _pick(self, avoid):
+        self._check_pid()
+        now = time.time()
+        with self._lock:
+            healthy = []
+            for host in self._hosts:
+                if host.state == OPEN and now >= host.opened_at + self.timeout:
+                    host.state = HALF_OPEN
+                if host.state == CLOSED:
+                    healthy.append(host)
+                elif host.state == HALF_OPEN and host.url not in avoid:
+                    # A probe that never finished doesn't hold the
+                    # host forever.
+                    if (host.probe_at is None or
+                            now >= host.probe_at + self.timeout):
+                        host.probe_at = now
+                        return host.url, True
+
+            if not healthy:
+                host = min(self._hosts, key=lambda host: host.opened_at)
+                return host.url, True
+            if avoid:
+                healthy = ([candidate for candidate in healthy
+                            if candidate.url not in avoid] or healthy)
+            if len(healthy) > 2:
+                healthy = random.sample(healthy, 2)
+            return min(healthy, key=self._score).url, False
+
+    @contextmanager
+    def steer(self, picked=None, avoid=()):
+        """Steers the requests this thread makes in the block
+
+        :arg picked: a list to add the url of each host picked to
+        :arg avoid: urls of hosts to pick only if no other host is
+            healthy
+
+        For example, to send a request to another host than an
+        earlier one::
+
+            with es.servers.steer(avoid=[url]):
+                es.send_request(...)
+
+        """
+        old = getattr(self._local, 'steer', None)
+        self._local.steer = (picked, avoid)
+        try:
+            yield
+        finally:
+            self._local.steer = old
+
+    def mark_dead(self, url):
+        """Does nothing: the transport already reported the failure"""
+        pass
+
+    def mark_live(self, url):
+        """Does nothing: the transport already reported the success"""
+        pass
+
+    def start(self, url):
+        """Notes that a request to `url` started
+
+        :arg url: the ``'scheme://host:port'`` of the host
+
+        """
+        self._check_pid()
+        host = self._by_base.get(url)
+        if host is not None:
+            with self._lock:
+                host.in_flight += 1
+
+    def finish(self, url, elapsed, failed):
+        """Notes how a request to `url` went
+
+        :arg url: the ``'scheme://host:port'`` of the host
+        :arg elapsed: the seconds the request took
+        :arg failed: whether the request failed
+
+        """
+        self._check_pid()
+        host = self._by_base.get(url)
+        if host is None:
+            return
+
+        alpha = self.alpha
+        with self._lock:
+            host.in_flight -= 1
+            host.requests += 1
+            if host.latency is None:
+                host.latency = elapsed
+            else:
+                host.latency += alpha * (elapsed - host.latency)
+            host.error_rate += alpha * (float(failed) - host.error_rate)
+
+            if not failed:
+                host.consecutive = 0
+                if host.state != CLOSED:
+                    log.info('%s is back', host.url)
+                    host.state = CLOSED
+                    host.probe_at = None
+                return
+
+            host.failures += 1
+            host.consecutive += 1
+            if (host.state == HALF_OPEN or
+                    host.consecutive >= self.threshold):
+                if host.state != OPEN:
+                    log.info('%s ejected for %s seconds after %d failures',
+                             host.url, self.timeout, host.consecutive)
+                host.state = OPEN
+                host.opened_at = time.time()
+                host.probe_at = None
+
+    def stats(self):
+        """Returns a dict of url to :py:class:`HostStats`"""
+        self._check_pid()
+        with self._lock:
+            return dict(
+                (host.url, HostStats(
+                    host.state, host.latency, host.error_rate,
+                    host.in_flight, host.requests, host.failures))
+                for host in self._hosts)
+
+
+class Transport(object):
+    """Sends HTTP requests over pooled keep-alive connections.
+
+    It has the ``get``, ``post``, ``put``, ``delete`` and ``head``
+    methods pyelasticsearch uses on a requests session, so it can be
+    used as ``ElasticSearch.session``.
+
+    :arg maxsize: the maximum number of connections kept per host
+    :arg block: whether to wait for a free connection rather than
+        make an extra one when all `maxsize` are in use
+    :arg pool_timeout: with `block`, the seconds to wait for a free
+        connection; None waits forever
+    :arg selector: a :py:class:`HostSelector` to report how requests
+        went to
+
+    This is thread-safe. After ``os.fork()``, the child process starts
+    with empty pools rather than sharing its parent's connections.
+
+    """
+    def __init__(self, maxsize=DEFAULT_POOL_MAXSIZE, block=False,
+                 pool_timeout=None, selector=None):
+        self.maxsize = maxsize
+        self.block = block
+        self.pool_timeout = pool_timeout
+        self.selector = selector
+        self._reset()
+
+    def _reset(self):
+        self._pools = {}
+        self._lock = Lock()
+        self._pid = os.getpid()
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            # We're in a forked child. The parent's connections are
+            # still the parent's, so leave them be.
+            self._reset()
+
+    def get_pool(self, scheme, host, port):
+        """Returns the :py:class:`ConnectionPool` for a host."""
+        self._check_pid()
+        key = (scheme, host, port)
+        pool = self._pools.get(key)
+        if pool is None:
+            with self._lock:
+                pool = self._pools.get(key)
+                if pool is None:
+                    pool = ConnectionPool(
+                        scheme, host, port, maxsize=self.maxsize,
+                        block=self.block, pool_timeout=self.pool_timeout)
+                    self._pools[key] = pool
+        return pool
+
+    def request(self, method, url, data=None, timeout=None, headers=None):
+        """Sends a request and returns a :py:class:`Response`.
+
+        :raises Timeout: if the request times out
+        :raises ConnectionError: if the request fails for any other
+            reason
+
+        """
+        parts = urlsplit(url)
+        default_port = 443 if parts.scheme == 'https' else 80
+        pool = self.get_pool(
+            parts.scheme, parts.hostname, parts.port or default_port)
+
+        path = parts.path or '/'
+        if parts.query:
+            path = path + '?' + parts.query
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+
+        selector = self.selector
+        if selector is None:
+            return self._send(pool, method, url, path, data, timeout,
+                              headers)
+
+        base = '{0}://{1}:{2}'.format(pool.scheme, pool.host, pool.port)
+        selector.start(base)
+        start = time.time()
+        failed = True
+        try:
+            resp = self._send(pool, method, url, path, data, timeout,
+                              headers)
+            failed = resp.status_code >= 500
+            return resp
+        finally:
+            selector.finish(base, time.time() - start, failed)
+
+    def _send(self, pool, method, url, path, data, timeout, headers):
+        while True:
+            conn, reused = pool.get(timeout)
+            sent = False
+            try:
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+                conn.request(method, path, data, headers or {})
+                sent = True
+                resp = conn.getresponse()
+                content = resp.read()
+            except socket.timeout as exc:
+                pool.discard(conn)
+                raise Timeout('{0} {1} timed out: {2}'.format(
+                    method, url, exc))
+            except (socket.error, httplib.HTTPException) as exc:
+                pool.discard(conn)
+                if reused and (not sent or method in IDEMPOTENT_METHODS):
+                    # The server probably closed the idle connection.
+                    # Try again with the next one, unless the server
+                    # might have got a request that changes something.
+                    continue
+                raise ConnectionError('{0} {1} failed: {2!r}'.format(
+                    method, url, exc))
+
+            if resp.will_close:
+                pool.discard(conn)
+            else:
+                pool.put(conn)
+            return Response(resp.status, dict(resp.getheaders()), content)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request('PUT', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.request('HEAD', url, **kwargs)
+
+    def stats(self):
+        """Returns a dict of ``'scheme://host:port'`` to :py:class:`PoolStats`.
+        """
+        self._check_pid()
+        with self._lock:
+            pools = self._pools.values()
+        return dict(
+            ('{0}://{1}:{2}'.format(pool.scheme, pool.host, pool.port),
+             pool.stats())
+            for pool in pools)
+
+    def close(self):
+        """Closes all idle connections."""
+        self._check_pid()
+        with self._lock:
+            pools = self._pools.values()
+        for pool in pools:
+            pool.clear()
@@ -1,4 +1,6 @@
+from collections import namedtuple
 from itertools import islice
+from threading import Event, Lock
 
 
 def chunked(iterable, n):
@@ -44,3 +46,283 @@ def format_explanation(explanation, indent='  ', indent_level=0):
         return line + '\n' + details
 
     return line
+
+
+class SlotPickleMixin(object):
+    """Mixin that makes classes with ``__slots__`` picklable
+
+    Without ``__getstate__``, instances of classes that use
+    ``__slots__`` can only be pickled with pickle protocol 2 or
+    later. This collects the slots of the class and its bases along
+    with any ``__dict__`` a subclass might have.
+
+    """
+    __slots__ = ()
+
+    def __getstate__(self):
+        state = dict(getattr(self, '__dict__', {}))
+        for cls in type(self).__mro__:
+            slots = cls.__dict__.get('__slots__', ())
+            if isinstance(slots, basestring):
+                slots = (slots,)
+            for name in slots:
+                if name in ('__dict__', '__weakref__'):
+                    continue
+                if hasattr(self, name):
+                    state[name] = getattr(self, name)
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+
+class LRUCache(object):
+    """Thread-safe mapping that holds at most `maxsize` items
+
+    When the cache is full, setting a new key evicts the least
+    recently used item and calls `on_evict` with its key and value if
+    that's given. Hits and misses are counted and can be retrieved
+    with :py:meth:`info`.
+
+    Example:
+
+    >>> cache = LRUCache(maxsize=2)
+    >>> cache.set('a', 1)
+    >>> cache.get('a')
+    1
+    >>> cache.info()
+    CacheInfo(hits=1, misses=0, maxsize=2, currsize=1)
+
+    """
+    # Indexes into the links of the circular doubly linked list that
+    # keeps track of recency. The root link is a sentinel.
+    PREV, NEXT, KEY, VALUE = 0, 1, 2, 3
+
+    def __init__(self, maxsize=1000, on_evict=None):
+        self.maxsize = maxsize
+        self.on_evict = on_evict
+        self._lock = Lock()
+        self.clear()
+
+    def clear(self):
+        """Removes all items and resets the counters"""
+        with self._lock:
+            self._data = {}
+            self._root = root = []
+            root[:] = [root, root, None, None]
+            self.hits = self.misses = 0
+
+    def get(self, key, default=None):
+        """Returns the value for `key` or `default` if it's not cached
+
+        Marks `key` as the most recently used item.
+
+        """
+        PREV, NEXT = self.PREV, self.NEXT
+        with self._lock:
+            link = self._data.get(key)
+            if link is None:
+                self.misses += 1
+                return default
+
+            # Move the link to the front of the list.
+            link_prev, link_next = link[PREV], link[NEXT]
+            link_prev[NEXT] = link_next
+            link_next[PREV] = link_prev
+            root = self._root
+            last = root[PREV]
+            last[NEXT] = root[PREV] = link
+            link[PREV], link[NEXT] = last, root
+
+            self.hits += 1
+            return link[self.VALUE]
+
+    def set(self, key, value):
+        """Caches `value` for `key` evicting the oldest item if full"""
+        PREV, NEXT = self.PREV, self.NEXT
+        oldest = None
+        with self._lock:
+            if self.maxsize <= 0:
+                return
+
+            link = self._data.pop(key, None)
+            if link is not None:
+                link[PREV][NEXT] = link[NEXT]
+                link[NEXT][PREV] = link[PREV]
+
+            elif len(self._data) >= self.maxsize:
+                # Evict the least recently used item.
+                root = self._root
+                oldest = root[NEXT]
+                root[NEXT] = oldest[NEXT]
+                oldest[NEXT][PREV] = root
+                del self._data[oldest[self.KEY]]
+
+            root = self._root
+            last = root[PREV]
+            link = [last, root, key, value]
+            last[NEXT] = root[PREV] = self._data[key] = link
+
+        # Call this outside the lock in case it uses the cache.
+        if oldest is not None and self.on_evict is not None:
+            self.on_evict(oldest[self.KEY], oldest[self.VALUE])
+
+    def delete(self, key):
+        """Removes `key` from the cache if it's there"""
+        self.pop(key)
+
+    def pop(self, key, default=None):
+        """Removes `key` and returns its value or `default`"""
+        PREV, NEXT = self.PREV, self.NEXT
+        with self._lock:
+            link = self._data.pop(key, None)
+            if link is None:
+                return default
+            link[PREV][NEXT] = link[NEXT]
+            link[NEXT][PREV] = link[PREV]
+            return link[self.VALUE]
+
+    def popitem(self):
+        """Removes and returns the least recently used ``(key, value)``
+
+        :raises KeyError: if the cache is empty
+
+        """
+        PREV, NEXT = self.PREV, self.NEXT
+        with self._lock:
+            root = self._root
+            oldest = root[NEXT]
+            if oldest is root:
+                raise KeyError('popitem(): cache is empty')
+            root[NEXT] = oldest[NEXT]
+            oldest[NEXT][PREV] = root
+            del self._data[oldest[self.KEY]]
+            return oldest[self.KEY], oldest[self.VALUE]
+
+    def values(self):
+        """Returns a list of the cached values"""
+        with self._lock:
+            return [link[self.VALUE] for link in self._data.values()]
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def info(self):
+        """Returns a `CacheInfo` with hits, misses, maxsize and currsize"""
+        return CacheInfo(self.hits, self.misses, self.maxsize,
+                         len(self._data))
+
+
+SingleFlightInfo = namedtuple('SingleFlightInfo',
+                              ['executed', 'coalesced', 'in_flight'])
+
+
+class _Flight(object):
+    __slots__ = ('done', 'waiters', 'shared', 'error')
+
+    def __init__(self):
+        self.done = Event()
+        self.waiters = 0
+        self.shared = self.error = None
+
+
+class SingleFlight(object):
+    """Runs one call at a time for each key and shares its result
+
+    Concurrent calls to :py:meth:`do` with the same key wait for the
+    first one rather than calling the function again. This is
+    thread-safe.
+
+    Example:
+
+    >>> flight = SingleFlight()
+    >>> flight.do('key', lambda: 'value', lambda value: value)
+    ('value', True)
+    >>> flight.info()
+    SingleFlightInfo(executed=1, coalesced=0, in_flight=0)
+
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self._flights = {}
+        self.executed = self.coalesced = 0
+
+    def do(self, key, fn, share):
+        """Calls `fn` unless a call for `key` is in flight
+
+        :arg key: hashable key for the call
+        :arg fn: function that takes no arguments
+        :arg share: function that takes what `fn` returned and returns
+            what to hand to the callers that waited for it or None if
+            they should call `fn` themselves. It's called once, and
+            only if there are callers waiting.
+
+        :returns: ``(result, True)`` with what `fn` returned if this
+            called it, or ``(shared, False)`` with what `share`
+            returned if this waited for another call
+
+        :raises: whatever `fn` raised, in the caller that called it
+            and in the callers that waited for it
+
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+                leader = True
+            else:
+                flight.waiters += 1
+                leader = False
+
+        if not leader:
+            # Event.wait without a timeout can't be interrupted with
+            # Ctrl-C in Python 2, so wait in slices. It returns None
+            # in Python 2.6, so check is_set.
+            while not flight.done.is_set():
+                flight.done.wait(60)
+            if flight.error is not None:
+                raise flight.error
+            if flight.shared is not None:
+                with self._lock:
+                    self.coalesced += 1
+                return flight.shared, False
+            with self._lock:
+                self.executed += 1
+            return fn(), True
+
+        try:
+            result = fn()
+        except BaseException as exc:
+            flight.error = exc
+            self._land(key, flight)
+            flight.done.set()
+            raise
+        try:
+            if self._land(key, flight):
+                flight.shared = share(result)
+        finally:
+            flight.done.set()
+        return result, True
+
+    def _land(self, key, flight):
+        """Ends flight and returns how many callers are waiting for it"""
+        with self._lock:
+            # Nobody can join once it's removed, so waiters is final.
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            self.executed += 1
+            return flight.waiters
+
+    def info(self):
+        """Returns a `SingleFlightInfo` with executed, coalesced and
+        in_flight counts"""
+        with self._lock:
+            return SingleFlightInfo(self.executed, self.coalesced,
+                                    len(self._flights))